@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+import os
+import statistics
+import subprocess
+import sys
+
+# Modules imported by a headless filter worker, and OpenCV itself for reference
+MODULES = [
+    'numpy',
+    'core.particle_filters',
+    'core.kernels',
+    'core.recording',
+    'simulator',
+    'simulator.dataset',
+    'simulator.visualizer',
+    'cv2',
+]
+
+# Each import is timed in a new interpreter, the modules of the previous imports would be cached otherwise.
+IMPORT_SCRIPT = """
+import sys
+import time
+start = time.perf_counter()
+import {}
+print(time.perf_counter() - start, 'cv2' in sys.modules)
+"""
+
+
+def measure_import_time(module, repeats=5):
+    """
+    Returns the median time (in seconds) to import a module in a new interpreter, and whether the import loaded
+    OpenCV.
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    times = []
+    loads_cv2 = False
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, '-c', IMPORT_SCRIPT.format(module)], cwd=root, check=True,
+                                capture_output=True, text=True).stdout.split()
+        times.append(float(output[0]))
+        loads_cv2 = output[1] == 'True'
+
+    return statistics.median(times), loads_cv2
+
+
+if __name__ == '__main__':
+    print("{:<24} {:>10}  {}".format("module", "time (ms)", "imports cv2"))
+    for module in MODULES:
+        import_time, loads_cv2 = measure_import_time(module)
+        print("{:<24} {:>10.1f}  {}".format(module, 1000 * import_time, loads_cv2))
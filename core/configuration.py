@@ -0,0 +1,512 @@
+import copy
+import inspect
+import json
+import os
+
+import numpy as np
+
+from core.kernels import ExecutionBackends
+from core.measurement.measurement_models import MeasurementModels
+from core.precision import PrecisionModes
+from core.resampling.resampler import ResamplingAlgorithms
+
+# Typed configuration of a particle filter deployment, loaded from a JSON, YAML or TOML file and validated at load
+# time. Every section is an object with one attribute per setting; the enums are given by their name (in any case).
+# Example of JSON file (the missing settings keep their default value, which are those of main.py):
+#
+# {
+#   "world": {"width": 500, "height": 700},
+#   "filter": {"type": "ParticleFilterSIR", "number_of_particles": 40, "resampling_algorithm": "stratified"},
+#   "limits": {"inter_row": [151, 170]},
+#   "measurement": {"model": "window_counting", "probability_in": 0.9, "probability_out": 0.01},
+#   "performance": {"precision": "double", "backend": "vectorized"}
+# }
+
+# Names of the state parameters, in the order of the states
+STATE_PARAMETERS = ('offset', 'position', 'inter_plant', 'inter_row', 'skew', 'convergence')
+
+# Default process noise: fraction of the range of the limits of each parameter, no noise on the offset
+DEFAULT_PROCESS_NOISE_FRACTIONS = (0, 0.25, 0.25, 0.25, 0.25, 0.5)
+
+FILTER_TYPES = ('ParticleFilterSIR', 'ParticleFilterFactorized', 'ParticleFilterAuxiliary',
+                'ParticleFilterRegularized')
+
+
+class ConfigurationError(ValueError):
+    """
+    Invalid configuration, with the list of every problem found.
+    """
+
+    def __init__(self, errors):
+        ValueError.__init__(self, "Invalid configuration:\n  " + "\n  ".join(errors))
+        self.errors = errors
+
+
+def _check_number(errors, name, value, minimum=None, maximum=None, integer=False, allow_none=False,
+                  exclusive_minimum=False):
+    if value is None and allow_none:
+        return
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or (integer and not isinstance(value, int)):
+        errors.append("{}: expected {}, got {!r}".format(name, "an integer" if integer else "a number", value))
+        return
+    if not np.isfinite(value):
+        errors.append("{}: expected a finite number, got {!r}".format(name, value))
+    elif minimum is not None and (value <= minimum if exclusive_minimum else value < minimum):
+        errors.append("{}: must be {} {}, got {!r}".format(name, ">" if exclusive_minimum else ">=", minimum, value))
+    elif maximum is not None and value > maximum:
+        errors.append("{}: must be <= {}, got {!r}".format(name, maximum, value))
+
+
+def _check_bool(errors, name, value):
+    if not isinstance(value, bool):
+        errors.append("{}: expected true or false, got {!r}".format(name, value))
+
+
+def _check_choice(errors, name, value, choices):
+    if value not in choices:
+        errors.append("{}: expected one of {}, got {!r}".format(name, ", ".join(choices), value))
+
+
+def _check_enum(errors, name, value, enum):
+    if not isinstance(value, str) or value.upper() not in enum.__members__:
+        errors.append("{}: expected one of {}, got {!r}".format(name, ", ".join(m.lower() for m in enum.__members__),
+                                                               value))
+
+
+def get_enum(enum, name):
+    """
+    Returns the member of an enum from its name, in any case.
+    """
+    return enum[name.upper()]
+
+
+class ConfigurationSection:
+    """
+    Base of the configuration sections: the settings are the arguments of __init__, with their default value.
+    """
+
+    def get_parameters(self):
+        return copy.deepcopy(vars(self))
+
+    @classmethod
+    def from_parameters(cls, parameters, name, errors):
+        """
+        Creates a section from a dictionary, appending to errors the settings that don't exist.
+        """
+        if not isinstance(parameters, dict):
+            errors.append("{}: expected a table of settings, got {!r}".format(name, parameters))
+            return cls()
+
+        settings = set(inspect.signature(cls.__init__).parameters) - {'self'}
+        unknown = sorted(set(parameters) - settings)
+        for setting in unknown:
+            errors.append("{}.{}: unknown setting".format(name, setting))
+
+        return cls(**{key: value for key, value in parameters.items() if key in settings})
+
+    def validate(self, name, errors):
+        """
+        Appends to errors the problems of the settings of the section.
+        """
+        pass
+
+
+class WorldConfiguration(ConfigurationSection):
+    def __init__(self, width=500, height=700, move_distance=10):
+        self.width = width
+        self.height = height
+        self.move_distance = move_distance
+
+    def validate(self, name, errors):
+        _check_number(errors, name + ".width", self.width, 1, integer=True)
+        _check_number(errors, name + ".height", self.height, 1, integer=True)
+        _check_number(errors, name + ".move_distance", self.move_distance)
+
+
+class FilterConfiguration(ConfigurationSection):
+    def __init__(self, type='ParticleFilterSIR', number_of_particles=40, resampling_algorithm='stratified',
+                 initialization='uniform', nb_hypotheses=3):
+        """
+        :param type: Class of the particle filter.
+        :param number_of_particles: Number of particles.
+        :param resampling_algorithm: Name of one of ResamplingAlgorithms.
+        :param initialization: 'uniform' or 'measurement' (see initialize_particles_from_measurement).
+        :param nb_hypotheses: Number of row structure hypotheses of the initialization from the measurement.
+        """
+        self.type = type
+        self.number_of_particles = number_of_particles
+        self.resampling_algorithm = resampling_algorithm
+        self.initialization = initialization
+        self.nb_hypotheses = nb_hypotheses
+
+    def validate(self, name, errors):
+        _check_choice(errors, name + ".type", self.type, FILTER_TYPES)
+        _check_number(errors, name + ".number_of_particles", self.number_of_particles, 1, integer=True)
+        _check_enum(errors, name + ".resampling_algorithm", self.resampling_algorithm, ResamplingAlgorithms)
+        _check_choice(errors, name + ".initialization", self.initialization, ('uniform', 'measurement'))
+        _check_number(errors, name + ".nb_hypotheses", self.nb_hypotheses, 1, integer=True)
+
+
+class LimitsConfiguration(ConfigurationSection):
+    def __init__(self, offset=None, position=None, inter_plant=None, inter_row=None, skew=None, convergence=None):
+        """
+        [min, max] of each state parameter, None for the default limits of main.py (see get_default_limits).
+        """
+        self.offset = offset
+        self.position = position
+        self.inter_plant = inter_plant
+        self.inter_row = inter_row
+        self.skew = skew
+        self.convergence = convergence
+
+    def validate(self, name, errors):
+        for parameter in STATE_PARAMETERS:
+            value = getattr(self, parameter)
+            if value is None:
+                continue
+            if not isinstance(value, (list, tuple)) or len(value) != 2:
+                errors.append("{}.{}: expected [min, max], got {!r}".format(name, parameter, value))
+                continue
+
+            n_errors = len(errors)
+            _check_number(errors, "{}.{}[0]".format(name, parameter), value[0])
+            _check_number(errors, "{}.{}[1]".format(name, parameter), value[1])
+            if len(errors) == n_errors and value[0] > value[1]:
+                errors.append("{}.{}: min {} is greater than max {}".format(name, parameter, value[0], value[1]))
+
+        if isinstance(self.inter_row, (list, tuple)) and len(self.inter_row) == 2 \
+                and isinstance(self.inter_row[0], (int, float)) and self.inter_row[0] <= 0:
+            errors.append("{}.inter_row: must be positive, the bottom plants of a particle are an inter-row "
+                          "distance apart".format(name))
+
+        # Convergence close to 1 means parallel rows, see simulator.geometry.get_vanishing_points
+        if isinstance(self.convergence, (list, tuple)) and len(self.convergence) == 2 \
+                and all(isinstance(value, (int, float)) for value in self.convergence) \
+                and (self.convergence[0] < 0 or self.convergence[1] >= 1):
+            errors.append("{}.convergence: must be within [0, 1), got {!r}".format(name, self.convergence))
+
+
+class ProcessNoiseConfiguration(ConfigurationSection):
+    def __init__(self, offset=None, position=None, inter_plant=None, inter_row=None, skew=None, convergence=None):
+        """
+        Standard deviation of the process noise of each state parameter, None for a fraction of the range of its
+        limits (see DEFAULT_PROCESS_NOISE_FRACTIONS).
+        """
+        self.offset = offset
+        self.position = position
+        self.inter_plant = inter_plant
+        self.inter_row = inter_row
+        self.skew = skew
+        self.convergence = convergence
+
+    def validate(self, name, errors):
+        for parameter in STATE_PARAMETERS:
+            _check_number(errors, "{}.{}".format(name, parameter), getattr(self, parameter), 0, allow_none=True)
+
+
+class MeasurementConfiguration(ConfigurationSection):
+    def __init__(self, model='window_counting', probability_in=0.90, probability_out=0.01, plant_size=2, area_size=4,
+                 distance_sigma=10, max_distance=50, row_line_gain=20, region_of_interest=False, roi_margin=30):
+        """
+        :param model: Name of one of MeasurementModels.
+        :param probability_in: Probability of a plant pixel inside the window of an expected plant.
+        :param probability_out: Probability of a plant pixel outside of it.
+        :param plant_size: Size of the window of an expected plant.
+        :param area_size: Size of the area around it, larger than plant_size.
+        :param distance_sigma: Distance transform model, see set_measurement_model.
+        :param max_distance: Distance transform model, see set_measurement_model.
+        :param row_line_gain: Row line model, see set_measurement_model.
+        :param region_of_interest: Whether to crop the measurement, see set_region_of_interest.
+        :param roi_margin: Margin of the region of interest.
+        """
+        self.model = model
+        self.probability_in = probability_in
+        self.probability_out = probability_out
+        self.plant_size = plant_size
+        self.area_size = area_size
+        self.distance_sigma = distance_sigma
+        self.max_distance = max_distance
+        self.row_line_gain = row_line_gain
+        self.region_of_interest = region_of_interest
+        self.roi_margin = roi_margin
+
+    def validate(self, name, errors):
+        _check_enum(errors, name + ".model", self.model, MeasurementModels)
+        _check_number(errors, name + ".probability_in", self.probability_in, 0, 1, exclusive_minimum=True)
+        _check_number(errors, name + ".probability_out", self.probability_out, 0, 1, exclusive_minimum=True)
+        _check_number(errors, name + ".plant_size", self.plant_size, 1, integer=True)
+        _check_number(errors, name + ".area_size", self.area_size, 1, integer=True)
+        if isinstance(self.plant_size, int) and isinstance(self.area_size, int) and self.area_size <= self.plant_size:
+            errors.append("{}.area_size: must be greater than plant_size ({}), got {}".format(name, self.plant_size,
+                                                                                             self.area_size))
+        _check_number(errors, name + ".distance_sigma", self.distance_sigma, 0, exclusive_minimum=True)
+        _check_number(errors, name + ".max_distance", self.max_distance, 0, exclusive_minimum=True)
+        _check_number(errors, name + ".row_line_gain", self.row_line_gain)
+        _check_bool(errors, name + ".region_of_interest", self.region_of_interest)
+        _check_number(errors, name + ".roi_margin", self.roi_margin, 0, integer=True)
+
+
+class EnumerationConfiguration(ConfigurationSection):
+    def __init__(self, max_rows=64, row_budget=None, min_scale=0):
+        """
+        Culling of the expected plants, see set_plant_enumeration.
+        """
+        self.max_rows = max_rows
+        self.row_budget = row_budget
+        self.min_scale = min_scale
+
+    def validate(self, name, errors):
+        _check_number(errors, name + ".max_rows", self.max_rows, 1, integer=True, allow_none=True)
+        _check_number(errors, name + ".row_budget", self.row_budget, 1, integer=True, allow_none=True)
+        _check_number(errors, name + ".min_scale", self.min_scale, 0)
+
+
+class PerformanceConfiguration(ConfigurationSection):
+    def __init__(self, precision='double', backend='serial'):
+        """
+        :param precision: Name of one of PrecisionModes.
+        :param backend: Name of one of ExecutionBackends (serial, vectorized or parallel).
+        """
+        self.precision = precision
+        self.backend = backend
+
+    def validate(self, name, errors):
+        _check_enum(errors, name + ".precision", self.precision, PrecisionModes)
+        _check_enum(errors, name + ".backend", self.backend, ExecutionBackends)
+
+
+class InstrumentationConfiguration(ConfigurationSection):
+    def __init__(self, recording_path=None, print_max_weight=True, print_latency=False, memory_profile=False,
+                 memory_snapshot_interval=100, memory_budget=None):
+        """
+        :param recording_path: Binary recording of the particle clouds (see ParticleRecorder), None to disable.
+        :param print_max_weight: Whether to print the maximal weight at each time step.
+        :param print_latency: Whether to print the duration of each update.
+        :param memory_profile: Whether to track the allocations of the updates (see core.diagnostics).
+        :param memory_snapshot_interval: Number of frames between two allocation reports.
+        :param memory_budget: Bytes per frame the steady-state updates may allocate, checked at the end of the run,
+        None for no check.
+        """
+        self.recording_path = recording_path
+        self.print_max_weight = print_max_weight
+        self.print_latency = print_latency
+        self.memory_profile = memory_profile
+        self.memory_snapshot_interval = memory_snapshot_interval
+        self.memory_budget = memory_budget
+
+    def validate(self, name, errors):
+        if self.recording_path is not None and not isinstance(self.recording_path, str):
+            errors.append("{}.recording_path: expected a path, got {!r}".format(name, self.recording_path))
+        _check_bool(errors, name + ".print_max_weight", self.print_max_weight)
+        _check_bool(errors, name + ".print_latency", self.print_latency)
+        _check_bool(errors, name + ".memory_profile", self.memory_profile)
+        _check_number(errors, name + ".memory_snapshot_interval", self.memory_snapshot_interval, 1, integer=True)
+        _check_number(errors, name + ".memory_budget", self.memory_budget, 0, allow_none=True)
+
+
+class Configuration:
+    """
+    Complete configuration of a particle filter deployment. The sections are attributes named as in SECTIONS.
+    """
+
+    SECTIONS = {
+        'world': WorldConfiguration,
+        'filter': FilterConfiguration,
+        'limits': LimitsConfiguration,
+        'process_noise': ProcessNoiseConfiguration,
+        'measurement': MeasurementConfiguration,
+        'enumeration': EnumerationConfiguration,
+        'performance': PerformanceConfiguration,
+        'instrumentation': InstrumentationConfiguration,
+    }
+
+    def __init__(self, **sections):
+        for name, section_class in self.SECTIONS.items():
+            setattr(self, name, sections.get(name, section_class()))
+
+    def get_parameters(self):
+        return {name: getattr(self, name).get_parameters() for name in self.SECTIONS}
+
+    @staticmethod
+    def from_parameters(parameters, validate=True):
+        """
+        Creates a configuration from a dictionary of sections, the missing sections and settings keep their default
+        value.
+
+        :param validate: Whether to raise a ConfigurationError listing every invalid setting.
+        """
+        errors = []
+        if not isinstance(parameters, dict):
+            raise ConfigurationError(["expected a table of sections, got {!r}".format(parameters)])
+
+        for name in sorted(set(parameters) - set(Configuration.SECTIONS)):
+            errors.append("{}: unknown section".format(name))
+
+        sections = {name: section_class.from_parameters(parameters[name], name, errors)
+                    for name, section_class in Configuration.SECTIONS.items() if name in parameters}
+        configuration = Configuration(**sections)
+
+        if validate:
+            configuration.validate(errors)
+        elif len(errors) > 0:
+            raise ConfigurationError(errors)
+
+        return configuration
+
+    def validate(self, errors=None):
+        """
+        Checks every setting and raises a ConfigurationError listing the invalid ones.
+        """
+        errors = [] if errors is None else errors
+        for name in self.SECTIONS:
+            getattr(self, name).validate(name, errors)
+
+        if len(errors) == 0:
+            limits = self.get_limits()
+            if limits[3] <= 0 or limits[2] > self.world.height:
+                errors.append("limits.position: {} is outside of the image (height {})".format(
+                    [limits[2], limits[3]], self.world.height))
+
+        if len(errors) > 0:
+            raise ConfigurationError(errors)
+
+    def with_overrides(self, overrides):
+        """
+        Returns a validated copy of the configuration where the settings given by their dotted name (for instance
+        'filter.number_of_particles') are replaced.
+        """
+        parameters = self.get_parameters()
+        for key, value in overrides.items():
+            section, _, setting = key.partition('.')
+            if section not in parameters or setting == '':
+                raise ConfigurationError(["{}: expected section.setting".format(key)])
+            parameters[section][setting] = value
+
+        return Configuration.from_parameters(parameters)
+
+    def get_limits(self):
+        """
+        Returns the 12 limits of the state, as given to the particle filters.
+        """
+        defaults = get_default_limits(self.world.width, self.world.height)
+        limits = []
+        for i, parameter in enumerate(STATE_PARAMETERS):
+            value = getattr(self.limits, parameter)
+            limits.extend(defaults[2 * i:2 * i + 2] if value is None else [value[0], value[1]])
+
+        return limits
+
+    def get_process_noise(self):
+        """
+        Returns the 6 standard deviations of the process noise, as given to the particle filters.
+        """
+        limits = self.get_limits()
+        process_noise = []
+        for i, parameter in enumerate(STATE_PARAMETERS):
+            value = getattr(self.process_noise, parameter)
+            process_noise.append(DEFAULT_PROCESS_NOISE_FRACTIONS[i] * (limits[2 * i + 1] - limits[2 * i])
+                                 if value is None else value)
+
+        return process_noise
+
+    def get_measurement_uncertainty(self):
+        return [self.measurement.probability_in, self.measurement.probability_out]
+
+
+def get_default_limits(width, height):
+    """
+    Limits of the state of main.py for an image size.
+    """
+    return [width - 110, width + 110,  # Offset
+            height - 80, height,  # Position
+            90, 130,  # Inter-plant
+            151, 170,  # Inter-row
+            -np.pi / 12, np.pi / 12,  # Skew
+            0.1, 0.4]  # Convergence
+
+
+def read_configuration_file(path):
+    """
+    Reads the dictionary of a configuration file, JSON, YAML (requires PyYAML) or TOML (requires Python 3.11 or
+    tomli) depending on its extension.
+    """
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise ConfigurationError(["{}: PyYAML is required to read YAML configurations".format(path)])
+        with open(path) as f:
+            return yaml.safe_load(f) or {}
+
+    if extension == '.toml':
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise ConfigurationError(["{}: Python 3.11 or tomli is required to read TOML configurations".format(
+                    path)])
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_configuration(path):
+    """
+    Loads and validates a configuration file, raises a ConfigurationError listing every invalid setting.
+    """
+    return Configuration.from_parameters(read_configuration_file(path))
+
+
+def create_world(configuration):
+    # Imported here, the simulator package is only needed to build a filter
+    from simulator.world import World
+
+    return World(configuration.world.width, configuration.world.height, configuration.world.move_distance)
+
+
+def create_particle_filter(configuration, world=None):
+    """
+    Builds the particle filter of a configuration, with every setting applied. The particles are not initialized.
+
+    :param world: World of the filter, built from the world section by default.
+    """
+    import core.particle_filters
+
+    if world is None:
+        world = create_world(configuration)
+
+    filter_class = getattr(core.particle_filters, configuration.filter.type)
+    particle_filter = filter_class(world, configuration.filter.number_of_particles, configuration.get_limits(),
+                                   configuration.get_process_noise(), configuration.get_measurement_uncertainty(),
+                                   get_enum(ResamplingAlgorithms, configuration.filter.resampling_algorithm))
+
+    measurement = configuration.measurement
+    particle_filter.set_measurement_model(get_enum(MeasurementModels, measurement.model), measurement.distance_sigma,
+                                          measurement.max_distance, measurement.row_line_gain)
+    particle_filter.set_region_of_interest(measurement.region_of_interest, measurement.roi_margin)
+
+    enumeration = configuration.enumeration
+    particle_filter.set_plant_enumeration(roi=None, min_scale=enumeration.min_scale,
+                                          row_budget=enumeration.row_budget, max_rows=enumeration.max_rows)
+
+    particle_filter.set_precision(get_enum(PrecisionModes, configuration.performance.precision))
+    particle_filter.set_execution_backend(get_enum(ExecutionBackends, configuration.performance.backend))
+
+    return particle_filter
+
+
+def initialize_particles(particle_filter, configuration, first_measurement=None):
+    """
+    Initializes the particles as the filter section says, uniformly when there is no first measurement.
+    """
+    if configuration.filter.initialization == 'measurement' and first_measurement is not None:
+        particle_filter.initialize_particles_from_measurement(first_measurement,
+                                                              nb_hypotheses=configuration.filter.nb_hypotheses)
+    else:
+        particle_filter.initialize_particles_uniform()
@@ -0,0 +1,179 @@
+import os
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Modules whose allocations are reported separately, the others are grouped by file
+DEFAULT_MODULES = ('particle_filter_base', 'particle_filter_sir', 'resampler', 'resampling_helpers', 'particle',
+                   'lattice', 'geometry', 'kernels', 'measurement_models', 'visualizer')
+
+
+def get_peak_rss():
+    """
+    Returns the peak resident set size of the process in bytes, None where the resource module is not available.
+    """
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if os.uname().sysname == 'Darwin' else 1024 * peak
+
+
+def get_module_name(filename):
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+class FrameMemory:
+    """
+    Memory of one frame: net growth of the traced memory, and highest traced memory during the frame above the
+    memory at its start, which counts the temporaries of the frame.
+    """
+
+    def __init__(self, frame, net_bytes, transient_bytes):
+        self.frame = frame
+        self.net_bytes = net_bytes
+        self.transient_bytes = transient_bytes
+
+
+class MemoryProfiler:
+    """
+    Allocation tracking for long runs, with tracemalloc. Each frame is wrapped in start_frame / end_frame; every
+    snapshot_interval frames, a snapshot is compared to the previous one and the allocation sites that grew the most
+    are reported by module.
+
+    Tracing slows down the allocations a lot, the profiler is a diagnostics mode, not meant for production runs.
+    """
+
+    def __init__(self, snapshot_interval=100, top=10, modules=DEFAULT_MODULES, trace_depth=1):
+        """
+        :param snapshot_interval: Number of frames between two snapshots.
+        :param top: Number of allocation sites of each report.
+        :param modules: Names of the modules whose allocations are reported even when they are not in the top.
+        :param trace_depth: Number of frames of the tracebacks stored by tracemalloc.
+        """
+        self.snapshot_interval = snapshot_interval
+        self.top = top
+        self.modules = modules
+        self.trace_depth = trace_depth
+
+        self.frames = []
+        self.reports = []
+        self.previous_snapshot = None
+        self.frame_start_memory = 0
+        self.started_tracing = False
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.trace_depth)
+            self.started_tracing = True
+        self.previous_snapshot = self.take_snapshot()
+
+    def stop(self):
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @staticmethod
+    def take_snapshot():
+        # The allocations of tracemalloc and of the profiler are left out
+        return tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),
+                                                          tracemalloc.Filter(False, __file__)))
+
+    def start_frame(self):
+        tracemalloc.reset_peak()
+        self.frame_start_memory = tracemalloc.get_traced_memory()[0]
+
+    def end_frame(self):
+        """
+        Records the memory of the frame, and takes a snapshot every snapshot_interval frames.
+        """
+        current, peak = tracemalloc.get_traced_memory()
+        self.frames.append(FrameMemory(len(self.frames), current - self.frame_start_memory,
+                                       peak - self.frame_start_memory))
+
+        if len(self.frames) % self.snapshot_interval == 0:
+            snapshot = self.take_snapshot()
+            self.reports.append((len(self.frames), self.get_module_statistics(snapshot, self.previous_snapshot)))
+            self.previous_snapshot = snapshot
+
+    def get_module_statistics(self, snapshot, previous_snapshot):
+        """
+        Returns the (module, size difference, size, count difference) of the allocation sites that grew the most
+        between two snapshots, the sites of the modules of interest first.
+        """
+        statistics = snapshot.compare_to(previous_snapshot, 'filename')
+        statistics.sort(key=lambda statistic: -abs(statistic.size_diff))
+
+        rows = [(get_module_name(statistic.traceback[0].filename), statistic.size_diff, statistic.size,
+                 statistic.count_diff) for statistic in statistics]
+        selected = [row for row in rows if row[0] in self.modules]
+        others = [row for row in rows[:self.top] if row[0] not in self.modules]
+
+        return selected + others
+
+    def get_steady_state_frames(self, warmup=10):
+        return self.frames[warmup:]
+
+    def get_bytes_per_frame(self, warmup=10):
+        """
+        Returns the mean net growth and the largest transient memory of the frames after the warmup ones.
+        """
+        frames = self.get_steady_state_frames(warmup)
+        if len(frames) == 0:
+            return 0, 0
+
+        return sum(frame.net_bytes for frame in frames) / len(frames), max(frame.transient_bytes for frame in frames)
+
+    def report(self, warmup=10):
+        """
+        Prints the memory per frame, the peak RSS and the reports of the snapshots.
+        """
+        net_bytes, transient_bytes = self.get_bytes_per_frame(warmup)
+        peak_rss = get_peak_rss()
+        print("Memory: {} frames, net {:.0f} B/frame, transient up to {} B/frame (after {} warmup frames), "
+              "peak RSS {}".format(len(self.frames), net_bytes, transient_bytes, warmup,
+                                   "unknown" if peak_rss is None else "{:.1f} MiB".format(peak_rss / 2 ** 20)))
+
+        for frame, statistics in self.reports:
+            print("Allocation sites, frames {} to {}:".format(frame - self.snapshot_interval, frame))
+            print("  {:<24} {:>12} {:>12} {:>10}".format("module", "growth (B)", "size (B)", "blocks"))
+            for module, size_diff, size, count_diff in statistics:
+                print("  {:<24} {:>+12} {:>12} {:>+10}".format(module, size_diff, size, count_diff))
+
+    def check_budget(self, bytes_per_frame, warmup=10):
+        """
+        Whether the steady-state frames stay within an allocation budget: neither the mean net growth nor the largest
+        transient memory of a frame exceeds it. Meant to be asserted in a test of a long run.
+
+        :param bytes_per_frame: Budget in bytes.
+        :param warmup: Number of first frames left out (lazy allocations, compilation of the kernels).
+        :return: Whether the budget is kept, and the mean net growth and largest transient memory per frame.
+        """
+        net_bytes, transient_bytes = self.get_bytes_per_frame(warmup)
+
+        return net_bytes <= bytes_per_frame and transient_bytes <= bytes_per_frame, net_bytes, transient_bytes
+
+
+def profile_updates(particle_filter, frames, move_distance, plant_size, area_size, snapshot_interval=100):
+    """
+    Runs the updates of a particle filter on frames under a MemoryProfiler, and returns the profiler.
+    """
+    profiler = MemoryProfiler(snapshot_interval)
+    with profiler:
+        for frame in frames:
+            profiler.start_frame()
+            particle_filter.update(move_distance, frame, plant_size, area_size)
+            profiler.end_frame()
+
+    return profiler
@@ -0,0 +1,366 @@
+from enum import Enum
+
+import numpy as np
+
+from core.measurement.measurement_models import count_window_pixels, get_window_counting_likelihoods
+from simulator.geometry import get_bottom_plant_counts, get_bottom_plants, get_row_indexes
+
+# Numba is optional, the NumPy kernels are used without it.
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    njit = None
+    prange = range
+    NUMBA_AVAILABLE = False
+
+
+class KernelBackends(Enum):
+    # Vectorized NumPy kernels, always available.
+    NUMPY = 1
+    # Numba kernels compiled in nopython mode and parallelized over the particles.
+    NUMBA = 2
+
+
+class ExecutionBackends(Enum):
+    # Likelihood of each particle computed one after the other.
+    SERIAL = 1
+    # Likelihoods of all the particles computed at once by the NumPy kernels.
+    VECTORIZED = 2
+    # Likelihoods of all the particles computed at once by the Numba kernels, in parallel.
+    PARALLEL = 3
+
+
+def get_kernel_backend(execution_backend):
+    """
+    Returns the kernel backend of an execution backend, None (the default backend) for the serial one.
+    """
+    if execution_backend is ExecutionBackends.PARALLEL:
+        return KernelBackends.NUMBA
+    if execution_backend is ExecutionBackends.VECTORIZED:
+        return KernelBackends.NUMPY
+
+    return None
+
+
+def get_default_backend():
+    """
+    Returns the Numba backend when Numba is installed, the NumPy backend otherwise.
+    """
+    return KernelBackends.NUMBA if NUMBA_AVAILABLE else KernelBackends.NUMPY
+
+
+def resolve_backend(backend):
+    """
+    Returns the backend that will actually run: the Numba backend falls back to NumPy when Numba is not installed.
+    """
+    if backend is None:
+        return get_default_backend()
+
+    if backend is KernelBackends.NUMBA and not NUMBA_AVAILABLE:
+        print("Warning: Numba is not installed, the NumPy kernels are used.")
+        return KernelBackends.NUMPY
+
+    return backend
+
+
+# Window scoring
+# Window counting likelihood of every particle from the integral image of the measurement, see
+# compute_window_counting_likelihood. The plants of particle n are plants[plant_offsets[n]:plant_offsets[n + 1]].
+
+def _score_windows_loop(integral, plants, plant_offsets, half_plant, half_area, probability_in, probability_out,
+                        likelihoods):
+    height = integral.shape[0] - 1
+    width = integral.shape[1] - 1
+    for n in prange(len(plant_offsets) - 1):
+        green_in = 0
+        nb_in = 0
+        green_area = 0
+        nb_area = 0
+        for k in range(plant_offsets[n], plant_offsets[n + 1]):
+            x = plants[k, 0]
+            y = plants[k, 1]
+
+            # Window of the plant
+            x_min = min(max(x - half_area, 0), width)
+            x_max = min(max(x + half_area, 0), width)
+            y_min = min(max(y - half_area, 0), height)
+            y_max = min(max(y + half_area, 0), height)
+            green_area += integral[y_max, x_max] - integral[y_min, x_max] - integral[y_max, x_min] \
+                + integral[y_min, x_min]
+            nb_area += max(x_max - x_min, 0) * max(y_max - y_min, 0)
+
+            # Square of the plant, only for the plants inside the image
+            if 0 <= x < width and 0 <= y < height:
+                x_min = min(max(x - half_plant, 0), width)
+                x_max = min(max(x + half_plant, 0), width)
+                y_min = min(max(y - half_plant, 0), height)
+                y_max = min(max(y + half_plant, 0), height)
+                green_in += integral[y_max, x_max] - integral[y_min, x_max] - integral[y_max, x_min] \
+                    + integral[y_min, x_min]
+                nb_in += max(x_max - x_min, 0) * max(y_max - y_min, 0)
+
+        nb_out = nb_area - nb_in
+        green_out = green_area - green_in
+        if nb_in == 0 or nb_out == 0:
+            likelihoods[n] = 0.0
+        else:
+            pr_zi_in_given_x = 1.0 + green_in * probability_in + (nb_in - green_in) * (1 - probability_in)
+            pr_zi_out_given_x = 1.0 + green_out * probability_out + (nb_out - green_out) * (1 - probability_out)
+            likelihoods[n] = (pr_zi_in_given_x / nb_in) / (pr_zi_out_given_x / nb_out)
+
+
+def _score_windows_numpy(integral, plants, plant_offsets, half_plant, half_area, probability_in, probability_out,
+                         likelihoods):
+    height, width = integral.shape[0] - 1, integral.shape[1] - 1
+    x, y = plants[:, 0], plants[:, 1]
+
+    green_area, nb_area = count_window_pixels(integral, x - half_area, y - half_area, x + half_area, y + half_area)
+    green_in, nb_in = count_window_pixels(integral, x - half_plant, y - half_plant, x + half_plant, y + half_plant)
+    outside = (x < 0) | (x >= width) | (y < 0) | (y >= height)
+    green_in[outside] = 0
+    nb_in[outside] = 0
+
+    # Sums over the plants of each particle
+    def sum_per_particle(counts):
+        cumulated = np.concatenate(([0], np.cumsum(counts, dtype=np.int64)))
+        return (cumulated[plant_offsets[1:]] - cumulated[plant_offsets[:-1]]).astype(np.int32)
+
+    green_in, nb_in = sum_per_particle(green_in), sum_per_particle(nb_in)
+    green_out, nb_out = sum_per_particle(green_area) - green_in, sum_per_particle(nb_area) - nb_in
+
+    likelihoods[:] = get_window_counting_likelihoods(green_in, nb_in, green_out, nb_out, probability_in,
+                                                     probability_out)
+
+
+def score_windows(integral, plants, plant_offsets, plant_size, area_size, probability_in, probability_out,
+                  backend=None, out=None):
+    """
+    Window counting likelihoods of many particles at once.
+
+    :param integral: Integral image of the measurement, see compute_integral_image.
+    :param plants: (K, 2) integer coordinates of the expected plants of all the particles.
+    :param plant_offsets: (N + 1,) indexes of the first expected plant of each particle in plants, followed by K.
+    :param plant_size: Side of the square of a plant.
+    :param area_size: Side of the window around a plant.
+    :param probability_in: Probability of a plant pixel inside the plants.
+    :param probability_out: Probability of a plant pixel outside the plants.
+    :param backend: One of KernelBackends, the default backend if None.
+    :param out: (N,) float64 array the likelihoods are written to, a new array if None.
+    :return: (N,) likelihoods.
+    """
+    plants = np.ascontiguousarray(plants).reshape(-1, 2)
+    if plants.dtype.kind not in 'iu':
+        plants = plants.astype(np.int64)
+    plant_offsets = np.ascontiguousarray(plant_offsets, dtype=np.int64)
+    likelihoods = np.zeros(len(plant_offsets) - 1, np.float64) if out is None else out
+
+    if resolve_backend(backend) is KernelBackends.NUMBA:
+        _score_windows_numba(integral, plants, plant_offsets, int(plant_size / 2), int(area_size / 2),
+                             probability_in, probability_out, likelihoods)
+    else:
+        _score_windows_numpy(integral, plants, plant_offsets, int(plant_size / 2), int(area_size / 2),
+                             probability_in, probability_out, likelihoods)
+
+    return likelihoods
+
+
+# Bottom window scoring
+# Window counting likelihood of the bottom plants of every particle (see
+# ParticleFilter.compute_samples_likelihoods_window_counting), straight from the states: the rows are counted as in
+# simulator.geometry.get_bottom_plant_counts and the plants are scored as they are enumerated, without materializing
+# them. With Numba, nothing proportional to the number of particles is allocated. NumPy scores the particles by
+# chunks of BOTTOM_WINDOWS_CHUNK_SIZE, which bounds its temporary arrays whatever the number of particles.
+
+BOTTOM_WINDOWS_CHUNK_SIZE = 1024
+
+def _score_bottom_windows_loop(integral, states, width, height, max_rows, half_plant, half_area, probability_in,
+                               probability_out, likelihoods):
+    integral_height = integral.shape[0] - 1
+    integral_width = integral.shape[1] - 1
+    for n in prange(states.shape[0]):
+        offset = np.float64(states[n, 0])
+        position = np.float64(states[n, 1])
+        inter_row = np.float64(states[n, 3])
+
+        # Rows to the left and to the right of the particular plant
+        nb_left_plants = 0
+        nb_right_plants = 0
+        if 0 <= position < height and inter_row > 0:
+            if 0 <= offset - inter_row < width:
+                nb_left_plants = int(np.floor(offset / inter_row))
+            if 0 <= offset + inter_row < width:
+                nb_right_plants = int(np.ceil((width - offset) / inter_row)) - 1
+        if max_rows >= 0:
+            budget = max(max_rows - 1, 0)
+            both = min(min(nb_left_plants, nb_right_plants), budget // 2)
+            left = both + min(nb_left_plants - both, budget - 2 * both)
+            nb_right_plants = both + min(nb_right_plants - both, budget - both - left)
+            nb_left_plants = left
+
+        green_in = 0
+        nb_in = 0
+        green_area = 0
+        nb_area = 0
+        y = int(np.floor(position))
+        for k in range(-nb_left_plants, nb_right_plants + 1):
+            x = int(np.floor(offset + k * inter_row))
+
+            # Window of the plant
+            x_min = min(max(x - half_area, 0), integral_width)
+            x_max = min(max(x + half_area, 0), integral_width)
+            y_min = min(max(y - half_area, 0), integral_height)
+            y_max = min(max(y + half_area, 0), integral_height)
+            green_area += integral[y_max, x_max] - integral[y_min, x_max] - integral[y_max, x_min] \
+                + integral[y_min, x_min]
+            nb_area += max(x_max - x_min, 0) * max(y_max - y_min, 0)
+
+            # Square of the plant, only for the plants inside the image
+            if 0 <= x < integral_width and 0 <= y < integral_height:
+                x_min = min(max(x - half_plant, 0), integral_width)
+                x_max = min(max(x + half_plant, 0), integral_width)
+                y_min = min(max(y - half_plant, 0), integral_height)
+                y_max = min(max(y + half_plant, 0), integral_height)
+                green_in += integral[y_max, x_max] - integral[y_min, x_max] - integral[y_max, x_min] \
+                    + integral[y_min, x_min]
+                nb_in += max(x_max - x_min, 0) * max(y_max - y_min, 0)
+
+        nb_out = nb_area - nb_in
+        green_out = green_area - green_in
+        if nb_in == 0 or nb_out == 0:
+            likelihoods[n] = 0.0
+        else:
+            pr_zi_in_given_x = 1.0 + green_in * probability_in + (nb_in - green_in) * (1 - probability_in)
+            pr_zi_out_given_x = 1.0 + green_out * probability_out + (nb_out - green_out) * (1 - probability_out)
+            likelihoods[n] = (pr_zi_in_given_x / nb_in) / (pr_zi_out_given_x / nb_out)
+
+
+def score_bottom_windows(integral, states, width, height, max_rows, plant_size, area_size, probability_in,
+                         probability_out, backend=None, out=None, coordinate_dtype=np.int64):
+    """
+    Window counting likelihoods of the bottom plants of many particles at once.
+
+    :param integral: Integral image of the measurement, see compute_integral_image.
+    :param states: (N, 6) array of states.
+    :param width: Width of the image.
+    :param height: Height of the image.
+    :param max_rows: Maximal number of rows of a particle, None for no limit.
+    :param plant_size: Side of the square of a plant.
+    :param area_size: Side of the window around a plant.
+    :param probability_in: Probability of a plant pixel inside the plants.
+    :param probability_out: Probability of a plant pixel outside the plants.
+    :param backend: One of KernelBackends, the default backend if None.
+    :param out: (N,) float64 array the likelihoods are written to, a new array if None.
+    :param coordinate_dtype: Dtype of the plant coordinates of the NumPy backend.
+    :return: (N,) likelihoods.
+    """
+    likelihoods = np.zeros(len(states), np.float64) if out is None else out
+    if len(states) == 0:
+        return likelihoods
+
+    if resolve_backend(backend) is KernelBackends.NUMBA:
+        _score_bottom_windows_numba(integral, states, width, height, -1 if max_rows is None else max_rows,
+                                    int(plant_size / 2), int(area_size / 2), probability_in, probability_out,
+                                    likelihoods)
+        return likelihoods
+
+    for start in range(0, len(states), BOTTOM_WINDOWS_CHUNK_SIZE):
+        chunk = states[start:start + BOTTOM_WINDOWS_CHUNK_SIZE]
+        nb_left_plants, nb_right_plants = get_bottom_plant_counts(chunk, width, height, max_rows)
+        row_indexes, rows = get_row_indexes(nb_left_plants, nb_right_plants)
+        plants = np.floor(get_bottom_plants(chunk, row_indexes)[rows]).astype(coordinate_dtype)
+        plant_offsets = np.concatenate(([0], np.cumsum(nb_left_plants + nb_right_plants + 1)))
+
+        score_windows(integral, plants, plant_offsets, plant_size, area_size, probability_in, probability_out,
+                      KernelBackends.NUMPY, likelihoods[start:start + len(chunk)])
+
+    return likelihoods
+
+
+# Sorted search
+# Index of the first element of a sorted array that is >= each value (> with right), as np.searchsorted, written to
+# a given array. Used by the resampling of the arrays of particles.
+
+def _search_sorted_loop(sorted_values, values, right, out):
+    n = len(sorted_values)
+    for i in range(len(values)):
+        low = 0
+        high = n
+        while low < high:
+            middle = (low + high) // 2
+            if sorted_values[middle] < values[i] or (right and sorted_values[middle] == values[i]):
+                low = middle + 1
+            else:
+                high = middle
+        out[i] = low
+
+
+def search_sorted(sorted_values, values, out, right=False, backend=None):
+    """
+    Writes to out the indexes where the values would be inserted in sorted_values to keep it sorted, see
+    np.searchsorted. The Numba backend doesn't allocate, the NumPy one allocates the indexes before copying them.
+    """
+    if resolve_backend(backend) is KernelBackends.NUMBA:
+        _search_sorted_numba(sorted_values, values, right, out)
+    else:
+        out[:] = np.searchsorted(sorted_values, values, side='right' if right else 'left')
+
+    return out
+
+
+# Compiled on first call
+if NUMBA_AVAILABLE:
+    _score_windows_numba = njit(parallel=True, cache=True, error_model="numpy")(_score_windows_loop)
+    _score_bottom_windows_numba = njit(parallel=True, cache=True, error_model="numpy")(_score_bottom_windows_loop)
+    _search_sorted_numba = njit(cache=True)(_search_sorted_loop)
+
+
+if __name__ == '__main__':
+    # Timings of each backend, the parity with the reference implementations is tested in tests/test_kernels.py:
+    # python -m core.kernels
+    import contextlib
+    import io
+    import time
+
+    from simulator import Plants, Visualizer, World
+    from core.measurement.measurement_models import compute_integral_image, get_plant_mask
+    from core.particle_filters import ParticleFilterSIR
+    from core.resampling.resampler import ResamplingAlgorithms
+
+    np.random.seed(0)
+    world = World(500, 700, 10)
+    plants = Plants(world, -100, 310, 160, 110, o=0, nb_rows=4, nb_plant_types=4)
+    plants.generate_plants()
+    visualizer = Visualizer(world)
+    visualizer.draw(plants, [], 0)
+    measurement = visualizer.measure()
+    integral = compute_integral_image(get_plant_mask(measurement))
+
+    limits = [world.width - 110, world.width + 110, world.height - 80, world.height, 90, 130, 151, 170,
+              -np.pi / 12, np.pi / 12, 0.1, 0.4]
+    particle_filter = ParticleFilterSIR(world, 1000, limits, [0] * 6, [0.9, 0.01], ResamplingAlgorithms.STRATIFIED)
+    with contextlib.redirect_stdout(io.StringIO()):
+        particle_filter.initialize_particles_uniform()
+    states, _ = particle_filter.get_states()
+    expected_plants, plant_offsets = particle_filter.get_samples_bottom_plants(states)
+    expected_plants = np.floor(expected_plants).astype(np.int64)
+    backends = [KernelBackends.NUMPY] + ([KernelBackends.NUMBA] if NUMBA_AVAILABLE else [])
+
+    # The first call of a Numba kernel compiles it
+    def get_time(function, repeats=20):
+        function()
+        start = time.perf_counter()
+        for _ in range(repeats):
+            function()
+        return (time.perf_counter() - start) / repeats
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        reference_time = get_time(lambda: particle_filter.compute_likelihood(states[0], measurement, 6, 14), 3)
+    print("compute_likelihood: {:.1f} ms per particle".format(1000 * reference_time))
+    for backend in backends:
+        score_time = get_time(lambda: score_windows(integral, expected_plants, plant_offsets, 6, 14, 0.9, 0.01,
+                                                    backend))
+        bottom_time = get_time(lambda: score_bottom_windows(integral, states, world.width, world.height, 64, 6, 14,
+                                                            0.9, 0.01, backend))
+        print("{}: score_windows {:.3f} ms, score_bottom_windows {:.3f} ms for {} particles".format(
+            backend.name, 1000 * score_time, 1000 * bottom_time, len(states)))
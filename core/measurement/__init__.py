@@ -0,0 +1 @@
+from .measurement_models import MeasurementModels
@@ -0,0 +1,137 @@
+import numpy as np
+
+
+class FieldHypothesis:
+    """
+    Row structure estimated from a measurement: the vanishing point, the x coordinate of one row at the bottom of the
+    image (y = height - 1) and the inter-row distance at the bottom of the image.
+    """
+
+    def __init__(self, vanishing_point, bottom_x, inter_row, score):
+        self.vanishing_point = vanishing_point
+        self.bottom_x = bottom_x
+        self.inter_row = inter_row
+        self.score = score
+
+    def get_row_x(self, bottom_x, y, height):
+        """
+        Returns the x coordinate at height y of the row starting at bottom_x.
+        """
+        u = (height - 1 - y) / (height - 1 - self.vanishing_point[1])
+        return bottom_x + (self.vanishing_point[0] - bottom_x) * u
+
+    def get_row_lines(self, width, height):
+        """
+        Returns the bottom and top x coordinates of every row of the hypothesis that starts inside the image.
+        """
+        first = self.bottom_x - np.floor(self.bottom_x / self.inter_row) * self.inter_row
+        bottom_xs = np.arange(first, width, self.inter_row)
+        top_xs = self.get_row_x(bottom_xs, 0, height)
+
+        return bottom_xs, top_xs
+
+    def get_state(self, position, inter_plant, offset_min, offset_max, height):
+        """
+        Returns the particle state (offset, position, inter-plant, inter-row, skew, convergence) describing this row
+        structure, with its particular plant at the given position on the row whose offset is the closest to the
+        middle of the offset limits.
+        """
+        # Inter-row at the particular plant height and at the top of the image
+        scale_at_position = (position - self.vanishing_point[1]) / (height - 1 - self.vanishing_point[1])
+        scale_at_top = -self.vanishing_point[1] / (height - 1 - self.vanishing_point[1])
+        inter_row = self.inter_row * scale_at_position
+
+        # Choice of the row of the particular plant
+        x = self.get_row_x(self.bottom_x, position, height)
+        k = np.rint(((offset_min + offset_max) / 2 - x) / inter_row)
+        bottom_x = self.bottom_x + k * self.inter_row
+        offset = self.get_row_x(bottom_x, position, height)
+
+        # The top crossing point of the particular plant's row is offset + tan(skew) * position
+        skew = np.arctan((self.get_row_x(bottom_x, 0, height) - offset) / position)
+        convergence = scale_at_top / scale_at_position
+
+        return [offset, position, inter_plant, inter_row, skew, convergence]
+
+
+def find_strong_lines(accumulator, nb_lines, suppression_radius=3):
+    """
+    Returns the (bottom x, top x, density) of the nb_lines densest lines of a computed RowLineAccumulator, with
+    non-maximum suppression in a square of suppression_radius table entries.
+    """
+    table = accumulator.table.copy()
+    lines = []
+    for _ in range(nb_lines):
+        i, j = np.unravel_index(np.argmax(table), table.shape)
+        if table[i, j] <= 0:
+            break
+
+        lines.append((accumulator.bottom_xs[i], accumulator.top_xs[j], table[i, j]))
+        table[max(0, i - suppression_radius):i + suppression_radius + 1,
+              max(0, j - suppression_radius):j + suppression_radius + 1] = 0
+
+    return lines
+
+
+def find_field_hypotheses(accumulator, inter_row_min, inter_row_max, max_vanishing_point_y, nb_lines=12,
+                          nb_hypotheses=3):
+    """
+    Multi-hypothesis estimation of the row structure from a computed RowLineAccumulator. Every pair of strong lines
+    gives a vanishing point (their intersection) and, assuming they are 1 or 2 rows apart, an inter-row distance.
+    Each candidate is scored by the mean plant pixel density along all of its rows.
+
+    :param accumulator: RowLineAccumulator computed on the measurement.
+    :param inter_row_min: Minimal inter-row distance at the bottom of the image.
+    :param inter_row_max: Maximal inter-row distance at the bottom of the image.
+    :param max_vanishing_point_y: Candidates whose vanishing point is lower than this are discarded.
+    :param nb_lines: Number of strong lines considered.
+    :param nb_hypotheses: Number of returned hypotheses.
+    :return: List of FieldHypothesis, best first.
+    """
+    height = accumulator.height
+    lines = find_strong_lines(accumulator, nb_lines)
+
+    candidates = []
+    for a in range(len(lines)):
+        for b in range(a + 1, len(lines)):
+            b1, t1, _ = lines[a]
+            b2, t2, _ = lines[b]
+
+            # Intersection of the two lines, u is the fraction of the way from the bottom to the top of the image.
+            denominator = (t1 - b1) - (t2 - b2)
+            if abs(denominator) < 1e-9:
+                continue
+            u = (b2 - b1) / denominator
+            vanishing_point_y = (height - 1) * (1 - u)
+            if u <= 0 or vanishing_point_y > max_vanishing_point_y:
+                continue
+            vanishing_point = (b1 + (t1 - b1) * u, vanishing_point_y)
+
+            for nb_rows_apart in (1, 2):
+                inter_row = abs(b2 - b1) / nb_rows_apart
+                if not inter_row_min <= inter_row <= inter_row_max:
+                    continue
+
+                hypothesis = FieldHypothesis(vanishing_point, b1, inter_row, 0)
+                bottom_xs, top_xs = hypothesis.get_row_lines(accumulator.width, height)
+                densities, valid = accumulator.lookup(bottom_xs, top_xs)
+                if np.any(valid):
+                    hypothesis.score = np.mean(densities[valid])
+                    candidates.append(hypothesis)
+
+    candidates.sort(key=lambda hypothesis: hypothesis.score, reverse=True)
+
+    # Keeping distinct hypotheses only
+    hypotheses = []
+    for candidate in candidates:
+        is_distinct = True
+        for hypothesis in hypotheses:
+            if abs(candidate.inter_row - hypothesis.inter_row) <= 2 \
+                    and abs(candidate.vanishing_point[0] - hypothesis.vanishing_point[0]) <= 10:
+                is_distinct = False
+        if is_distinct:
+            hypotheses.append(candidate)
+        if len(hypotheses) == nb_hypotheses:
+            break
+
+    return hypotheses
@@ -0,0 +1,171 @@
+from enum import Enum
+
+import numpy as np
+
+
+class MeasurementModels(Enum):
+    # Counting of the measured plant pixels in small windows around the expected plants (compute_likelihood).
+    WINDOW_COUNTING = 1
+    # Mean distance from the expected plants to the nearest measured plant pixel.
+    DISTANCE_TRANSFORM = 2
+    # Density of the measured plant pixels along the rows of the particle, see RowLineAccumulator.
+    ROW_LINE = 3
+
+
+def get_plant_mask(measurement, out=None):
+    """
+    Returns the boolean mask of the measured plant pixels: the green pixels of the measurement image.
+
+    :param out: (height, width) boolean array the mask is written to, a new array if None.
+    """
+    return np.equal(measurement[:, :, 1], 255, out=out)
+
+
+def compute_distance_map(measurement):
+    """
+    Returns, for every pixel of the measurement, the Euclidean distance to the nearest measured plant pixel. Computed
+    once per frame, it turns the scoring of a particle into one lookup per expected plant.
+    """
+    return compute_distance_map_from_mask(get_plant_mask(measurement))
+
+
+def compute_distance_map_from_mask(plant_mask):
+    """
+    Same as compute_distance_map for an already binarized (possibly cropped) plant mask.
+    """
+    # OpenCV is only imported by the distance transform model, the other models only need NumPy.
+    import cv2 as cv
+
+    # cv.distanceTransform gives the distance to the nearest zero pixel, so the plant pixels must be the zeros.
+    not_plant = np.where(plant_mask, 0, 1).astype(np.uint8)
+
+    return cv.distanceTransform(not_plant, cv.DIST_L2, cv.DIST_MASK_PRECISE)
+
+
+def compute_distance_likelihood(distance_map, expected_plant_positions, sigma, max_distance, origin=(0, 0),
+                                image_size=None):
+    """
+    Likelihood of a particle given the distance map of the measurement: exp(-d^2 / (2 sigma^2)) where d is the mean
+    distance from the expected plants (inside the image) to their nearest measured plant.
+
+    :param distance_map: Distance map of the measurement, see compute_distance_map.
+    :param expected_plant_positions: (K, 2) array or list of the (x, y) coordinates of the expected plants.
+    :param sigma: Distance (in pixels) at which the likelihood has decreased by a factor exp(-1/2).
+    :param max_distance: Distances are truncated to this value so that a few missing plants don't discard a particle.
+    :param origin: Image coordinates of the top left pixel of the distance map, when it only covers a region of
+    interest. The expected plants inside the image but outside the region count as max_distance.
+    :param image_size: (width, height) of the image, the size of the distance map by default.
+    :return: Likelihood, 0 if no expected plant is inside the image.
+    """
+    if len(expected_plant_positions) == 0:
+        return 0
+
+    # Integer coordinates are kept in their dtype (int16 or int32 in single precision)
+    plants = np.asarray(expected_plant_positions).reshape(-1, 2)
+    if plants.dtype.kind not in 'iu':
+        plants = plants.astype(np.int64)
+    map_height, map_width = distance_map.shape
+    width, height = (map_width, map_height) if image_size is None else image_size
+
+    valid = (plants[:, 0] >= 0) & (plants[:, 0] < width) & (plants[:, 1] >= 0) & (plants[:, 1] < height)
+    if not np.any(valid):
+        return 0
+
+    x = plants[valid, 0] - origin[0]
+    y = plants[valid, 1] - origin[1]
+    in_map = (x >= 0) & (x < map_width) & (y >= 0) & (y < map_height)
+
+    distances = np.full(len(x), max_distance, distance_map.dtype)
+    distances[in_map] = np.minimum(distance_map[y[in_map], x[in_map]], max_distance)
+    mean_distance = np.mean(distances)
+
+    return np.exp(-0.5 * np.square(mean_distance / sigma))
+
+
+def compute_integral_image(plant_mask, out=None):
+    """
+    Returns the (height + 1, width + 1) int32 integral image of a plant mask: entry (y, x) is the number of plant
+    pixels above and to the left of pixel (y, x). Computed once per frame, it gives the number of plant pixels of any
+    window with four lookups.
+
+    :param out: Integral image of a previous frame of the same size to overwrite, a new array if None.
+    """
+    integral = np.zeros((plant_mask.shape[0] + 1, plant_mask.shape[1] + 1), np.int32) if out is None else out
+
+    # Sums accumulated in place, a cumulative sum of the boolean mask would allocate an int32 copy of it
+    inner = integral[1:, 1:]
+    np.copyto(inner, plant_mask)
+    np.add.accumulate(inner, axis=0, out=inner)
+    np.add.accumulate(inner, axis=1, out=inner)
+
+    return integral
+
+
+def count_window_pixels(integral, x_min, y_min, x_max, y_max):
+    """
+    Returns the int32 numbers of plant pixels and of pixels of the windows [x_min, x_max) x [y_min, y_max), clipped to
+    the image. The bounds are (K,) integer arrays.
+    """
+    height, width = integral.shape[0] - 1, integral.shape[1] - 1
+    x_min = np.clip(x_min, 0, width)
+    x_max = np.clip(x_max, 0, width)
+    y_min = np.clip(y_min, 0, height)
+    y_max = np.clip(y_max, 0, height)
+
+    plant_pixels = integral[y_max, x_max] - integral[y_min, x_max] - integral[y_max, x_min] + integral[y_min, x_min]
+    pixels = (np.maximum(x_max - x_min, 0) * np.maximum(y_max - y_min, 0)).astype(np.int32)
+
+    return plant_pixels, pixels
+
+
+def compute_window_counting_likelihood(integral, expected_plant_positions, plant_size, area_size, probability_in,
+                                       probability_out):
+    """
+    Window counting likelihood (see ParticleFilter.compute_likelihood) from the integral image of the measurement.
+    The pixels of the window of area_size around each expected plant are split into the pixels of the plant (its
+    square of plant_size, only for the plants inside the image) and the others. The pixels are only counted, as int32,
+    and the counts are turned into the likelihood at the end. The plant squares of neighbouring plants are assumed not
+    to overlap each other's windows, which holds as long as the plants are more than area_size apart.
+
+    :param integral: Integral image of the measurement, see compute_integral_image.
+    :param expected_plant_positions: (K, 2) integer array of the (x, y) coordinates of the expected plants.
+    :return: Likelihood, 0 if there is no pixel inside or outside the plants.
+    """
+    plants = np.asarray(expected_plant_positions).reshape(-1, 2)
+    height, width = integral.shape[0] - 1, integral.shape[1] - 1
+    x, y = plants[:, 0], plants[:, 1]
+
+    # Pixels of the windows
+    half_area = int(area_size / 2)
+    green_area, nb_area = count_window_pixels(integral, x - half_area, y - half_area, x + half_area, y + half_area)
+
+    # Pixels of the plants inside the image
+    half_plant = int(plant_size / 2)
+    green_in, nb_in = count_window_pixels(integral, x - half_plant, y - half_plant, x + half_plant, y + half_plant)
+    valid = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+    green_in = np.sum(green_in[valid], dtype=np.int32)
+    nb_in = np.sum(nb_in[valid], dtype=np.int32)
+
+    nb_out = np.sum(nb_area, dtype=np.int32) - nb_in
+    green_out = np.sum(green_area, dtype=np.int32) - green_in
+
+    return float(get_window_counting_likelihoods(green_in, nb_in, green_out, nb_out, probability_in, probability_out))
+
+
+def get_window_counting_likelihoods(green_in, nb_in, green_out, nb_out, probability_in, probability_out):
+    """
+    Window counting likelihoods from the int32 pixel counts of one or several particles: numbers of plant pixels and
+    of pixels inside (green_in, nb_in) and outside (green_out, nb_out) the expected plants. The likelihood of a
+    particle is 0 if it has no pixel inside or outside the plants.
+    """
+    green_in, nb_in = np.asarray(green_in), np.asarray(nb_in)
+    green_out, nb_out = np.asarray(green_out), np.asarray(nb_out)
+
+    # Sum of qi^zi (1 - qi)^(1 - zi) over the pixels, starting from 1 as in compute_likelihood
+    pr_zi_in_given_x = 1.0 + green_in * probability_in + (nb_in - green_in) * (1 - probability_in)
+    pr_zi_out_given_x = 1.0 + green_out * probability_out + (nb_out - green_out) * (1 - probability_out)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        likelihoods = (pr_zi_in_given_x / nb_in) / (pr_zi_out_given_x / nb_out)
+
+    return np.where((nb_in == 0) | (nb_out == 0), 0.0, likelihoods)
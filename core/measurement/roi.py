@@ -0,0 +1,71 @@
+import numpy as np
+
+
+class RegionOfInterest:
+    """
+    Rectangular part of the measurement where the particles expect plants. Only this part of a new frame is cropped
+    and binarized, and the coordinates of the expected plants are translated to it. The region covers the whole
+    image until it is set from the particle cloud.
+    """
+
+    def __init__(self, width, height, margin=30):
+        """
+        :param width: Width of the measurement image.
+        :param height: Height of the measurement image.
+        :param margin: Margin (in pixels) added around the expected plants, it must cover the motion between frames.
+        """
+        self.width = width
+        self.height = height
+        self.margin = margin
+
+        # (x_min, y_min, x_max, y_max), maximums excluded
+        self.roi = (0, 0, width, height)
+
+    def reset(self):
+        self.roi = (0, 0, self.width, self.height)
+
+    def set_from_points(self, points):
+        """
+        Sets the region to the bounding box of the given (K, 2) points plus the margin, clipped to the image. The
+        region is reset to the whole image when there is no point.
+        """
+        points = np.asarray(points).reshape(-1, 2)
+        if len(points) == 0:
+            self.reset()
+            return
+
+        x_min, y_min = np.min(points, axis=0) - self.margin
+        x_max, y_max = np.max(points, axis=0) + self.margin + 1
+
+        self.roi = (int(max(0, x_min)), int(max(0, y_min)), int(min(self.width, x_max)), int(min(self.height, y_max)))
+
+    def get_origin(self):
+        return self.roi[0], self.roi[1]
+
+    def crop(self, measurement):
+        """
+        Returns the boolean plant mask (green pixels) of the region of the measurement.
+        """
+        x_min, y_min, x_max, y_max = self.roi
+        return measurement[y_min:y_max, x_min:x_max, 1] == 255
+
+    def to_roi_coordinates(self, points):
+        """
+        Translates (K, 2) image coordinates to coordinates in the region.
+        """
+        return np.asarray(points).reshape(-1, 2) - np.asarray(self.get_origin())
+
+    def contains(self, points):
+        """
+        Returns a boolean mask of the (K, 2) image coordinates that are inside the region.
+        """
+        points = np.asarray(points).reshape(-1, 2)
+        x_min, y_min, x_max, y_max = self.roi
+        return (points[:, 0] >= x_min) & (points[:, 0] < x_max) & (points[:, 1] >= y_min) & (points[:, 1] < y_max)
+
+    def get_area_ratio(self):
+        """
+        Returns the fraction of the image covered by the region.
+        """
+        x_min, y_min, x_max, y_max = self.roi
+        return (x_max - x_min) * (y_max - y_min) / (self.width * self.height)
@@ -0,0 +1,107 @@
+import numpy as np
+
+
+class RowLineAccumulator:
+    """
+    Per-frame table of the density of measured plant pixels along every candidate row line. A row line is described
+    by its x coordinate at the bottom of the image and its x coordinate at the top of the image (like a particle's
+    bottom plant extrapolated to the bottom edge and its top crossing point). The table is built once per frame, then
+    scoring the rows of a particle only needs a few table lookups.
+    """
+
+    def __init__(self, width, height, x_step=4, y_step=8, band=4, top_margin=None):
+        """
+        :param width: Width of the measurement image.
+        :param height: Height of the measurement image.
+        :param x_step: Spacing (in pixels) of the bottom and top x coordinates of the table.
+        :param y_step: Vertical spacing (in pixels) of the points sampled along each line.
+        :param band: Half width (in pixels) of the band integrated around each sampled point.
+        :param top_margin: Top x coordinates range from -top_margin to width + top_margin, defaults to width.
+        """
+        self.width = width
+        self.height = height
+        self.x_step = x_step
+        self.band = band
+
+        if top_margin is None:
+            top_margin = width
+
+        # Coordinates of the table
+        self.bottom_xs = np.arange(0, width, x_step, dtype=np.float64)
+        self.top_xs = np.arange(-top_margin, width + top_margin, x_step, dtype=np.float64)
+        self.ys = np.arange(0, height, y_step, dtype=np.float64)
+
+        # Position of each sampled point along the line: 0 at the bottom of the image, 1 at the top.
+        self.t = (height - 1 - self.ys) / (height - 1)
+
+        self.table = np.zeros((len(self.bottom_xs), len(self.top_xs)), np.float64)
+
+    def compute(self, plant_mask):
+        """
+        Builds the table for the given (height, width) boolean mask of measured plant pixels.
+        """
+        # Cumulative sums along the rows of the image so that the number of plant pixels in a horizontal band is a
+        # difference of two values. A zero column is added on the left.
+        cumulative = np.zeros((self.height, self.width + 1), np.int32)
+        np.cumsum(plant_mask, axis=1, out=cumulative[:, 1:])
+
+        rows = self.ys.astype(np.int64)[np.newaxis, :]
+        for i, bottom_x in enumerate(self.bottom_xs):
+            # x coordinates of the sampled points of every line starting at bottom_x, shape (top xs, ys)
+            x = bottom_x + (self.top_xs[:, np.newaxis] - bottom_x) * self.t[np.newaxis, :]
+
+            left = np.clip(np.rint(x - self.band), 0, self.width).astype(np.int64)
+            right = np.clip(np.rint(x + self.band + 1), 0, self.width).astype(np.int64)
+
+            self.table[i] = np.sum(cumulative[rows, right] - cumulative[rows, left], axis=1)
+
+        # From numbers of pixels to densities
+        self.table /= len(self.ys) * (2 * self.band + 1)
+
+    def lookup(self, bottom_xs, top_xs):
+        """
+        Returns the plant pixel density along each of the given lines (nearest table entry), and a mask of the lines
+        that are inside the table.
+        """
+        bottom_xs = np.asarray(bottom_xs, dtype=np.float64)
+        top_xs = np.asarray(top_xs, dtype=np.float64)
+
+        # Lines that can't be extrapolated (particular plant at the top of the image) are not valid.
+        finite = np.isfinite(bottom_xs) & np.isfinite(top_xs)
+        i = np.rint(np.where(finite, bottom_xs, -1) / self.x_step).astype(np.int64)
+        j = np.rint((np.where(finite, top_xs, -1) - self.top_xs[0]) / self.x_step).astype(np.int64)
+
+        valid = finite & (i >= 0) & (i < len(self.bottom_xs)) & (j >= 0) & (j < len(self.top_xs))
+        densities = np.zeros(len(i), np.float64)
+        densities[valid] = self.table[i[valid], j[valid]]
+
+        return densities, valid
+
+
+def get_row_lines(bottom_plants, top_crossing_points, height):
+    """
+    Returns the x coordinates at the bottom (y = height - 1) and at the top (y = 0) of the image of the row lines
+    going through each bottom plant and its top crossing point.
+    """
+    bottom_plants = np.asarray(bottom_plants, dtype=np.float64).reshape(-1, 2)
+    top_xs = np.asarray(top_crossing_points, dtype=np.float64).reshape(-1, 2)[:, 0]
+
+    # Extrapolation of each row from its bottom plant down to the bottom of the image
+    position = bottom_plants[:, 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bottom_xs = bottom_plants[:, 0] + (bottom_plants[:, 0] - top_xs) * (height - 1 - position) / position
+
+    return bottom_xs, top_xs
+
+
+def compute_row_line_likelihood(accumulator, bottom_plants, top_crossing_points, gain):
+    """
+    Likelihood of a particle from the density of plant pixels along its rows: exp(gain * mean density), 0 if none
+    of its rows is inside the accumulator table.
+    """
+    bottom_xs, top_xs = get_row_lines(bottom_plants, top_crossing_points, accumulator.height)
+    densities, valid = accumulator.lookup(bottom_xs, top_xs)
+    if not np.any(valid):
+        return 0
+
+    return np.exp(gain * np.mean(densities[valid]))
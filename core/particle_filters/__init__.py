@@ -1 +1,4 @@
 from .particle_filter_sir import ParticleFilterSIR
+from .particle_filter_factorized import ParticleFilterFactorized
+from .particle_filter_auxiliary import ParticleFilterAuxiliary
+from .particle_filter_regularized import ParticleFilterRegularized
@@ -0,0 +1,65 @@
+import numpy as np
+
+from .particle_filter_base import ParticleFilter
+from core.resampling.resampler import Resampler
+
+
+class ParticleFilterAuxiliary(ParticleFilter):
+    """
+    Auxiliary particle filter (Pitt and Shephard, 1999). Before propagating, every particle is pre-weighted by the
+    likelihood of its mean prediction, and the particles are resampled according to those first-stage weights. The
+    particles that are likely to explain the new measurement are therefore the ones that get propagated. The
+    first-stage likelihood can use a cheaper measurement model than the one used for the final weights.
+    """
+
+    def __init__(self,
+                 world,
+                 number_of_particles,
+                 limits,
+                 process_noise,
+                 measurement_noise,
+                 resampling_algorithm,
+                 predictive_measurement_model=None):
+
+        # Initialize particle filter base class
+        ParticleFilter.__init__(self, world, number_of_particles, limits, process_noise, measurement_noise)
+
+        # Set auxiliary specific properties
+        self.resampling_algorithm = resampling_algorithm
+        self.resampler = Resampler()
+
+        # Measurement model of the first-stage weights, the selected measurement model if None.
+        self.predictive_measurement_model = predictive_measurement_model
+
+    def update(self, plants_motion_move_distance, measurement, plant_size, area_size):
+        states, weights = self.get_states()
+
+        # Per-frame precomputation of the measurement models
+        self.prepare_measurement(measurement)
+        if self.predictive_measurement_model is not None \
+                and self.predictive_measurement_model is not self.measurement_model:
+            self.prepare_measurement(measurement, self.predictive_measurement_model)
+
+        # 1. First stage: weights of the particles given the likelihood of their mean prediction
+        predicted_states = self.propagate_samples(states, plants_motion_move_distance, add_noise=False)
+        predictive_likelihoods = self.compute_samples_likelihoods(predicted_states, measurement, plant_size,
+                                                                  area_size, self.predictive_measurement_model)
+        first_stage_weights = weights * predictive_likelihoods
+
+        if np.sum(first_stage_weights) < 1e-15:
+            print("Auxiliary particle filter: every predictive likelihood is 0, first stage is skipped.")
+            first_stage_weights = weights
+            predictive_likelihoods = np.ones(len(weights))
+
+        indexes = self.resampler.resample_indexes(first_stage_weights / np.sum(first_stage_weights),
+                                                  self.n_particles, self.resampling_algorithm)
+
+        # 2. Propagation of the selected particles
+        propagated_states = self.propagate_samples(states[indexes], plants_motion_move_distance)
+
+        # 3. Second stage: likelihood of the propagated particles corrected by their first-stage likelihood
+        likelihoods = self.compute_samples_likelihoods(propagated_states, measurement, plant_size, area_size)
+        new_weights = likelihoods / np.maximum(predictive_likelihoods[indexes], 1e-300)
+
+        self.set_states(propagated_states, new_weights)
+        self.particles = self.normalize_weights(self.particles)
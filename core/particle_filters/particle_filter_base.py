@@ -4,6 +4,26 @@ import numpy as np
 
 # Import of the Particle class
 from simulator.particle import Particle
+from simulator.lattice import DEFAULT_MIN_IP, PlantLattice
+from simulator.geometry import DEFAULT_MAX_ROWS, get_bottom_plant_counts, get_bottom_plants, \
+    get_inter_plant_distances, get_row_indexes, get_top_crossing_points, get_vanishing_points
+
+# Supported measurement models
+from core.measurement.measurement_models import MeasurementModels, compute_distance_map, \
+    compute_distance_map_from_mask, compute_distance_likelihood, compute_integral_image, \
+    compute_window_counting_likelihood, get_plant_mask
+from core.measurement.roi import RegionOfInterest
+from core.measurement.row_line import RowLineAccumulator, compute_row_line_likelihood
+from core.measurement.field_hypotheses import find_field_hypotheses
+
+# Numerical precision of the states, plant coordinates and pixel counts
+from core.precision import PrecisionModes, get_coordinate_dtype, get_float_dtype
+
+# Batched kernels (Numba when installed, NumPy otherwise)
+from core.kernels import ExecutionBackends, get_kernel_backend, resolve_backend, score_bottom_windows
+
+# Arrays reused from one update to the next
+from .workspace import ParticleWorkspace
 
 
 # Modified code from :
@@ -18,6 +38,7 @@ class ParticleFilter:
 
         # Initialize filter settings
         self.n_particles = number_of_particles
+        self.workspace = None
         self.particles = []
         self.world = world
 
@@ -46,6 +67,137 @@ class ParticleFilter:
         self.measurement_probability_in = measurement_uncertainty[0]
         self.measurement_probability_out = measurement_uncertainty[1]
 
+        # Measurement model used to weight the particles, window counting unless set_measurement_model is called.
+        self.measurement_model = MeasurementModels.WINDOW_COUNTING
+        self.distance_sigma = 10
+        self.max_distance = 50
+        self.row_line_gain = 20
+
+        # Culling of the expected plants of each particle: region of interest, minimal apparent size, number of
+        # plants per row and number of rows (see set_plant_enumeration)
+        self.plant_roi = None
+        self.plant_min_scale = 0
+        self.plant_row_budget = None
+        self.plant_max_rows = DEFAULT_MAX_ROWS
+
+        # Region of interest of the measurement, computed from the particle cloud (see set_region_of_interest)
+        self.region_of_interest = None
+
+        # Lattice of each particle for the distance transform model and the states they stand for, kept from one
+        # update to the next by the SIR filters (see propagate_lattices)
+        self.lattices = None
+        self.lattice_states = None
+
+        # Per-frame precomputation of the measurement (integral image for the window counting model, distance map for
+        # the distance transform model, line integrals for the row line model)
+        self.plant_mask = None
+        self.integral_image = None
+        self.distance_map = None
+        self.row_line_accumulator = None
+
+        # Precision of the vectorized paths, double unless set_precision is called.
+        self.precision = PrecisionModes.DOUBLE
+        self.float_dtype = np.float64
+        self.coordinate_dtype = np.int64
+
+        # Backend of the batched kernels, Numba when it is installed unless set_kernel_backend is called.
+        self.kernel_backend = resolve_backend(None)
+
+        # Particle by particle in the SIR filters and batched in the others, unless set_execution_backend is called.
+        self.execution_backend = None
+
+    @property
+    def particles(self):
+        """
+        (weight, state)-lists of the particles. After an update in a workspace (see get_workspace), they are built
+        from the arrays of the workspace on the first access. From then on they hold the particles: the workspace is
+        reloaded from them before the next update, so that they can still be modified in place.
+        """
+        if self._particles is None:
+            self._particles = self.workspace.get_particles()
+            self.workspace.loaded = False
+        return self._particles
+
+    @particles.setter
+    def particles(self, particles):
+        self._particles = particles
+        if self.workspace is not None:
+            self.workspace.loaded = False
+
+    def get_workspace(self):
+        """
+        Returns the workspace of the filter holding the current particles, allocated on the first call and when the
+        number of particles or the precision change.
+        """
+        if self.workspace is None or not self.workspace.matches(self.n_particles, self.float_dtype):
+            particles = self.particles
+            self.workspace = ParticleWorkspace(self.n_particles, self.process_noise, self.float_dtype,
+                                               self.state_dimension)
+            self._particles = particles
+
+        if not self.workspace.loaded:
+            self.workspace.load(self._particles)
+
+        return self.workspace
+
+    def set_particles_from_workspace(self):
+        """
+        To be called after updating the particles in the workspace: the workspace holds the particles from then on.
+        """
+        self._particles = None
+
+    def set_measurement_model(self, measurement_model, distance_sigma=10, max_distance=50, row_line_gain=20):
+        """
+        Selects the measurement model used to weight the particles.
+
+        :param measurement_model: One of MeasurementModels.
+        :param distance_sigma: Distance transform model: mean distance (in pixels) at which the likelihood has
+        decreased by a factor exp(-1/2).
+        :param max_distance: Distance transform model: truncation of the distance of each expected plant.
+        :param row_line_gain: Row line model: the likelihood is exp(row_line_gain * plant pixel density of the rows).
+        """
+        self.measurement_model = measurement_model
+        self.distance_sigma = distance_sigma
+        self.max_distance = max_distance
+        self.row_line_gain = row_line_gain
+
+    def set_precision(self, precision):
+        """
+        Selects the numerical precision of the vectorized paths. In single precision, the states are propagated and
+        the lattices are computed in float32, and the plant coordinates are int16 (or int32 on very large images).
+        The likelihoods always count pixels as int32, and the weights stay float64.
+
+        :param precision: One of PrecisionModes.
+        """
+        self.precision = precision
+        self.float_dtype = get_float_dtype(precision)
+        self.coordinate_dtype = get_coordinate_dtype(precision, self.world.width, self.world.height)
+
+    def set_kernel_backend(self, backend):
+        """
+        Selects the backend of the kernels that score all the particles at once.
+
+        :param backend: One of KernelBackends, falls back to NumPy when Numba is requested but not installed.
+        """
+        self.kernel_backend = resolve_backend(backend)
+
+    def set_execution_backend(self, backend):
+        """
+        Selects how the likelihoods of the particles are computed: one particle after the other, or all at once by
+        the NumPy or the Numba kernels. Applies to every filter.
+
+        :param backend: One of ExecutionBackends.
+        """
+        self.execution_backend = backend
+        self.kernel_backend = resolve_backend(get_kernel_backend(backend))
+
+    def is_batched(self):
+        """
+        Whether the SIR filters compute the likelihoods of all the particles at once.
+        """
+        return self.execution_backend is ExecutionBackends.VECTORIZED \
+            or self.execution_backend is ExecutionBackends.PARALLEL
+
     def initialize_particles_uniform(self):
         # Initialize particles with uniform weight distribution
         self.particles = []
@@ -66,6 +218,50 @@ class ParticleFilter:
 
         print("Initial particles position value :")
 
+    def initialize_particles_from_measurement(self, measurement, nb_hypotheses=3, spread=0.02):
+        """
+        Data-driven initialization: the row structure (vanishing point and inter-row) is estimated from the first
+        measurement and the particles are seeded around the best hypotheses, in proportion to their score. The
+        position and the inter-plant distance, which the row structure doesn't tell, are drawn uniformly.
+        Falls back to initialize_particles_uniform when no hypothesis is found.
+
+        :param measurement: First measurement image.
+        :param nb_hypotheses: Maximal number of row structure hypotheses the particles are seeded around.
+        :param spread: Standard deviation of the particles around their hypothesis, as a fraction of the limits of
+        the offset, inter-row, skew and convergence.
+        """
+        if self.row_line_accumulator is None:
+            self.row_line_accumulator = RowLineAccumulator(self.world.width, self.world.height)
+        self.row_line_accumulator.compute(get_plant_mask(measurement))
+
+        hypotheses = find_field_hypotheses(self.row_line_accumulator, self.inter_row_min, self.inter_row_max,
+                                           self.position_min, nb_hypotheses=nb_hypotheses)
+        if len(hypotheses) == 0:
+            print("Initialization: no row structure found in the measurement, particles are selected uniformly.")
+            self.initialize_particles_uniform()
+            return
+
+        # Number of particles seeded around each hypothesis
+        scores = np.asarray([hypothesis.score for hypothesis in hypotheses])
+        counts = np.floor(self.n_particles * scores / np.sum(scores)).astype(int)
+        counts[0] += self.n_particles - np.sum(counts)
+
+        spreads = spread * np.asarray([self.offset_max - self.offset_min, 0, 0, self.inter_row_max - self.inter_row_min,
+                                       self.skew_max - self.skew_min, self.convergence_max - self.convergence_min])
+
+        self.particles = []
+        weight = 1.0 / self.n_particles
+        for hypothesis, count in zip(hypotheses, counts):
+            for i in range(count):
+                position = np.random.uniform(self.position_min, self.position_max, 1)[0]
+                inter_plant = np.random.uniform(self.inter_plant_min, self.inter_plant_max, 1)[0]
+                state = hypothesis.get_state(position, inter_plant, self.offset_min, self.offset_max,
+                                             self.world.height)
+                state = list(np.asarray(state) + np.random.normal(0, 1, self.state_dimension) * spreads)
+
+                # Add particle
+                self.particles.append([weight, self.validate_state(state)])
+
     def validate_state(self, state):
         # Make sure state does not exceed allowed limits
 
@@ -113,10 +309,44 @@ class ParticleFilter:
 
         return state
 
+    def validate_states(self, states):
+        """
+        Vectorized validate_state: clips in place the inter-plant, inter-row, skew and convergence of an (N, 6) array
+        of states to their limits.
+        """
+        np.clip(states[:, 2], self.inter_plant_min, self.inter_plant_max, out=states[:, 2])
+        np.clip(states[:, 3], self.inter_row_min, self.inter_row_max, out=states[:, 3])
+        np.clip(states[:, 4], self.skew_min, self.skew_max, out=states[:, 4])
+        np.clip(states[:, 5], self.convergence_min, self.convergence_max, out=states[:, 5])
+
+        return states
+
+    def get_states(self):
+        """
+        Returns the states of the particles as an (N, 6) array of the precision's float dtype and their weights as an
+        (N,) float64 array.
+        """
+        if self._particles is None:
+            return self.workspace.states.copy(), self.workspace.weights.copy()
+
+        weights = np.asarray([weighted_sample[0] for weighted_sample in self.particles], dtype=np.float64)
+        states = np.asarray([weighted_sample[1] for weighted_sample in self.particles], dtype=self.float_dtype)
+
+        return states.reshape(len(weights), self.state_dimension), weights
+
+    def set_states(self, states, weights):
+        """
+        Sets the (weight, state)-lists of the particles from an (N, 6) array of states and an (N,) array of weights.
+        """
+        self.particles = [[weights[i], states[i].tolist()] for i in range(len(weights))]
+
     def get_average_state(self):
         """
         Compute average state according to all weighted particles
         """
+        if self._particles is None:
+            weights = self.workspace.weights
+            return (weights @ self.workspace.states.astype(np.float64) / np.sum(weights)).tolist()
 
         # Compute sum of all weights
         sum_weights = 0.0
@@ -146,6 +376,8 @@ class ParticleFilter:
 
         :return: Maximum particle weight
         """
+        if self._particles is None:
+            return float(np.max(self.workspace.weights))
         return max([weighted_sample[0] for weighted_sample in self.particles])
 
     def print_particles(self):
@@ -235,6 +467,90 @@ class ParticleFilter:
 
         return self.validate_state(propagated_sample)
 
+    def propagate_samples(self, states, motion_move_distance, add_noise=True):
+        """
+        Vectorized propagate_sample: propagates an (N, 6) array of states with the same motion model.
+
+        :param states: States to propagate, not modified.
+        :param motion_move_distance: Forward motion of the plants.
+        :param add_noise: Whether to add the process noise, without it the mean propagated states are returned.
+        :return: (N, 6) array of propagated states, of the precision's float dtype.
+        """
+        n = len(states)
+        states = np.asarray(states, dtype=self.float_dtype)
+        if add_noise:
+            noise = (np.random.normal(0, 1, (n, 6)) * np.asarray(self.process_noise)).astype(self.float_dtype)
+        else:
+            noise = np.zeros((n, 6), self.float_dtype)
+
+        skews = states[:, 4]
+        propagated = np.empty_like(states)
+
+        # 1. Parameters that are not supposed to be modified
+        propagated[:, 2:] = states[:, 2:] + noise[:, 2:]
+
+        # 2. Parameters that are supposed to be modified
+        move_distance = motion_move_distance + noise[:, 1]
+        position = states[:, 1] + move_distance * np.cos(skews)
+
+        # Particular plants leaving the position limits are moved back of an inter-plant distance.
+        moved_back = position > self.position_max
+        move_distance[moved_back] -= states[moved_back, 2]
+        position[moved_back] = states[moved_back, 1] + move_distance[moved_back] * np.cos(skews[moved_back])
+
+        propagated[:, 0] = states[:, 0] - move_distance * np.sin(skews) + noise[:, 0]
+        propagated[:, 1] = position
+
+        return self.validate_states(propagated)
+
+    def propagate_samples_in_place(self, workspace, motion_move_distance):
+        """
+        propagate_samples from the states of a workspace to its next states, in place in its arrays.
+        """
+        states, propagated = workspace.states, workspace.next_states
+        noise = workspace.draw_normal(workspace.noise)
+        noise *= workspace.process_noise
+
+        cosines = np.cos(states[:, 4], out=workspace.cosines)
+        sines = np.sin(states[:, 4], out=workspace.sines)
+
+        # 1. Parameters that are not supposed to be modified
+        np.add(states[:, 2:], noise[:, 2:], out=propagated[:, 2:])
+
+        # 2. Parameters that are supposed to be modified
+        move_distance = np.add(noise[:, 1], motion_move_distance, out=workspace.move_distances)
+        position = np.multiply(move_distance, cosines, out=propagated[:, 1])
+        position += states[:, 1]
+
+        # Particular plants leaving the position limits are moved back of an inter-plant distance.
+        moved_back = np.greater(position, self.position_max, out=workspace.moved_back)
+        np.subtract(move_distance, states[:, 2], out=move_distance, where=moved_back)
+        np.multiply(move_distance, cosines, out=position, where=moved_back)
+        np.add(position, states[:, 1], out=position, where=moved_back)
+
+        np.multiply(move_distance, sines, out=sines)
+        np.subtract(states[:, 0], sines, out=propagated[:, 0])
+        propagated[:, 0] += noise[:, 0]
+
+        return self.validate_states(propagated)
+
+    @staticmethod
+    def normalize_weights_in_place(weights):
+        """
+        normalize_weights for an array of weights.
+        """
+        sum_weights = np.sum(weights)
+
+        # Check if weights are non-zero
+        if sum_weights < 1e-15:
+            print("Weight normalization failed: sum of all weights is {} (weights will be reinitialized)".format(
+                sum_weights))
+            weights.fill(1.0 / len(weights))
+            return weights
+
+        weights /= sum_weights
+        return weights
+
     # This method of computing the likelihood is not the one used.
     def compute_likelihood_1(self, sample, measurement, plant_size):
         """
@@ -244,7 +560,7 @@ class ParticleFilter:
         particle, we look at the pixels in the measurement image located around (size of the plant) this position.
         """
         # Expected plant positions assuming the current particle state
-        particle = Particle(self.world, sample[0], sample[1], sample[2], sample[3], sample[4], sample[5])
+        particle = self.get_particle(sample)
         expected_plant_positions = particle.get_all_plants()
 
         if expected_plant_positions == -1:
@@ -335,7 +651,7 @@ class ParticleFilter:
             return
 
         # Expected plant positions assuming the current particle state
-        particle = Particle(self.world, sample[0], sample[1], sample[2], sample[3], sample[4], sample[5])
+        particle = self.get_particle(sample)
         expected_plant_positions = particle.get_all_plants()
 
         if expected_plant_positions == -1:
@@ -428,6 +744,293 @@ class ParticleFilter:
                                                                                                    nb_out))
             return likelihood_sample
 
+    def set_plant_enumeration(self, roi=None, min_scale=0, row_budget=None, max_rows=DEFAULT_MAX_ROWS):
+        """
+        Limits the expected plants enumerated for each particle. On large frames, the many small far plants would
+        otherwise dominate the cost of a particle while carrying little information.
+
+        :param roi: Region of interest (x_min, y_min, x_max, y_max), None for the whole image.
+        :param min_scale: Minimal apparent size of a plant relative to the bottom plants.
+        :param row_budget: Maximal number of plants per row, the nearest ones are kept.
+        :param max_rows: Maximal number of rows of a particle, the rows nearest to the particular plant are kept. It
+        bounds the cost of the particles with a tiny inter-row distance.
+        """
+        self.plant_roi = roi
+        self.plant_min_scale = min_scale
+        self.plant_row_budget = row_budget
+        self.plant_max_rows = max_rows
+
+    def set_region_of_interest(self, enabled=True, margin=30):
+        """
+        With a region of interest, the distance transform model only crops and binarizes the part of each frame
+        where the previous particle cloud expects plants (plus a margin covering the motion between frames).
+
+        :param enabled: Whether to use a region of interest.
+        :param margin: Margin (in pixels) around the expected plants of all the particles.
+        """
+        self.region_of_interest = RegionOfInterest(self.world.width, self.world.height, margin) if enabled else None
+
+    def update_region_of_interest(self):
+        """
+        Sets the region of interest to the extent of the expected plants of all the particles. The plants of a row are
+        between its bottom plant and the height where the inter-plant distance gets smaller than the minimal one of
+        the lattices (see PlantLattice.materialize), the extent is computed for all the particles at once.
+        """
+        states, _ = self.get_states()
+        if len(states) == 0:
+            self.region_of_interest.reset()
+            return
+
+        states = states.astype(np.float64)
+        position = states[:, 1]
+        nb_left_plants, nb_right_plants = get_bottom_plant_counts(states, self.world.width, self.world.height,
+                                                                  self.plant_max_rows)
+        row_indexes, rows = get_row_indexes(nb_left_plants, nb_right_plants)
+        bottom_plants = get_bottom_plants(states, row_indexes)
+        vanishing_points, _ = get_vanishing_points(states)
+        vanishing_point_y = vanishing_points[:, 1]
+
+        # Height of the inter-plant distance min_ip: ip(y) = inter-plant (vp_y - y) / (vp_y - height). The last plant
+        # of a row can be one inter-plant distance above it.
+        bottom_ips = get_inter_plant_distances(states, position, vanishing_points, self.world.height)
+        min_ips = np.maximum(DEFAULT_MIN_IP, self.plant_min_scale * bottom_ips)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            top = vanishing_point_y + min_ips * (self.world.height - vanishing_point_y) / states[:, 2] - min_ips
+        lowest_top = np.maximum(vanishing_point_y, 0)
+        top = np.minimum(np.where(np.isfinite(top), np.maximum(top, lowest_top), lowest_top), position)
+
+        # Points of the rows at that height
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fractions = np.nan_to_num((position - top) / (position - vanishing_point_y), nan=0, posinf=0, neginf=0)
+        top_plants = bottom_plants + (vanishing_points[:, np.newaxis, :] - bottom_plants) \
+            * fractions[:, np.newaxis, np.newaxis]
+
+        points = np.concatenate((bottom_plants[rows], top_plants[rows]))
+        points = points[np.all(np.isfinite(points), axis=1)]
+        if self.plant_roi is not None:
+            x_min, y_min, x_max, y_max = self.plant_roi
+            points = np.column_stack((np.clip(points[:, 0], x_min, x_max), np.clip(points[:, 1], y_min, y_max)))
+
+        self.region_of_interest.set_from_points(points)
+
+    def get_particle(self, sample):
+        """
+        Returns the Particle of a state, without validation and with the selected maximal number of rows.
+        """
+        return Particle(self.world, sample[0], sample[1], sample[2], sample[3], sample[4], sample[5], validate=False,
+                        max_rows=self.plant_max_rows)
+
+    def get_lattice(self, sample):
+        """
+        Returns the PlantLattice of a state, computed with the selected precision and maximal number of rows.
+        """
+        return PlantLattice.from_state(self.world, sample, float_dtype=self.float_dtype,
+                                       coordinate_dtype=self.coordinate_dtype, max_rows=self.plant_max_rows)
+
+    def keeps_lattices(self):
+        """
+        Whether the lattices of the particles are kept from one update to the next: only the distance transform model
+        enumerates the plants of the lattices.
+        """
+        return self.measurement_model is MeasurementModels.DISTANCE_TRANSFORM
+
+    def get_lattices(self, states):
+        """
+        Returns the PlantLattices of an (N, 6) array of states, built for all the states at once.
+        """
+        return PlantLattice.from_states(self.world, states, float_dtype=self.float_dtype,
+                                        coordinate_dtype=self.coordinate_dtype, max_rows=self.plant_max_rows)
+
+    def propagate_lattices(self, propagated_states):
+        """
+        Keeps the lattice of each particle up to date with its propagated state: the kept lattices are set to the
+        propagated states (see PlantLattice.set_states), so that they are the lattices of these states.
+
+        :param propagated_states: (N, 6) propagated states, the lattices stand for them afterwards.
+        """
+        propagated_states = np.array(propagated_states, dtype=np.float64).reshape(-1, self.state_dimension)
+        if self.lattices is not None and len(self.lattices) == len(propagated_states):
+            PlantLattice.set_states(self.lattices, propagated_states)
+        else:
+            self.lattices = self.get_lattices(propagated_states)
+
+        self.lattice_states = propagated_states
+
+    def resample_lattices(self, indexes):
+        """
+        Lattices of the resampled particles: the lattice of each selected particle is copied, so that the copies are
+        set to their propagated states independently.
+        """
+        if self.lattices is None:
+            return
+
+        self.lattices = [copy.copy(self.lattices[i]) for i in indexes]
+        self.lattice_states = self.lattice_states[indexes]
+
+    def get_kept_lattices(self, states):
+        """
+        Returns the kept lattices if they are the lattices of the given (N, 6) states, None otherwise.
+        """
+        if self.lattices is None or len(self.lattices) != len(states) \
+                or not np.array_equal(self.lattice_states, np.asarray(states, dtype=np.float64)):
+            return None
+
+        return self.lattices
+
+    def get_samples_bottom_plants(self, states):
+        """
+        Returns the bottom plants of an (N, 6) array of states as a (K, 2) array, the plants of particle n being
+        plants[plant_offsets[n]:plant_offsets[n + 1]], and the (N + 1,) plant offsets. The rows are counted
+        analytically for all the particles at once (see simulator.geometry).
+        """
+        nb_left_plants, nb_right_plants = get_bottom_plant_counts(states, self.world.width, self.world.height,
+                                                                  self.plant_max_rows)
+        row_indexes, rows = get_row_indexes(nb_left_plants, nb_right_plants)
+        plants = get_bottom_plants(states, row_indexes)[rows]
+        plant_offsets = np.concatenate(([0], np.cumsum(nb_left_plants + nb_right_plants + 1)))
+
+        return plants, plant_offsets
+
+    def compute_likelihood_window_counting(self, sample, plant_size, area_size):
+        """
+        Vectorized compute_likelihood: the pixels of the windows are counted with the integral image of the current
+        measurement instead of being visited one by one. Requires prepare_measurement to have been called.
+        """
+        # Checking that Area size > plant size.
+        if area_size <= plant_size:
+            print("Error area size <= plant size")
+            return 0
+
+        # Expected plant positions assuming the current particle state: the bottom plants, which are the plants
+        # Particle.get_all_plants returns to compute_likelihood
+        plants, _ = self.get_samples_bottom_plants(np.asarray(sample, dtype=self.float_dtype))
+        expected_plant_positions = np.floor(plants)
+
+        return compute_window_counting_likelihood(self.integral_image,
+                                                  expected_plant_positions.astype(self.coordinate_dtype),
+                                                  plant_size, area_size, self.measurement_probability_in,
+                                                  self.measurement_probability_out)
+
+    def compute_samples_likelihoods_window_counting(self, states, plant_size, area_size, out=None):
+        """
+        Batched compute_likelihood_window_counting: the expected plants of all the particles are scored by
+        score_bottom_windows with the selected kernel backend.
+
+        :param out: (N,) float64 array the likelihoods are written to, a new array if None.
+        """
+        return score_bottom_windows(self.integral_image, np.asarray(states, dtype=self.float_dtype), self.world.width,
+                                    self.world.height, self.plant_max_rows, plant_size, area_size,
+                                    self.measurement_probability_in, self.measurement_probability_out,
+                                    self.kernel_backend, out, self.coordinate_dtype)
+
+    def compute_likelihood_distance_transform(self, sample, lattice=None):
+        """
+        Compute likelihood p(z|sample) using the distance map of the current measurement: the closer the expected
+        plants are to measured plants, the higher the likelihood. Requires prepare_measurement to have been called.
+
+        :param lattice: Kept lattice of the particle (see propagate_lattices), built from the sample if None.
+        """
+        if lattice is None:
+            lattice = self.get_lattice(sample)
+        expected_plant_positions = lattice.materialize(self.plant_roi, self.plant_min_scale, self.plant_row_budget)
+
+        origin = (0, 0) if self.region_of_interest is None else self.region_of_interest.get_origin()
+
+        return compute_distance_likelihood(self.distance_map, expected_plant_positions, self.distance_sigma,
+                                           self.max_distance, origin, (self.world.width, self.world.height))
+
+    def compute_likelihood_row_line(self, sample):
+        """
+        Compute likelihood p(z|sample) from the plant pixels measured along the rows of the particle only. The rows
+        don't depend on the position of the plants along them, so inter-plant distance is not evaluated. Requires
+        prepare_measurement to have been called.
+        """
+        nb_left_plants, nb_right_plants = get_bottom_plant_counts(sample, self.world.width, self.world.height,
+                                                                  self.plant_max_rows)
+        row_indexes, _ = get_row_indexes(nb_left_plants, nb_right_plants)
+
+        return compute_row_line_likelihood(self.row_line_accumulator, get_bottom_plants(sample, row_indexes)[0],
+                                           get_top_crossing_points(sample, row_indexes)[0], self.row_line_gain)
+
+    def prepare_measurement(self, measurement, measurement_model=None):
+        """
+        Per-frame precomputation shared by the likelihood of every particle. Must be called once per measurement,
+        before compute_sample_likelihood.
+
+        :param measurement_model: Model to prepare, the selected measurement model by default.
+        """
+        if measurement_model is None:
+            measurement_model = self.measurement_model
+
+        if measurement_model is MeasurementModels.WINDOW_COUNTING:
+            # The mask and the integral image of the previous frame are overwritten when the frame has the same size
+            if self.plant_mask is None or self.plant_mask.shape != measurement.shape[:2]:
+                self.plant_mask = np.zeros(measurement.shape[:2], bool)
+                self.integral_image = None
+            self.integral_image = compute_integral_image(get_plant_mask(measurement, self.plant_mask),
+                                                         self.integral_image)
+
+        elif measurement_model is MeasurementModels.DISTANCE_TRANSFORM:
+            if self.region_of_interest is None:
+                self.distance_map = compute_distance_map(measurement)
+            else:
+                self.update_region_of_interest()
+                self.distance_map = compute_distance_map_from_mask(self.region_of_interest.crop(measurement))
+
+        elif measurement_model is MeasurementModels.ROW_LINE:
+            if self.row_line_accumulator is None:
+                self.row_line_accumulator = RowLineAccumulator(self.world.width, self.world.height)
+            self.row_line_accumulator.compute(get_plant_mask(measurement))
+
+    def compute_sample_likelihood(self, sample, measurement, plant_size, area_size, measurement_model=None,
+                                  lattice=None):
+        """
+        Compute likelihood p(z|sample) with the selected measurement model, or with the given one.
+
+        :param lattice: Kept lattice of the particle for the distance transform model, see propagate_lattices.
+        """
+        if measurement_model is None:
+            measurement_model = self.measurement_model
+
+        if measurement_model is MeasurementModels.DISTANCE_TRANSFORM:
+            return self.compute_likelihood_distance_transform(sample, lattice)
+
+        if measurement_model is MeasurementModels.ROW_LINE:
+            return self.compute_likelihood_row_line(sample)
+
+        return self.compute_likelihood_window_counting(sample, plant_size, area_size)
+
+    def compute_samples_likelihoods(self, states, measurement, plant_size, area_size, measurement_model=None,
+                                    out=None):
+        """
+        Likelihoods of an (N, 6) array of states, as an (N,) array. The window counting model scores all the
+        particles in one kernel call, except with the serial execution backend. The distance transform model uses the
+        kept lattices when they stand for the states.
+
+        :param out: (N,) float64 array the likelihoods are written to, a new array if None.
+        """
+        if measurement_model is None:
+            measurement_model = self.measurement_model
+
+        if measurement_model is MeasurementModels.WINDOW_COUNTING and area_size > plant_size \
+                and self.execution_backend is not ExecutionBackends.SERIAL:
+            return self.compute_samples_likelihoods_window_counting(states, plant_size, area_size, out)
+
+        lattices = [None] * len(states)
+        if measurement_model is MeasurementModels.DISTANCE_TRANSFORM:
+            lattices = self.get_kept_lattices(states)
+            if lattices is None:
+                lattices = self.get_lattices(states)
+
+        likelihoods = np.asarray([self.compute_sample_likelihood(state, measurement, plant_size, area_size,
+                                                                 measurement_model, lattice)
+                                  for state, lattice in zip(states, lattices)], dtype=np.float64)
+        if out is None:
+            return likelihoods
+
+        out[:] = likelihoods
+        return out
+
     @abstractmethod
     def update(self, plants_motion_move_distance, measurement, plant_size):
         """
@@ -0,0 +1,184 @@
+import numpy as np
+
+from .particle_filter_base import ParticleFilter
+from core.resampling.resampler import Resampler
+
+
+class ParticleFilterFactorized(ParticleFilter):
+    """
+    Rao-Blackwellized variant of the SIR particle filter. The particles only sample the row geometry (offset,
+    inter-plant, inter-row, skew and convergence) and each particle carries a posterior over the position of the
+    particular plant along its row, represented on a fixed 1-D grid. The position is handled exactly on the grid
+    (prediction by shifting the grid posterior, correction by the likelihood of each grid position), so the particles
+    only have to cover five dimensions instead of six.
+
+    The offset of a particle is the x coordinate of its row at the reference position position_max: the row does not
+    move in the image when the plants move along it, so the offset of the particular plant at any grid position is
+    derived from the skew.
+    """
+
+    def __init__(self,
+                 world,
+                 number_of_particles,
+                 limits,
+                 process_noise,
+                 measurement_noise,
+                 resampling_algorithm,
+                 grid_size=16):
+
+        # Initialize particle filter base class
+        ParticleFilter.__init__(self, world, number_of_particles, limits, process_noise, measurement_noise)
+
+        # Set SIR specific properties
+        self.resampling_algorithm = resampling_algorithm
+        self.resampler = Resampler()
+
+        # Position grid shared by every particle and per-particle posterior over it, shape (N, grid size)
+        self.position_grid = np.linspace(self.position_min, self.position_max, grid_size)
+        self.position_posteriors = np.full((number_of_particles, grid_size), 1.0 / grid_size)
+
+        # Geometry of each particle: offset at the reference position, inter-plant, inter-row, skew, convergence.
+        self.geometries = np.zeros((number_of_particles, 5))
+
+    def initialize_particles_uniform(self):
+        ParticleFilter.initialize_particles_uniform(self)
+        self.initialize_geometries()
+
+    def initialize_particles_from_measurement(self, measurement, nb_hypotheses=3, spread=0.02):
+        ParticleFilter.initialize_particles_from_measurement(self, measurement, nb_hypotheses, spread)
+        self.initialize_geometries()
+
+    def initialize_geometries(self):
+        """
+        Sets the geometries from the states of the initialized particles, with uniform position posteriors.
+        """
+        states, _ = self.get_states()
+        self.geometries = np.column_stack((self.get_reference_offsets(states[:, 0], states[:, 1], states[:, 4]),
+                                           states[:, 2:]))
+        self.position_posteriors = np.full((self.n_particles, len(self.position_grid)), 1.0 / len(self.position_grid))
+
+        self.update_particles_states()
+
+    def get_reference_offsets(self, offsets, positions, skews):
+        """
+        Returns the x coordinates at the reference position of the rows going through the given particular plants.
+        Moving along a row by dy changes x by -dy * tan(skew), see propagate_sample.
+        """
+        return offsets - (self.position_max - positions) * np.tan(skews)
+
+    def get_offsets(self, reference_offsets, positions, skews):
+        """
+        Inverse of get_reference_offsets: x coordinates of the particular plants at the given positions.
+        """
+        return reference_offsets + (self.position_max - positions) * np.tan(skews)
+
+    def needs_resampling(self):
+        """
+        The factorized filter resamples every time step, like the SIR filter.
+        """
+        return True
+
+    def propagate_geometries(self):
+        """
+        Motion model of the geometry: the rows are supposed to stay the same, with some additive zero mean Gaussian
+        noise on every parameter.
+        """
+        noise = np.random.normal(0, 1, self.geometries.shape) * np.asarray([self.process_noise[0],
+                                                                               self.process_noise[2],
+                                                                               self.process_noise[3],
+                                                                               self.process_noise[4],
+                                                                               self.process_noise[5]])
+        self.geometries += noise
+
+        # Validate inter-plant, inter-row, skew and convergence
+        self.geometries[:, 1] = np.clip(self.geometries[:, 1], self.inter_plant_min, self.inter_plant_max)
+        self.geometries[:, 2] = np.clip(self.geometries[:, 2], self.inter_row_min, self.inter_row_max)
+        self.geometries[:, 3] = np.clip(self.geometries[:, 3], self.skew_min, self.skew_max)
+        self.geometries[:, 4] = np.clip(self.geometries[:, 4], self.convergence_min, self.convergence_max)
+
+    def predict_positions(self, motion_move_distance):
+        """
+        Prediction of the position posteriors: every grid position moves down along the row by the move distance
+        (moved back by an inter-plant distance when leaving the position limits, as in propagate_sample) and is spread
+        by the position process noise.
+        """
+        skews = self.geometries[:, 3]
+        inter_plants = self.geometries[:, 1]
+
+        # Where each grid position of each particle moves to, shape (N, grid size)
+        moved = self.position_grid[np.newaxis, :] + motion_move_distance * np.cos(skews)[:, np.newaxis]
+        moved_back = moved - inter_plants[:, np.newaxis] * np.cos(skews)[:, np.newaxis]
+        moved = np.where(moved > self.position_max, moved_back, moved)
+
+        # Gaussian transition from each moved grid position to each grid position, shape (N, grid size, grid size)
+        grid_step = self.position_grid[1] - self.position_grid[0] if len(self.position_grid) > 1 else 1.0
+        std = max(self.process_noise[1], grid_step / 2)
+        transition = np.exp(-0.5 * np.square((self.position_grid[np.newaxis, np.newaxis, :]
+                                               - moved[:, :, np.newaxis]) / std))
+
+        predicted = np.einsum('ng,ngh->nh', self.position_posteriors, transition)
+        sums = predicted.sum(axis=1, keepdims=True)
+
+        # A particle whose positions all left the grid gets a uniform posterior.
+        self.position_posteriors = np.where(sums > 1e-300, predicted / np.maximum(sums, 1e-300),
+                                            1.0 / len(self.position_grid))
+
+    def compute_grid_likelihoods(self, measurement, plant_size, area_size):
+        """
+        Likelihood of every grid position of every particle, shape (N, grid size). The N * grid size states are scored
+        at once by compute_samples_likelihoods.
+        """
+        n, grid_size = self.position_posteriors.shape
+
+        # States of every grid position of every particle, shape (N, grid size, 6)
+        states = np.empty((n, grid_size, self.state_dimension), self.float_dtype)
+        states[:, :, 0] = self.get_offsets(self.geometries[:, 0, np.newaxis], self.position_grid[np.newaxis, :],
+                                           self.geometries[:, 3, np.newaxis])
+        states[:, :, 1] = self.position_grid[np.newaxis, :]
+        states[:, :, 2:] = self.geometries[:, np.newaxis, 1:]
+
+        likelihoods = self.compute_samples_likelihoods(states.reshape(n * grid_size, self.state_dimension),
+                                                       measurement, plant_size, area_size)
+
+        return likelihoods.reshape(n, grid_size)
+
+    def update_particles_states(self, weights=None):
+        """
+        Sets the (weight, state)-lists of the particles from the geometries and the position posteriors: the position
+        of a particle is the mean of its position posterior.
+        """
+        if weights is None:
+            weights = np.full(self.n_particles, 1.0 / self.n_particles)
+
+        positions = self.position_posteriors @ self.position_grid
+        offsets = self.get_offsets(self.geometries[:, 0], positions, self.geometries[:, 3])
+
+        states = np.column_stack((offsets, positions, self.geometries[:, 1:]))
+        self.particles = [[weights[i], states[i].tolist()] for i in range(self.n_particles)]
+
+    def update(self, plants_motion_move_distance, measurement, plant_size, area_size):
+        # Per-frame precomputation of the measurement model
+        self.prepare_measurement(measurement)
+
+        # Propagation of the geometry (sampled) and of the positions (on the grid)
+        self.propagate_geometries()
+        self.predict_positions(plants_motion_move_distance)
+
+        # Correction: the weight of a particle is the likelihood of its geometry marginalized over the positions
+        joint = self.position_posteriors * self.compute_grid_likelihoods(measurement, plant_size, area_size)
+        weights = joint.sum(axis=1)
+        normalized_joint = joint / np.maximum(weights, 1e-300)[:, np.newaxis]
+        self.position_posteriors = np.where(weights[:, np.newaxis] > 0, normalized_joint, self.position_posteriors)
+
+        self.update_particles_states(weights)
+        self.particles = self.normalize_weights(self.particles)
+
+        # Resample if needed: the indexes of the particles are resampled so that the geometries and the position
+        # posteriors are resampled together.
+        if self.needs_resampling():
+            indexes = self.resampler.resample_indexes([par[0] for par in self.particles], self.n_particles,
+                                                      self.resampling_algorithm)
+
+            self.geometries = self.geometries[indexes]
+            self.position_posteriors = self.position_posteriors[indexes]
+            self.update_particles_states()
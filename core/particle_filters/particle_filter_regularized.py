@@ -0,0 +1,73 @@
+import numpy as np
+
+from .particle_filter_sir import ParticleFilterSIR
+
+
+class ParticleFilterRegularized(ParticleFilterSIR):
+    """
+    Regularized particle filter (Musso, Oudjane and Le Gland, 2001). After resampling, the particles are moved by a
+    Gaussian kernel jitter scaled by the covariance of the particle cloud. The duplicated particles are spread around
+    their parent, which fights sample impoverishment without inflating the process noise.
+    """
+
+    def __init__(self,
+                 world,
+                 number_of_particles,
+                 limits,
+                 process_noise,
+                 measurement_noise,
+                 resampling_algorithm,
+                 bandwidth_factor=1.0):
+
+        # Initialize SIR particle filter
+        ParticleFilterSIR.__init__(self, world, number_of_particles, limits, process_noise, measurement_noise,
+                                   resampling_algorithm)
+
+        # Multiplies the optimal Gaussian kernel bandwidth, lower than 1 when the posterior is multimodal.
+        self.bandwidth_factor = bandwidth_factor
+
+    def get_optimal_bandwidth(self):
+        """
+        Optimal bandwidth of the Gaussian kernel for a Gaussian posterior: (4 / (N (d + 2)))^(1 / (d + 4)).
+        """
+        d = self.state_dimension
+        return np.power(4.0 / (self.n_particles * (d + 2)), 1.0 / (d + 4))
+
+    def regularize(self, resampled_states, states, weights):
+        """
+        Adds the kernel jitter to an (N, 6) array of resampled states, in place. The kernel is scaled by the weighted
+        covariance of the particle cloud before resampling (states, weights).
+        """
+        normalized_weights = weights / np.sum(weights)
+        deviations = states - normalized_weights @ states
+        covariance = (normalized_weights[:, np.newaxis] * deviations).T @ deviations
+        covariance += 1e-9 * np.eye(self.state_dimension)
+
+        # The covariance is only positive semi-definite when some parameter didn't vary.
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        square_root = eigenvectors * np.sqrt(np.maximum(eigenvalues, 0))
+
+        bandwidth = self.bandwidth_factor * self.get_optimal_bandwidth()
+        resampled_states += bandwidth * np.random.normal(0, 1, resampled_states.shape) @ square_root.T
+
+        return self.validate_states(resampled_states)
+
+    def update(self, plants_motion_move_distance, measurement, plant_size, area_size):
+        # Per-frame precomputation of the measurement model
+        self.prepare_measurement(measurement)
+
+        # Propagation and weighting of all the particles
+        states, weights = self.get_states()
+        propagated_states = self.propagate_samples(states, plants_motion_move_distance)
+        likelihoods = self.compute_samples_likelihoods(propagated_states, measurement, plant_size, area_size)
+
+        self.set_states(propagated_states, likelihoods)
+        self.particles = self.normalize_weights(self.particles)
+
+        # Resample then regularize
+        if self.needs_resampling():
+            states, weights = self.get_states()
+            indexes = self.resampler.resample_indexes(weights, self.n_particles, self.resampling_algorithm)
+
+            resampled_states = self.regularize(states[indexes], states, weights)
+            self.set_states(resampled_states, np.full(self.n_particles, 1.0 / self.n_particles))
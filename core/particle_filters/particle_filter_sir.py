@@ -1,3 +1,5 @@
+import numpy as np
+
 from .particle_filter_base import ParticleFilter
 from core.resampling.resampler import Resampler
 
@@ -33,14 +35,47 @@ class ParticleFilterSIR(ParticleFilter):
         return True
 
     def update(self, plants_motion_move_distance, measurement, plant_size, area_size):
+        # Per-frame precomputation of the measurement model
+        self.prepare_measurement(measurement)
+
+        # Batched execution: every particle is propagated, weighted and resampled at once, in the workspace
+        if self.is_batched():
+            workspace = self.get_workspace()
+            self.propagate_samples_in_place(workspace, plants_motion_move_distance)
+            if self.keeps_lattices():
+                self.propagate_lattices(workspace.next_states)
+            workspace.swap()
+            self.compute_samples_likelihoods(workspace.states, measurement, plant_size, area_size,
+                                             out=workspace.weights)
+
+            print("Particles before weight normalization.")
+            self.normalize_weights_in_place(workspace.weights)
+
+            if self.needs_resampling():
+                self.resampler.resample_indexes_in_place(workspace, self.resampling_algorithm, self.kernel_backend)
+                np.take(workspace.states, workspace.indexes, axis=0, out=workspace.next_states)
+                workspace.swap()
+                self.resample_lattices(workspace.indexes)
+                workspace.weights.fill(1.0 / self.n_particles)
+
+            self.set_particles_from_workspace()
+            return
+
+        # Propagate the particle states according to the current particle0
+        propagated_states = [self.propagate_sample(par[1], plants_motion_move_distance) for par in self.particles]
+
+        # Lattices of the distance transform model, set to the propagated states
+        lattices = [None] * len(propagated_states)
+        if self.keeps_lattices():
+            self.propagate_lattices(propagated_states)
+            lattices = self.lattices
+
         # Loop over all particles
         new_particles = []
-        for par in self.particles:
-            # Propagate the particle state according to the current particle0
-            propagated_state = self.propagate_sample(par[1], plants_motion_move_distance)
-
+        for propagated_state, lattice in zip(propagated_states, lattices):
             # Compute current particle's weight
-            weight = self.compute_likelihood(propagated_state, measurement, plant_size, area_size)
+            weight = self.compute_sample_likelihood(propagated_state, measurement, plant_size, area_size,
+                                                    lattice=lattice)
 
             # Store
             new_particles.append([weight, propagated_state])
@@ -52,4 +87,11 @@ class ParticleFilterSIR(ParticleFilter):
 
         # Resample if needed
         if self.needs_resampling():
-            self.particles = self.resampler.resample(self.particles, self.n_particles, self.resampling_algorithm)
+            if self.keeps_lattices():
+                # The indexes are resampled so that the lattices follow their particles
+                indexes = self.resampler.resample_indexes([par[0] for par in self.particles], self.n_particles,
+                                                          self.resampling_algorithm)
+                self.particles = [[1.0 / self.n_particles, list(self.particles[i][1])] for i in indexes]
+                self.resample_lattices(indexes)
+            else:
+                self.particles = self.resampler.resample(self.particles, self.n_particles, self.resampling_algorithm)
@@ -0,0 +1,99 @@
+import numpy as np
+
+
+class ParticleWorkspace:
+    """
+    Arrays of a particle filter allocated once and reused at every update: double buffered states, weights,
+    likelihoods, resampling indexes and the scratch arrays of the propagation and of the resampling. The steady-state
+    updates work in place in them (out= operations), so that they don't allocate memory proportional to the number
+    of particles.
+
+    While the filter updates the workspace, the workspace holds the particles: the (weight, state)-lists of the filter
+    are only built when they are read (see ParticleFilter.particles).
+    """
+
+    def __init__(self, number_of_particles, process_noise, float_dtype=np.float64, state_dimension=6):
+        """
+        :param number_of_particles: Number of particles.
+        :param process_noise: Standard deviations of the process noise of each state parameter.
+        :param float_dtype: Dtype of the states.
+        :param state_dimension: Dimension of the states.
+        """
+        n = number_of_particles
+        self.n_particles = n
+        self.float_dtype = float_dtype
+
+        # States of the particles and the states being computed from them, swapped after each step
+        self.state_buffers = np.zeros((2, n, state_dimension), float_dtype)
+        self.current = 0
+
+        self.weights = np.full(n, 1.0 / max(n, 1))
+        self.likelihoods = np.zeros(n)
+
+        # Propagation: noise, move distances, cosines and sines of the skews, and mask of the particular plants moved
+        # back of an inter-plant distance
+        self.process_noise = np.asarray(process_noise, float_dtype)
+        self.noise = np.zeros((n, state_dimension), float_dtype)
+        self.move_distances = np.zeros(n, float_dtype)
+        self.cosines = np.zeros(n, float_dtype)
+        self.sines = np.zeros(n, float_dtype)
+        self.moved_back = np.zeros(n, bool)
+
+        # Resampling: cumulative weights, uniform draws, residual weights and indexes of the resampled particles
+        self.cumulative_weights = np.zeros(n)
+        self.uniforms = np.zeros(n)
+        self.residual_weights = np.zeros(n)
+        self.steps = np.arange(n, dtype=np.float64)
+        self.indexes = np.zeros(n, np.intp)
+
+        # Random draws written in place, seeded from the global NumPy generator so that np.random.seed still makes the
+        # runs reproducible
+        self.random_generator = np.random.default_rng(np.random.randint(0, 2 ** 31 - 1))
+
+        # Whether the arrays hold the current particles, False until load is called
+        self.loaded = False
+
+    def matches(self, number_of_particles, float_dtype):
+        return self.n_particles == number_of_particles and self.float_dtype == float_dtype
+
+    @property
+    def states(self):
+        return self.state_buffers[self.current]
+
+    @property
+    def next_states(self):
+        return self.state_buffers[1 - self.current]
+
+    def swap(self):
+        """
+        The next states become the states of the particles.
+        """
+        self.current = 1 - self.current
+
+    def load(self, particles):
+        """
+        Copies the (weight, state)-lists of the particles in the arrays.
+        """
+        for i, weighted_sample in enumerate(particles):
+            self.weights[i] = weighted_sample[0]
+            self.states[i] = weighted_sample[1]
+        self.loaded = True
+
+    def get_particles(self):
+        """
+        Returns the (weight, state)-lists of the particles.
+        """
+        return [[float(weight), state] for weight, state in zip(self.weights, self.states.tolist())]
+
+    def draw_normal(self, out):
+        return self.random_generator.standard_normal(dtype=out.dtype, out=out)
+
+    def draw_uniform(self, out, low=0.0, high=1.0):
+        """
+        Draws uniform values in [low, high) in place.
+        """
+        self.random_generator.random(out=out)
+        out *= high - low
+        out += low
+
+        return out
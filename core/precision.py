@@ -0,0 +1,29 @@
+from enum import Enum
+
+import numpy as np
+
+
+class PrecisionModes(Enum):
+    # float64 states and int64 plant coordinates.
+    DOUBLE = 1
+    # float32 states and lattices, int16 plant coordinates (int32 for images larger than 32767 pixels).
+    SINGLE = 2
+
+
+def get_float_dtype(precision):
+    """
+    Returns the dtype of the particle states and of the lattice computations for a precision mode.
+    """
+    return np.float32 if precision is PrecisionModes.SINGLE else np.float64
+
+
+def get_coordinate_dtype(precision, width, height):
+    """
+    Returns the smallest integer dtype of the plant coordinates for a precision mode. The plants outside the image can
+    have coordinates up to a few image sizes away, hence the margin.
+    """
+    if precision is not PrecisionModes.SINGLE:
+        return np.int64
+
+    return np.int16 if 4 * max(width, height) <= np.iinfo(np.int16).max else np.int32
+
@@ -0,0 +1 @@
+from .particle_recorder import ParticleRecorder, ParticleRecording
@@ -0,0 +1,211 @@
+import os
+import time
+import numpy as np
+
+
+# Dtype of the frame index: where each frame starts in the data files, how many particles it has and when it was
+# recorded.
+FRAME_INDEX_DTYPE = np.dtype([('offset', np.int64), ('count', np.int64), ('timestamp', np.float64)])
+
+
+def get_recording_paths(path):
+    """
+    Returns the paths of the three files of a recording: the states file, the weights file and the frame index file.
+    """
+    return path + ".states", path + ".weights", path + ".index.npy"
+
+
+class ParticleRecorder:
+    """
+    Binary append-only log of the particle clouds. Each recorded frame appends its (N, 6) states and (N,) weights to
+    two preallocated memory-mapped files that grow (by doubling) when they are full. A small index stores for each
+    frame its offset, its number of particles and its timestamp.
+    """
+
+    def __init__(self, path, initial_capacity=100000, state_dimension=6):
+        """
+        :param path: Base path of the recording, the extensions of the three files are added to it.
+        :param initial_capacity: Number of particles (rows) preallocated in the data files.
+        :param state_dimension: Number of parameters of a particle state.
+        """
+        self.path = path
+        self.states_path, self.weights_path, self.index_path = get_recording_paths(path)
+        self.state_dimension = state_dimension
+
+        # Number of particles (rows) that have been written and that can be written before growing the files.
+        self.size = 0
+        self.capacity = max(1, int(initial_capacity))
+
+        # Frame index, kept in memory and written to disk on flush.
+        self.frame_index = []
+
+        self.states = None
+        self.weights = None
+        self._allocate(self.capacity, mode='w+')
+
+    def _allocate(self, capacity, mode):
+        """
+        (Re)maps the data files with the given capacity. Mode 'w+' creates them, 'r+' keeps their content.
+        """
+        if mode == 'r+':
+            # Growing the files, the already written content is kept.
+            self.states.flush()
+            self.weights.flush()
+            del self.states
+            del self.weights
+            with open(self.states_path, 'r+b') as f:
+                f.truncate(capacity * self.state_dimension * np.dtype(np.float64).itemsize)
+            with open(self.weights_path, 'r+b') as f:
+                f.truncate(capacity * np.dtype(np.float64).itemsize)
+
+        self.states = np.memmap(self.states_path, dtype=np.float64, mode=mode,
+                                shape=(capacity, self.state_dimension))
+        self.weights = np.memmap(self.weights_path, dtype=np.float64, mode=mode, shape=(capacity,))
+        self.capacity = capacity
+
+    def record(self, particles, timestamp=None):
+        """
+        Appends a particle cloud to the recording.
+
+        :param particles: List of (weight, state)-lists, as stored in ParticleFilter.particles.
+        :param timestamp: Time of the frame, the current time is used if not given.
+        :return: Index of the recorded frame.
+        """
+        weights = np.asarray([weighted_sample[0] for weighted_sample in particles], dtype=np.float64)
+        states = np.asarray([weighted_sample[1] for weighted_sample in particles], dtype=np.float64)
+
+        return self.record_arrays(states.reshape(len(weights), self.state_dimension), weights, timestamp)
+
+    def record_arrays(self, states, weights, timestamp=None):
+        """
+        Appends a particle cloud given as arrays to the recording.
+
+        :param states: Array of shape (N, state_dimension).
+        :param weights: Array of shape (N,).
+        :param timestamp: Time of the frame, the current time is used if not given.
+        :return: Index of the recorded frame.
+        """
+        n = len(weights)
+        if states.shape != (n, self.state_dimension):
+            print("Particle recorder: states of shape {} don't match the {} weights.".format(states.shape, n))
+            return -1
+
+        # Doubling the capacity until the frame fits.
+        if self.size + n > self.capacity:
+            new_capacity = self.capacity
+            while self.size + n > new_capacity:
+                new_capacity *= 2
+            self._allocate(new_capacity, mode='r+')
+
+        self.states[self.size:self.size + n] = states
+        self.weights[self.size:self.size + n] = weights
+
+        if timestamp is None:
+            timestamp = time.time()
+        self.frame_index.append((self.size, n, timestamp))
+        self.size += n
+
+        return len(self.frame_index) - 1
+
+    def get_number_of_frames(self):
+        return len(self.frame_index)
+
+    def flush(self):
+        """
+        Writes the data files and the frame index to disk.
+        """
+        self.states.flush()
+        self.weights.flush()
+        np.save(self.index_path, np.asarray(self.frame_index, dtype=FRAME_INDEX_DTYPE))
+
+    def close(self):
+        """
+        Flushes the recording and trims the data files to the written size.
+        """
+        self.flush()
+        del self.states
+        del self.weights
+        self.states = None
+        self.weights = None
+
+        with open(self.states_path, 'r+b') as f:
+            f.truncate(self.size * self.state_dimension * np.dtype(np.float64).itemsize)
+        with open(self.weights_path, 'r+b') as f:
+            f.truncate(self.size * np.dtype(np.float64).itemsize)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ParticleRecording:
+    """
+    Read access to a recording written by ParticleRecorder. The returned arrays are views on the memory-mapped files,
+    no particle data is copied.
+    """
+
+    def __init__(self, path, state_dimension=6):
+        states_path, weights_path, index_path = get_recording_paths(path)
+        self.state_dimension = state_dimension
+
+        self.frame_index = np.load(index_path)
+        size = 0
+        if len(self.frame_index) > 0:
+            size = int(self.frame_index['offset'][-1] + self.frame_index['count'][-1])
+
+        # np.memmap can not map an empty file.
+        if size == 0 or os.path.getsize(states_path) == 0:
+            self.states = np.zeros((0, state_dimension), np.float64)
+            self.weights = np.zeros(0, np.float64)
+        else:
+            self.states = np.memmap(states_path, dtype=np.float64, mode='r', shape=(size, state_dimension))
+            self.weights = np.memmap(weights_path, dtype=np.float64, mode='r', shape=(size,))
+
+    def __len__(self):
+        return len(self.frame_index)
+
+    def get_timestamps(self):
+        return self.frame_index['timestamp']
+
+    def get_frame(self, i):
+        """
+        Returns the states (N, 6) and the weights (N,) of frame i.
+        """
+        offset = self.frame_index['offset'][i]
+        count = self.frame_index['count'][i]
+
+        return self.states[offset:offset + count], self.weights[offset:offset + count]
+
+    def get_frames(self, start, stop):
+        """
+        Returns the states and the weights of the frames start to stop (excluded) as two contiguous views, together
+        with the frame index of those frames. The offsets of the returned index are relative to the returned views.
+        """
+        frames = self.frame_index[start:stop].copy()
+        if len(frames) == 0:
+            return self.states[0:0], self.weights[0:0], frames
+
+        first = frames['offset'][0]
+        last = frames['offset'][-1] + frames['count'][-1]
+        frames['offset'] -= first
+
+        return self.states[first:last], self.weights[first:last], frames
+
+    def get_frames_array(self, start, stop):
+        """
+        Returns the states of the frames start to stop (excluded) as a (F, N, 6) array and their weights as a (F, N)
+        array. Only possible when every frame of the range has the same number of particles.
+        """
+        states, weights, frames = self.get_frames(start, stop)
+        if len(frames) == 0:
+            return states.reshape(0, 0, self.state_dimension), weights.reshape(0, 0)
+
+        n = frames['count'][0]
+        if np.any(frames['count'] != n):
+            print("Particle recording: the frames {} to {} don't have the same number of particles.".format(start,
+                                                                                                         stop))
+            return None
+
+        return states.reshape(len(frames), n, self.state_dimension), weights.reshape(len(frames), n)
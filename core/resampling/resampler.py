@@ -14,6 +14,9 @@ import copy
 # Helper functions
 from .resampling_helpers import *
 
+# Search of the cumulative weights written in place
+from core.kernels import search_sorted
+
 
 class ResamplingAlgorithms(Enum):
     MULTINOMIAL = 1
@@ -51,6 +54,80 @@ class Resampler:
 
         print("Resampling method {} is not specified!".format(algorithm))
 
+    def resample_indexes(self, weights, N, algorithm):
+        """
+        Resampling of the indexes of the samples instead of the samples themselves, for filters that keep their
+        particles in arrays.
+
+        :param weights: Weights of the samples.
+        :param N: Number of indexes that must be resampled.
+        :param algorithm: Preferred method used for resampling.
+        :return: List of N indexes.
+        """
+        weighted_indexes = self.resample([[weight, i] for i, weight in enumerate(weights)], N, algorithm)
+        return [weighted_index[1] for weighted_index in weighted_indexes]
+
+    def resample_indexes_in_place(self, workspace, algorithm, backend=None):
+        """
+        Resampling of the indexes of the particles of a ParticleWorkspace, from its normalized weights to its indexes,
+        in place in its arrays. Same draws as resample, the uniform values being drawn all at once. With the Numba
+        backend, nothing proportional to the number of particles is allocated.
+
+        :param workspace: ParticleWorkspace of the particles.
+        :param algorithm: Preferred method used for resampling.
+        :param backend: Backend of the search of the cumulative weights (see core.kernels.search_sorted).
+        :return: Indexes of the resampled particles (workspace.indexes).
+        """
+        weights = workspace.weights
+        N = len(weights)
+        Q = np.cumsum(weights, out=workspace.cumulative_weights)
+        u = workspace.uniforms
+        indexes = workspace.indexes
+
+        if algorithm is ResamplingAlgorithms.MULTINOMIAL:
+            workspace.draw_uniform(u, 1e-6, 1)
+            search_sorted(Q, u, indexes, backend=backend)
+
+        elif algorithm is ResamplingAlgorithms.RESIDUAL:
+            # Deterministic replication: particle m is present floor(N wm) times
+            replications = np.multiply(weights, N, out=workspace.residual_weights)
+            np.floor(replications, out=replications)
+            np.cumsum(replications, out=Q)
+            Nt = int(Q[-1])
+            search_sorted(Q, workspace.steps[:Nt], indexes[:Nt], right=True, backend=backend)
+
+            # Multinomial resampling of the remaining particles from the residual weights
+            if N != Nt:
+                residual_weights = replications
+                residual_weights *= -1.0 / N
+                residual_weights += weights
+                residual_weights *= float(N) / (N - Nt)
+                np.cumsum(residual_weights, out=Q)
+                workspace.draw_uniform(u[:N - Nt], 1e-6, 1)
+                search_sorted(Q, u[:N - Nt], indexes[Nt:], backend=backend)
+
+        elif algorithm is ResamplingAlgorithms.STRATIFIED:
+            Q /= Q[-1]
+            workspace.draw_uniform(workspace.residual_weights, 1e-10, 1.0 / N)
+            np.multiply(workspace.steps, 1.0 / N, out=u)
+            u += workspace.residual_weights
+            search_sorted(Q, u, indexes, backend=backend)
+
+        elif algorithm is ResamplingAlgorithms.SYSTEMATIC:
+            u0 = workspace.random_generator.uniform(1e-10, 1.0 / N)
+            np.multiply(workspace.steps, 1.0 / N, out=u)
+            u += u0
+            search_sorted(Q, u, indexes, backend=backend)
+
+        else:
+            print("Resampling method {} is not specified!".format(algorithm))
+            indexes[:] = np.arange(N)
+
+        # The last cumulative weight can be rounded below the last uniform value
+        np.minimum(indexes, N - 1, out=indexes)
+
+        return indexes
+
     @staticmethod
     def __multinomial(samples, N):
         """
@@ -0,0 +1,26 @@
+import importlib
+
+from .async_filter import AsyncParticleFilter, Estimate
+
+# The shared frames are imported on first access, so that python -m core.streaming.shared_frames runs the module as
+# __main__ without importing it a second time.
+_LAZY_NAMES = {
+    'SharedFrame': '.shared_frames',
+    'SharedFrameRing': '.shared_frames',
+    'run_simulated_producer': '.shared_frames',
+}
+
+__all__ = ['AsyncParticleFilter', 'Estimate'] + list(_LAZY_NAMES)
+
+
+def __getattr__(name):
+    if name not in _LAZY_NAMES:
+        raise AttributeError("module {} has no attribute {}".format(__name__, name))
+
+    value = getattr(importlib.import_module(_LAZY_NAMES[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,306 @@
+import asyncio
+import collections
+import concurrent.futures
+import time
+
+import numpy as np
+
+
+class Estimate:
+    """
+    Estimate of the row parameters after the update of a frame: weighted average state (offset, position,
+    inter-plant, inter-row, skew, convergence) and maximal weight of the particles. Frames coalesced into it were
+    never filtered, their motion was added to the motion of the frame.
+    """
+
+    def __init__(self, frame_id, state, max_weight, submitted_at, started_at, completed_at, nb_coalesced):
+        self.frame_id = frame_id
+        self.state = state
+        self.max_weight = max_weight
+        self.submitted_at = submitted_at
+        self.started_at = started_at
+        self.completed_at = completed_at
+        self.nb_coalesced = nb_coalesced
+
+    def get_latency(self):
+        """
+        Time from the submission of the frame to its estimate, in seconds.
+        """
+        return self.completed_at - self.submitted_at
+
+    def get_compute_time(self):
+        return self.completed_at - self.started_at
+
+
+class AsyncParticleFilter:
+    """
+    asyncio interface of a particle filter, for a service that receives the frames from a camera and returns the row
+    parameters. submit returns at once: the updates run one after the other in an executor, so that the event loop
+    never waits for the filter. When the filter lags, a frame waiting for its update is replaced by the newer one
+    (the motions of the replaced frames are added up), so the estimates stay as recent as possible. The estimates are
+    read with an async iterator:
+
+        async with AsyncParticleFilter(particle_filter, plant_size, area_size) as stream:
+            await stream.submit(frame, move_distance)
+            async for estimate in stream:
+                ...
+
+    The particle filter must only be used through the wrapper while it runs.
+    """
+
+    def __init__(self, particle_filter, plant_size, area_size, executor=None, coalesce=True, max_estimates=100,
+                 metrics_window=1000):
+        """
+        :param particle_filter: Particle filter with initialized particles.
+        :param plant_size: Plant size of the updates.
+        :param area_size: Area size of the updates.
+        :param executor: Executor of the updates, a single thread if None. The updates of a filter can't run in
+        parallel, more workers are useless.
+        :param coalesce: Whether a frame waiting for its update is replaced by a newer one. Without coalescing, every
+        frame is filtered and submit waits while a frame is already waiting.
+        :param max_estimates: Maximal number of estimates waiting to be read, the oldest ones are dropped.
+        :param metrics_window: Number of last frames the latency metrics are computed on.
+        """
+        self.particle_filter = particle_filter
+        self.plant_size = plant_size
+        self.area_size = area_size
+        self.owns_executor = executor is None
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1) if executor is None else executor
+        self.coalesce = coalesce
+
+        # Frame waiting for its update: (frame id, frame, move distance, submission time, number of coalesced frames)
+        self.pending = None
+        self.pending_changed = None
+        self.estimates = collections.deque(maxlen=max_estimates)
+        self.estimates_changed = None
+
+        self.worker = None
+        self.closing = False
+        # Exception raised by an update, the worker stops and submit and the iterators raise it
+        self.error = None
+        self.next_frame_id = 0
+
+        # Metrics
+        self.nb_submitted = 0
+        self.nb_updated = 0
+        self.nb_coalesced = 0
+        self.nb_dropped_estimates = 0
+        self.latencies = collections.deque(maxlen=metrics_window)
+        self.compute_times = collections.deque(maxlen=metrics_window)
+
+    async def start(self):
+        self.pending_changed = asyncio.Condition()
+        self.estimates_changed = asyncio.Condition()
+        self.closing = False
+        self.error = None
+        self.worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        """
+        Filters the frame still waiting, then stops the worker. The iterators end once the last estimates are read.
+        """
+        async with self.pending_changed:
+            self.closing = True
+            self.pending_changed.notify_all()
+        await self.worker
+
+        if self.owns_executor:
+            self.executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def submit(self, frame, move_distance, frame_id=None):
+        """
+        Submits a frame for filtering.
+
+        :param frame: Measurement image, it must not be modified until its update (the frame is not copied).
+        :param move_distance: Motion of the plants since the previous submitted frame.
+        :param frame_id: Identifier of the frame in the estimates, consecutive integers if None.
+        :return: Identifier of the frame.
+        :raises Exception: The exception of a failed update, the filter doesn't accept frames anymore.
+        :raises RuntimeError: The filter is closed, the frame is not filtered.
+        """
+        if frame_id is None:
+            frame_id = self.next_frame_id
+        self.next_frame_id = frame_id + 1
+        submitted_at = time.perf_counter()
+
+        async with self.pending_changed:
+            self.check_accepts_frames(frame_id)
+            if not self.coalesce:
+                await self.pending_changed.wait_for(lambda: self.pending is None or self.worker.done())
+                # The filter may have been closed or have failed while the frame was waiting
+                self.check_accepts_frames(frame_id)
+
+            nb_coalesced = 0
+            if self.pending is not None:
+                # The waiting frame is replaced, its motion still happened
+                move_distance += self.pending[2]
+                nb_coalesced = self.pending[4] + 1
+                self.nb_coalesced += 1
+
+            self.pending = (frame_id, frame, move_distance, submitted_at, nb_coalesced)
+            self.nb_submitted += 1
+            self.pending_changed.notify_all()
+
+        return frame_id
+
+    async def _run(self):
+        try:
+            await self._update_frames()
+        except Exception as error:
+            print("Async filter: update failed, the worker stops: {!r}".format(error))
+            self.error = error
+        finally:
+            # Wakes up the submissions and the iterators waiting for the worker
+            async with self.pending_changed:
+                self.pending_changed.notify_all()
+            async with self.estimates_changed:
+                self.estimates_changed.notify_all()
+
+    def check_accepts_frames(self, frame_id):
+        """
+        Raises the exception of the failed update, if any, or a RuntimeError if the filter is closed.
+        """
+        self.raise_error()
+        if self.closing or self.worker.done():
+            raise RuntimeError("Async filter: frame {} submitted after close.".format(frame_id))
+
+    def raise_error(self):
+        """
+        Raises the exception of the failed update, if any.
+        """
+        if self.error is not None:
+            raise self.error
+
+    async def _update_frames(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            async with self.pending_changed:
+                await self.pending_changed.wait_for(lambda: self.pending is not None or self.closing)
+                if self.pending is None:
+                    return
+                frame_id, frame, move_distance, submitted_at, nb_coalesced = self.pending
+                self.pending = None
+                self.pending_changed.notify_all()
+
+            started_at = time.perf_counter()
+            state, max_weight = await loop.run_in_executor(self.executor, self._update, frame, move_distance)
+            estimate = Estimate(frame_id, state, max_weight, submitted_at, started_at, time.perf_counter(),
+                                nb_coalesced)
+
+            self.nb_updated += 1
+            self.latencies.append(estimate.get_latency())
+            self.compute_times.append(estimate.get_compute_time())
+
+            async with self.estimates_changed:
+                if len(self.estimates) == self.estimates.maxlen:
+                    self.nb_dropped_estimates += 1
+                self.estimates.append(estimate)
+                self.estimates_changed.notify_all()
+
+    def _update(self, frame, move_distance):
+        # Runs in the executor
+        self.particle_filter.update(move_distance, frame, self.plant_size, self.area_size)
+        return self.particle_filter.get_average_state(), self.particle_filter.get_max_weight()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        """
+        Returns the oldest estimate that was not read, waiting for it if needed. Once the estimates computed before a
+        failed update are read, the exception of the update is raised.
+        """
+        async with self.estimates_changed:
+            await self.estimates_changed.wait_for(lambda: len(self.estimates) > 0 or self.worker.done())
+            if len(self.estimates) == 0:
+                self.raise_error()
+                raise StopAsyncIteration
+            return self.estimates.popleft()
+
+    def get_queue_depth(self):
+        """
+        Returns the number of frames waiting for their update (0 or 1) and the number of estimates waiting to be read.
+        """
+        return int(self.pending is not None), len(self.estimates)
+
+    def get_metrics(self):
+        """
+        Returns the counters of the frames and the latencies (submission to estimate) and compute times of the last
+        frames, in milliseconds.
+        """
+        metrics = {
+            'submitted': self.nb_submitted,
+            'updated': self.nb_updated,
+            'coalesced': self.nb_coalesced,
+            'dropped_estimates': self.nb_dropped_estimates,
+            'pending_frames': self.get_queue_depth()[0],
+            'pending_estimates': self.get_queue_depth()[1],
+        }
+        for name, values in (('latency', self.latencies), ('compute', self.compute_times)):
+            values = 1000 * np.asarray(values) if len(values) > 0 else np.zeros(1)
+            metrics[name + '_mean_ms'] = float(np.mean(values))
+            metrics[name + '_p95_ms'] = float(np.percentile(values, 95))
+            metrics[name + '_max_ms'] = float(np.max(values))
+
+        return metrics
+
+
+if __name__ == '__main__':
+    # Frames of the simulator submitted at a fixed rate, faster than the filter when the rate is high:
+    # python -m core.streaming.async_filter [frames per second]
+    import contextlib
+    import io
+    import sys
+
+    from simulator import Plants, Visualizer
+    from core.configuration import Configuration, create_particle_filter, create_world, initialize_particles
+
+    frame_rate = float(sys.argv[1]) if len(sys.argv) > 1 else 30
+    move_distance = 11
+
+    np.random.seed(0)
+    configuration = Configuration().with_overrides({'filter.number_of_particles': 200})
+    world = create_world(configuration)
+    plants = Plants(world, -100, 310, 160, 110, o=0, nb_rows=4, nb_plant_types=4)
+    plants.generate_plants()
+    visualizer = Visualizer(world)
+    frames = []
+    for _ in range(60):
+        plants.move(move_distance)
+        visualizer.draw(plants, [], 0)
+        frames.append(visualizer.measure())
+
+    particle_filter = create_particle_filter(configuration, world)
+    with contextlib.redirect_stdout(io.StringIO()):
+        initialize_particles(particle_filter, configuration)
+
+    async def produce(stream):
+        for frame in frames:
+            await stream.submit(frame, move_distance)
+            await asyncio.sleep(1 / frame_rate)
+        await stream.close()
+
+    async def main():
+        stream = AsyncParticleFilter(particle_filter, configuration.measurement.plant_size,
+                                     configuration.measurement.area_size)
+        await stream.start()
+        producer = asyncio.get_running_loop().create_task(produce(stream))
+        async for estimate in stream:
+            print("frame {:>3}: offset {:6.1f}, inter-row {:6.1f}, latency {:6.1f} ms, {} coalesced".format(
+                estimate.frame_id, estimate.state[0], estimate.state[3], 1000 * estimate.get_latency(),
+                estimate.nb_coalesced))
+        await producer
+        print(stream.get_metrics())
+
+    # The filters report every step on the standard output
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        asyncio.run(main())
+    print("\n".join(line for line in output.getvalue().splitlines()
+                    if line.startswith("frame") or line.startswith("{")))
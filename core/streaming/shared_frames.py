@@ -0,0 +1,391 @@
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Shared-memory ring buffer of frames between a camera (or segmentation) process and the filter process. The shared
+# block holds a control record, then one header per slot, then the frames:
+#
+#   control | header 0 .. header n-1 | frame 0 .. frame n-1
+#
+# There is one producer and one consumer. The producer writes the frame and the header of the slot write_count % n,
+# then increments write_count; the consumer reads the slot read_count % n in place and increments read_count when it
+# releases it. A slot is only written again once released, so the views the consumer reads are never modified under
+# it: a full ring makes the producer drop its frame (or wait), never the consumer read a torn frame. The counters are
+# aligned int64 written by one process each, and each process writes them after the data they publish.
+
+CONTROL_DTYPE = np.dtype([('n_slots', np.int64), ('height', np.int64), ('width', np.int64), ('channels', np.int64),
+                          ('write_count', np.int64), ('read_count', np.int64), ('closed', np.int64)])
+
+SLOT_HEADER_DTYPE = np.dtype([('frame_id', np.int64), ('timestamp', np.float64), ('move_distance', np.float64)])
+
+# Frames are aligned on cache lines
+FRAME_ALIGNMENT = 64
+
+
+def get_frames_offset(n_slots):
+    offset = CONTROL_DTYPE.itemsize + n_slots * SLOT_HEADER_DTYPE.itemsize
+    return (offset + FRAME_ALIGNMENT - 1) // FRAME_ALIGNMENT * FRAME_ALIGNMENT
+
+
+def attach_shared_memory(name):
+    """
+    Attaches an existing shared memory block without registering it to the resource tracker of this process, which
+    would otherwise destroy it when this process exits (before Python 3.13).
+    """
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        # Unregistering afterwards would also drop the registration of the producer when both processes share the
+        # tracker (child processes do), the registration is skipped instead
+        from multiprocessing import resource_tracker
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name)
+        finally:
+            resource_tracker.register = register
+
+
+class SharedFrame:
+    """
+    Frame read from a SharedFrameRing: header of its slot and read-only view of its pixels in the shared memory, to
+    be given as the measurement of update. The view is only valid until the frame is released.
+    """
+
+    def __init__(self, slot, frame_id, timestamp, move_distance, measurement):
+        self.slot = slot
+        self.frame_id = frame_id
+        self.timestamp = timestamp
+        self.move_distance = move_distance
+        self.measurement = measurement
+
+
+class SharedFrameRing:
+    """
+    Single-producer single-consumer ring buffer of uint8 frames in shared memory, see the layout above. The producer
+    creates the ring and the consumer attaches to it by name:
+
+        ring = SharedFrameRing.create("frames", 4, (700, 500, 3))       # producer
+        ring.write(frame, move_distance)
+
+        ring = SharedFrameRing.attach("frames")                         # consumer
+        frame = ring.read_latest(timeout=1)
+        particle_filter.update(frame.move_distance, frame.measurement, plant_size, area_size)
+        ring.release()
+
+    The views must be dropped before close is called, the shared memory can't be closed while they exist.
+    """
+
+    def __init__(self, block, owner):
+        self.block = block
+        self.owner = owner
+
+        self.control = np.ndarray(1, CONTROL_DTYPE, block.buf, 0)[0]
+        n_slots = int(self.control['n_slots'])
+        self.shape = (int(self.control['height']), int(self.control['width']), int(self.control['channels']))
+        self.headers = np.ndarray(n_slots, SLOT_HEADER_DTYPE, block.buf, CONTROL_DTYPE.itemsize)
+        self.frames = np.ndarray((n_slots,) + self.shape, np.uint8, block.buf, get_frames_offset(n_slots))
+
+        # Read-only views of the frames given to the consumer
+        self.read_frames = self.frames.view()
+        self.read_frames.flags.writeable = False
+
+        # Number of frames the consumer is reading (released by release)
+        self.nb_reading = 0
+
+    @staticmethod
+    def create(name, n_slots, shape):
+        """
+        Creates the ring (producer side).
+
+        :param name: Name of the shared memory block, None for a generated one (see the name attribute).
+        :param n_slots: Number of frames the ring holds.
+        :param shape: Shape of the frames, (height, width) or (height, width, channels).
+        """
+        shape = tuple(shape) + (1,) * (3 - len(shape))
+        size = get_frames_offset(n_slots) + n_slots * int(np.prod(shape))
+        block = shared_memory.SharedMemory(name, create=True, size=size)
+
+        control = np.ndarray(1, CONTROL_DTYPE, block.buf, 0)
+        control[0] = (n_slots, shape[0], shape[1], shape[2], 0, 0, 0)
+        del control
+
+        return SharedFrameRing(block, owner=True)
+
+    @staticmethod
+    def attach(name):
+        """
+        Attaches to an existing ring (consumer side).
+        """
+        return SharedFrameRing(attach_shared_memory(name), owner=False)
+
+    @property
+    def name(self):
+        return self.block.name
+
+    @property
+    def n_slots(self):
+        return len(self.headers)
+
+    def get_size(self):
+        """
+        Returns the number of frames written and not released yet.
+        """
+        return int(self.control['write_count'] - self.control['read_count'])
+
+    def is_closed(self):
+        return bool(self.control['closed'])
+
+    # Producer
+
+    def get_write_buffer(self):
+        """
+        Returns the view of the next slot to write, to render a frame directly in the shared memory (then call
+        commit), or None if the ring is full.
+        """
+        if self.get_size() >= self.n_slots:
+            return None
+
+        return self.frames[self.control['write_count'] % self.n_slots]
+
+    def commit(self, move_distance, frame_id=None, timestamp=None):
+        """
+        Publishes the frame written in the buffer of get_write_buffer.
+
+        :param move_distance: Odometry: motion of the plants since the previous frame.
+        :param frame_id: Identifier of the frame, the number of frames written if None.
+        :param timestamp: Time of the frame (time.time()), now if None.
+        """
+        write_count = self.control['write_count']
+        header = self.headers[write_count % self.n_slots]
+        header['frame_id'] = write_count if frame_id is None else frame_id
+        header['timestamp'] = time.time() if timestamp is None else timestamp
+        header['move_distance'] = move_distance
+
+        # Published after the frame and its header
+        self.control['write_count'] = write_count + 1
+
+    def write(self, frame, move_distance, frame_id=None, timestamp=None, timeout=0):
+        """
+        Copies a frame in the next slot and publishes it.
+
+        :param timeout: Time (in seconds) to wait for a free slot when the ring is full, None to wait indefinitely.
+        :return: Whether the frame was written, False if the ring stayed full (the frame is dropped).
+        """
+        buffer = self.get_write_buffer()
+        deadline = None if timeout is None else time.time() + timeout
+        while buffer is None:
+            if deadline is not None and time.time() >= deadline:
+                return False
+            time.sleep(0.0005)
+            buffer = self.get_write_buffer()
+
+        buffer[...] = np.asarray(frame).reshape(self.shape)
+        self.commit(move_distance, frame_id, timestamp)
+
+        return True
+
+    def mark_closed(self):
+        """
+        Tells the consumer that no frame will be written anymore.
+        """
+        self.control['closed'] = 1
+
+    # Consumer
+
+    def _wait_for_frames(self, count, timeout):
+        deadline = None if timeout is None else time.time() + timeout
+        while self.get_size() < count:
+            if self.is_closed() or (deadline is not None and time.time() >= deadline):
+                return False
+            time.sleep(0.0005)
+
+        return True
+
+    def _get_frame(self, index, move_distance=None):
+        slot = index % self.n_slots
+        header = self.headers[slot]
+        return SharedFrame(slot, int(header['frame_id']), float(header['timestamp']),
+                           float(header['move_distance']) if move_distance is None else move_distance,
+                           self.read_frames[slot])
+
+    def read(self, timeout=None):
+        """
+        Returns the oldest frame that was not read, without copying it, waiting for it if needed. The frame must be
+        released once used.
+
+        :param timeout: Time (in seconds) to wait for a frame, None to wait indefinitely.
+        :return: SharedFrame, or None if no frame came in time or the producer closed the ring.
+        """
+        if not self._wait_for_frames(self.nb_reading + 1, timeout):
+            return None
+
+        frame = self._get_frame(self.control['read_count'] + self.nb_reading)
+        self.nb_reading += 1
+
+        return frame
+
+    def read_latest(self, timeout=None):
+        """
+        Returns the newest frame, releasing the older ones: the filter skips the frames it is too slow for. The move
+        distance of the returned frame is the sum of the move distances of the skipped frames and its own.
+
+        The frames are released in order, so the older frames can only be skipped when no frame is being read: while
+        frames are held, the next frame is returned as by read.
+        """
+        if self.nb_reading > 0:
+            return self.read(timeout)
+
+        if not self._wait_for_frames(1, timeout):
+            return None
+
+        read_count = self.control['read_count']
+        write_count = self.control['write_count']
+        move_distance = float(np.sum(self.headers['move_distance'][np.arange(read_count, write_count)
+                                                                    % self.n_slots]))
+        frame = self._get_frame(write_count - 1, move_distance)
+
+        # The skipped frames are released, the newest one is being read
+        self.control['read_count'] = write_count - 1
+        self.nb_reading = 1
+
+        return frame
+
+    def release(self):
+        """
+        Releases the oldest frame being read, its slot can be written again.
+        """
+        if self.nb_reading == 0:
+            print("Shared frame ring: no frame to release.")
+            return
+
+        self.nb_reading -= 1
+        self.control['read_count'] += 1
+
+    def close(self):
+        """
+        Detaches from the shared memory, and destroys it on the producer side.
+        """
+        del self.control, self.headers, self.frames, self.read_frames
+        self.block.close()
+        if self.owner:
+            self.block.unlink()
+
+
+def run_simulated_producer(name, n_frames=100, frame_rate=30, move_distance=11, n_slots=4, width=500, height=700,
+                           seed=0, close_timeout=10):
+    """
+    Stand-in for the camera process: renders the frames of the simulator (as main.py does) into a new ring, at a
+    fixed rate. Frames are dropped when the ring is full, as a camera would. Meant to run in its own process.
+
+    :param name: Name of the ring.
+    :param close_timeout: Time (in seconds) the consumer has to read the last frames, the ring is destroyed after it
+    even if the consumer is gone.
+    """
+    from simulator import Plants, Visualizer, World
+
+    np.random.seed(seed)
+    world = World(width, height, move_distance)
+    plants = Plants(world, -100, 310, 160, 110, o=0, nb_rows=4, nb_plant_types=4)
+    plants.generate_plants()
+    visualizer = Visualizer(world)
+
+    ring = SharedFrameRing.create(name, n_slots, (height, width, 3))
+    nb_dropped = 0
+    dropped_move_distance = 0
+    try:
+        for i in range(n_frames):
+            start = time.time()
+            plants.move(move_distance)
+            visualizer.draw(plants, [], 0)
+
+            # The motion of a dropped frame is added to the next one
+            if not ring.write(visualizer.measure(), move_distance + dropped_move_distance, frame_id=i):
+                nb_dropped += 1
+                dropped_move_distance += move_distance
+            else:
+                dropped_move_distance = 0
+
+            time.sleep(max(0.0, 1 / frame_rate - (time.time() - start)))
+
+        ring.mark_closed()
+        print("Producer: {} frames, {} dropped".format(n_frames, nb_dropped))
+
+        # The consumer is attached, the block is destroyed once it read the last frames
+        deadline = time.time() + close_timeout
+        while ring.get_size() > 0:
+            if time.time() >= deadline:
+                print("Producer: {} frames not read by the consumer".format(ring.get_size()))
+                break
+            time.sleep(0.01)
+    finally:
+        ring.close()
+
+
+if __name__ == '__main__':
+    # Simulated camera process feeding the filter through the ring:
+    # python -m core.streaming.shared_frames [frames per second]
+    import contextlib
+    import io
+    import multiprocessing
+    import pickle
+    import sys
+
+    from core.configuration import Configuration, create_particle_filter, initialize_particles
+
+    frame_rate = float(sys.argv[1]) if len(sys.argv) > 1 else 30
+    name = "frames_{}".format(np.random.randint(1 << 30))
+
+    # Cost of the transport of one frame: pickling (as through a pipe) against the copy into the ring
+    frame = np.zeros((700, 500, 3), np.uint8)
+    start = time.perf_counter()
+    for _ in range(100):
+        pickle.loads(pickle.dumps(frame, protocol=pickle.HIGHEST_PROTOCOL))
+    pickle_time = (time.perf_counter() - start) / 100
+    ring = SharedFrameRing.create(None, 2, frame.shape)
+    start = time.perf_counter()
+    for _ in range(100):
+        ring.write(frame, 0)
+        ring.read().measurement.sum(dtype=np.uint8)
+        ring.release()
+    ring_time = (time.perf_counter() - start) / 100
+    ring.close()
+    print("Transport of a frame: pickling {:.3f} ms, shared ring {:.3f} ms (write and read)".format(
+        1000 * pickle_time, 1000 * ring_time))
+
+    producer = multiprocessing.Process(target=run_simulated_producer, args=(name, 90, frame_rate))
+    producer.start()
+
+    configuration = Configuration().with_overrides({'performance.backend': 'vectorized',
+                                                    'filter.number_of_particles': 500})
+    particle_filter = create_particle_filter(configuration)
+    with contextlib.redirect_stdout(io.StringIO()):
+        initialize_particles(particle_filter, configuration)
+
+    # Waiting for the producer to create the ring
+    ring = None
+    while ring is None:
+        try:
+            ring = SharedFrameRing.attach(name)
+        except FileNotFoundError:
+            time.sleep(0.01)
+
+    nb_frames = 0
+    delays = []
+    while True:
+        frame = ring.read_latest(timeout=5)
+        if frame is None:
+            break
+        with contextlib.redirect_stdout(io.StringIO()):
+            particle_filter.update(frame.move_distance, frame.measurement, configuration.measurement.plant_size,
+                                   configuration.measurement.area_size)
+        delays.append(time.time() - frame.timestamp)
+        nb_frames += 1
+        del frame
+        ring.release()
+
+    ring.close()
+    producer.join()
+    print("Consumer: {} frames filtered, mean delay since capture {:.1f} ms, average state {}".format(
+        nb_frames, 1000 * np.mean(delays), np.round(particle_filter.get_average_state(), 1)))
@@ -1,31 +1,46 @@
 #!/usr/bin/env python
-import cv2 as cv
+import collections
+import sys
+import time
 
-import numpy as np
+import cv2 as cv
 
 # Simulation + plotting requires plants, visualizer and world
-from simulator import Plants, Visualizer, World
+from simulator import Plants, Visualizer
+
+# Weeds and noise of the simulated measurement
+from simulator.corruption import FrameCorruption
 
 from simulator.particle import Particle
 
-# Supported resampling methods (resampling algorithm enum for SIR and SIR-derived particle0 filters)
-from core.resampling.resampler import ResamplingAlgorithms
+# Settings of the particle filter (JSON, YAML or TOML file)
+from core.configuration import Configuration, create_particle_filter, create_world, initialize_particles, \
+    load_configuration
+
+# Binary recording of the particle clouds
+from core.recording import ParticleRecorder
 
-# Particle filters
-from core.particle_filters.particle_filter_sir import ParticleFilterSIR
+# Allocation tracking of the updates
+from core.diagnostics import MemoryProfiler
 
 if __name__ == '__main__':
 
     # np.random.seed(40)
 
+    # Particle filter settings: python main.py [configuration file], the default settings without file
+    configuration = load_configuration(sys.argv[1]) if len(sys.argv) > 1 else Configuration()
+
     # Initialize world
-    world = World(500, 700, 10)
+    world = create_world(configuration)
 
     # Number of simulated time steps
     n_time_steps = 30 + 40
 
+    # Clutter of the simulated measurement (weeds, salt-and-pepper noise, blur), disabled by default
+    corruption = FrameCorruption(weed_density=0.0, salt_probability=0.0, pepper_probability=0.0, blur_size=0, seed=0)
+
     # Initialize visualizer
-    visualizer = Visualizer(world)
+    visualizer = Visualizer(world, corruption)
 
     ##
     # True plants properties (simulator settings)
@@ -43,106 +58,83 @@ if __name__ == '__main__':
     true_plants_meas_noise_position_std = 7
 
     # Size of a plant : length of the side of a square
-    plant_size = 2
+    plant_size = configuration.measurement.plant_size
 
     # Area size
-    area_size = 4
+    area_size = configuration.measurement.area_size
 
     # Initialize plants
     plants = Plants(world, -100, 310, 160, 110, o=0, nb_rows=4, nb_plant_types=4)
     plants.setStandardDeviations(true_plants_motion_move_distance_std, true_plants_meas_noise_position_std)
+    # Missing plants, position jitter and size variation (every plant present, on its position and of the same size)
+    plants.setGenerationNoise(min_plant_ratio=1.0, std_plant_position=0, std_plant_size=0)
     plants.generate_plants()
 
     ##
     # Particle filter settings
     ##
 
-    number_of_particles = 40
-    # Limit values for the parameters we track.
-    pf_state_limits = [0, world.width,  # Offset
-                       world.height - 240, world.height,  # Position
-                       11, 240,  # Inter-plant, not too small
-                       world.width/25, world.width / 4,  # Inter-row, not too low because get_bottom_plants
-                                                         # can take too long /!\
-                       -np.pi / 8, np.pi / 8,  # Skew
-                       0, 0.8]  # Convergence, close to 1 means parallel lines that can cause issues /!\
-
-    # pf_state_limits = [0, world.width,
-    #                    0, world.height,
-    #                    11, world.height/4,
-    #                    world.width/8, world.width/2,  # max 8 rows, min 2 rows
-    #                    -np.pi/6, np.pi/6,
-    #                    0, 0.8]
-
-    pf_state_limits = [world.width-110, world.width+110,  # Offset
-                       world.height - 80, world.height,  # Position, on limite artificiellement l'espace de recherche de position
-                       90, 130,  # Inter-plant, not too small
-                       151, 170,  # Inter-row, not too low because get_bottom_plants
-                       # can take too long /!\          print("Compute likelihood: outside of the considered area.")
-                       -np.pi / 12, np.pi / 12,  # Skew
-                       0.1, 0.4]  # Convergence, close t                    else:o 1 means parallel lines that can cause issues /!\
-
-    # Process model noise (zero mean additive Gaussian noise)
-    # This noise has a huge impact on the correctness of the particle0 filter
-    motion_model_move_distance_std = 25
-    process_noise = [11,  # Offset
-                     motion_model_move_distance_std,  # Position
-                     11,  # Inter-plant
-                     11,  # Inter-row
-                     np.pi / 24,  # Skew
-                     0.25]  # Convergence                    
-                                                             
-    process_noise = [0,  # Offset                            import cv2 as cv
-                     (pf_state_limits[3] - pf_state_limits[2]) / 4,  # Position
-                     (pf_state_limits[5] - pf_state_limits[4]) / 4,  # IP
-                     (pf_state_limits[7] - pf_state_limits[7]) / 4,  # IR
-                     (pf_state_limits[9] - pf_state_limits[8]) / 4,  # Skew
-                     (pf_state_limits[11] - pf_state_limits[10]) / 2]  # Convergence
-
-
-    # Probability associated to the measurement image. We have the probability for a pixel
-    probability_in = 0.90
-    probability_out = 0.01
-    measurement_uncertainty = [probability_in, probability_out]
-
-    # Set resampling algorithm used
-    # TODO: compare with the other resampling algorithms
-    algorithm = ResamplingAlgorithms.STRATIFIED
-
-    # Initialize SIR particle0 filter: resample every time step
-    particle_filter_sir = ParticleFilterSIR(
-        world=world,
-        number_of_particles=number_of_particles,
-        limits=pf_state_limits,
-        process_noise=process_noise,
-        measurement_noise=measurement_uncertainty,
-        resampling_algorithm=algorithm)
-
-    # Particles are selected uniformly randomly
-    particle_filter_sir.initialize_particles_uniform()
+    # Limits of the state, process noise, measurement model, resampling, precision and execution backend: see
+    # core.configuration, the defaults are the settings of the simulated field
+    particle_filter_sir = create_particle_filter(configuration, world)
+    number_of_particles = configuration.filter.number_of_particles
+
+    # Particles are either selected uniformly randomly or seeded around the row structures found in the first
+    # measurement
+    first_measurement = None
+    if configuration.filter.initialization == 'measurement':
+        visualizer.draw(plants, [], 0)
+        first_measurement = visualizer.measure()
+    initialize_particles(particle_filter_sir, configuration, first_measurement)
+
+    # Recording of every particle cloud for offline analysis (None to disable)
+    recording_path = configuration.instrumentation.recording_path
+    recorder = None
+    if recording_path is not None:
+        recorder = ParticleRecorder(recording_path, initial_capacity=n_time_steps * number_of_particles)
+
+    # Allocations of the updates, reported every memory_snapshot_interval time steps (diagnostics mode)
+    profiler = None
+    if configuration.instrumentation.memory_profile:
+        profiler = MemoryProfiler(configuration.instrumentation.memory_snapshot_interval)
+        profiler.start()
 
     ##
     # Start simulation
     ##
-    max_weights = []
+    # Maximal weights of the last time steps only, the history would grow for the whole session otherwise
+    max_weights = collections.deque(maxlen=1000)
     for i in range(n_time_steps):
         # Simulate plants motion (required motion will not exactly be achieved)
         plants.move(plants_setpoint_motion_move_distance)
 
         # Visualization
-        # Drawing plants
-        visualizer.draw(plants, particle_filter_sir.particles, particle_filter_sir.n_particles)
+        # Drawing plants, the particles are drawn after the update
+        visualizer.draw(plants, [], 0)
 
         # Simulate measurement
         meas_image = visualizer.measure()
 
         # Update SIR particle filter
+        if profiler is not None:
+            profiler.start_frame()
+        start = time.perf_counter()
         particle_filter_sir.update(plants_setpoint_motion_move_distance, meas_image, plant_size, area_size)
+        if profiler is not None:
+            profiler.end_frame()
+        if configuration.instrumentation.print_latency:
+            print("Time step {}: update took {:.2f} ms".format(i, 1000 * (time.perf_counter() - start)))
 
         # Show maximum normalized particle weight (converges to 1.0) and correctness (0 = correct)
         w_max = particle_filter_sir.get_max_weight()
         max_weights.append(w_max)
-        print("Time step {}: max weight: {}".format(i, w_max))
+        if configuration.instrumentation.print_max_weight:
+            print("Time step {}: max weight: {}".format(i, w_max))
+
+        # States and weights of the particles as arrays: the (weight, state)-lists would be built again at every frame
+        states, weights = particle_filter_sir.get_states()
+        if recorder is not None:
+            recorder.record_arrays(states, weights, timestamp=i)
 
         # Drawing a particle
         avg_state = particle_filter_sir.get_average_state()
@@ -152,17 +144,26 @@ if __name__ == '__main__':
         #print("Avg skew : {}, avg convergence : {}, avg inter-plant : {}"
         #      .format(avg_particle.skew, avg_particle.convergence, avg_particle.ip_at_bottom))
 
-        nb = 0
-        # Drawing every particle
-        for par in particle_filter_sir.particles:
-            # nb += 25
-            particle = Particle(world, par[1][0], par[1][1], par[1][2], par[1][3], par[1][4], par[1][5])
-            visualizer.draw_complete_particle(particle, (0, nb, 255), 6)
+        # Drawing every particle as a weight-heat overlay of their plants
+        visualizer.draw_particles_density(states, weights, 6)
 
         # Showing the image
         cv.imshow("Crop rows", visualizer.img)
         cv.waitKey(0)
 
+    if recorder is not None:
+        recorder.close()
+
+    if profiler is not None:
+        profiler.stop()
+        profiler.report()
+        memory_budget = configuration.instrumentation.memory_budget
+        if memory_budget is not None:
+            within_budget, net_bytes, transient_bytes = profiler.check_budget(memory_budget)
+            if not within_budget:
+                print("Warning: the updates exceed the memory budget of {} B/frame (net {:.0f} B/frame, transient "
+                      "up to {} B/frame)".format(memory_budget, net_bytes, transient_bytes))
+
     # Print Degeneracy problem
     # Plot weights as function of time step
     #fontSize = 14
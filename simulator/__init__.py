@@ -1,3 +1,24 @@
-from .plants import Plants
-from .visualizer import Visualizer
-from .world import World
+import importlib
+
+# The classes of the simulator are imported on first access, so that the particle filters, which only need
+# simulator.particle and simulator.lattice, don't import the plants and the visualizer.
+_LAZY_CLASSES = {
+    'Plants': '.plants',
+    'Visualizer': '.visualizer',
+    'World': '.world',
+}
+
+__all__ = list(_LAZY_CLASSES)
+
+
+def __getattr__(name):
+    if name not in _LAZY_CLASSES:
+        raise AttributeError("module {} has no attribute {}".format(__name__, name))
+
+    value = getattr(importlib.import_module(_LAZY_CLASSES[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
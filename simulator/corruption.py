@@ -0,0 +1,91 @@
+import numpy as np
+
+from .visualizer import get_disk_sprite
+
+
+class FrameCorruption:
+    """
+    Corrupts a rendered frame to make the simulated measurement look like a real segmented field: weeds drawn as
+    green blobs anywhere in the image, salt-and-pepper noise and blur. Missing plants and plant-size variation are
+    generated by Plants, see Plants.setGenerationNoise.
+    Every stage is vectorized and uses its own random generator so that corrupted frames are reproducible and don't
+    change the random sequence of the simulation.
+    """
+
+    def __init__(self, weed_density=0.0, weed_max_radius=10, salt_probability=0.0, pepper_probability=0.0,
+                 blur_size=0, seed=None):
+        """
+        :param weed_density: Mean number of weeds per 10000 pixels.
+        :param weed_max_radius: Radius of a weed at the bottom of the image, weeds get smaller with the perspective.
+        :param salt_probability: Probability for a pixel to be turned into a plant pixel.
+        :param pepper_probability: Probability for a pixel to be turned into a background pixel.
+        :param blur_size: Size of the Gaussian blur kernel (odd), 0 to disable blur.
+        :param seed: Seed of the random generator.
+        """
+        self.weed_density = weed_density
+        self.weed_max_radius = weed_max_radius
+        self.salt_probability = salt_probability
+        self.pepper_probability = pepper_probability
+        self.blur_size = blur_size
+        self.rng = np.random.default_rng(seed)
+
+        # Sprites of the weeds, one per radius
+        self.disk_sprites = {}
+
+    def add_weeds(self, img, color=(0, 255, 0)):
+        height, width = img.shape[:2]
+        nb_weeds = self.rng.poisson(self.weed_density * height * width / 10000)
+        if nb_weeds == 0:
+            return
+
+        x = self.rng.integers(0, width, nb_weeds)
+        y = self.rng.integers(0, height, nb_weeds)
+
+        # Weeds have random sizes and are smaller at the top of the image, like plants.
+        radii = (self.rng.uniform(0.2, 1.0, nb_weeds) * self.weed_max_radius * y / height).astype(np.int64)
+
+        for radius in np.unique(radii):
+            if radius not in self.disk_sprites:
+                self.disk_sprites[radius] = get_disk_sprite(int(radius))
+            dy, dx = self.disk_sprites[radius]
+
+            selected = radii == radius
+            ys = (y[selected, np.newaxis] + dy[np.newaxis, :]).ravel()
+            xs = (x[selected, np.newaxis] + dx[np.newaxis, :]).ravel()
+            valid = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+            img[ys[valid], xs[valid]] = color
+
+    def add_salt_and_pepper(self, img, color=(0, 255, 0)):
+        height, width = img.shape[:2]
+        flat_img = img.reshape(height * width, -1)
+
+        # Drawing the number of corrupted pixels first avoids generating one random number per pixel.
+        nb_salt = self.rng.binomial(height * width, self.salt_probability)
+        flat_img[self.rng.integers(0, height * width, nb_salt)] = color
+
+        nb_pepper = self.rng.binomial(height * width, self.pepper_probability)
+        flat_img[self.rng.integers(0, height * width, nb_pepper)] = 0
+
+    def blur(self, img):
+        """
+        Blurs the frame and binarizes it again: the measurement only considers fully green pixels as plant pixels.
+        """
+        # OpenCV is only imported when the frames are blurred.
+        import cv2 as cv
+        blurred = cv.GaussianBlur(img, (self.blur_size, self.blur_size), 0)
+        img[...] = np.where(blurred >= 128, 255, 0).astype(np.uint8)
+
+    def apply(self, img):
+        """
+        Corrupts the frame in place and returns it.
+        """
+        if self.weed_density > 0:
+            self.add_weeds(img)
+
+        if self.salt_probability > 0 or self.pepper_probability > 0:
+            self.add_salt_and_pepper(img)
+
+        if self.blur_size > 1:
+            self.blur(img)
+
+        return img
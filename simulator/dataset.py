@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import numpy as np
+
+from .corruption import FrameCorruption
+from .plants import Plants
+from .visualizer import Visualizer
+from .world import World
+
+
+# Dtype of the ground truth stored for each frame of a dataset: the field as it was rendered in the frame (vanishing
+# point, inter-row distance and x coordinate of the first row at the bottom of the image, see Plants) and the image
+# coordinates of the tracked plant, -1 when it is not visible.
+GROUND_TRUTH_DTYPE = np.dtype([('move_distance', np.float64),
+                               ('tracked_plant_height', np.float64),
+                               ('measured_plant_height', np.float64),
+                               ('vp_width', np.float64),
+                               ('vp_height', np.float64),
+                               ('inter_row', np.float64),
+                               ('inter_plant', np.float64),
+                               ('offset', np.float64),
+                               ('tracked_plant_x', np.float64),
+                               ('tracked_plant_y', np.float64)])
+
+# Version of the files of a dataset, part of the hash so that the datasets of an older version are rendered again
+DATASET_VERSION = 2
+
+
+class Scenario:
+    """
+    Parameters of a simulated scene: world size, field parameters (as given to Plants), motion, noise, clutter,
+    number of frames and seed. Two scenarios with the same parameters render the same frames, so they share the
+    same hash.
+    """
+
+    def __init__(self, width=500, height=700, vp_height=-100, vp_width=310, inter_row=160, inter_plant=110, offset=0,
+                 nb_rows=4, nb_plant_types=4, move_distance=11, std_move_distance=0, std_meas_position=7,
+                 min_plant_ratio=1.0, std_plant_position=0, std_plant_size=0, weed_density=0.0,
+                 salt_probability=0.0, pepper_probability=0.0, blur_size=0, n_frames=70, seed=0):
+        self.width = width
+        self.height = height
+        self.vp_height = vp_height
+        self.vp_width = vp_width
+        self.inter_row = inter_row
+        self.inter_plant = inter_plant
+        self.offset = offset
+        self.nb_rows = nb_rows
+        self.nb_plant_types = nb_plant_types
+        self.move_distance = move_distance
+        self.std_move_distance = std_move_distance
+        self.std_meas_position = std_meas_position
+        self.min_plant_ratio = min_plant_ratio
+        self.std_plant_position = std_plant_position
+        self.std_plant_size = std_plant_size
+        self.weed_density = weed_density
+        self.salt_probability = salt_probability
+        self.pepper_probability = pepper_probability
+        self.blur_size = blur_size
+        self.n_frames = n_frames
+        self.seed = seed
+
+    def get_parameters(self):
+        return dict(vars(self))
+
+    def get_hash(self):
+        """
+        Returns a hash of the scenario parameters, used as the key of the dataset cache.
+        """
+        description = json.dumps(dict(self.get_parameters(), version=DATASET_VERSION), sort_keys=True, default=float)
+        return hashlib.sha1(description.encode('utf-8')).hexdigest()[:16]
+
+    @staticmethod
+    def from_parameters(parameters):
+        return Scenario(**parameters)
+
+
+class DatasetBuilder:
+    """
+    Renders the frames of a scenario once and stores them on disk, in a directory named after the scenario hash.
+    Each frame is stored as the plant mask (green channel of the measurement) packed to one bit per pixel, in chunks
+    of chunk_size frames saved as .npy files so they can be memory-mapped.
+    """
+
+    def __init__(self, cache_dir, chunk_size=64):
+        self.cache_dir = cache_dir
+        self.chunk_size = chunk_size
+
+    def get_path(self, scenario):
+        return os.path.join(self.cache_dir, scenario.get_hash())
+
+    def build(self, scenario, overwrite=False):
+        """
+        Returns the dataset of the scenario, rendering it only if it is not already in the cache.
+        """
+        path = self.get_path(scenario)
+        if not overwrite and os.path.exists(os.path.join(path, "scenario.json")):
+            return SyntheticDataset(path)
+
+        os.makedirs(path, exist_ok=True)
+
+        # Same simulation as in main.py, with a random generator of its own so that the random sequence of the caller
+        # doesn't change
+        random_state = np.random.RandomState(scenario.seed)
+        world = World(scenario.width, scenario.height, scenario.move_distance)
+        corruption = FrameCorruption(scenario.weed_density, salt_probability=scenario.salt_probability,
+                                     pepper_probability=scenario.pepper_probability, blur_size=scenario.blur_size,
+                                     seed=scenario.seed)
+        visualizer = Visualizer(world, corruption)
+        plants = Plants(world, scenario.vp_height, scenario.vp_width, scenario.inter_row, scenario.inter_plant,
+                        o=scenario.offset, nb_rows=scenario.nb_rows, nb_plant_types=scenario.nb_plant_types,
+                        random_state=random_state)
+        plants.setStandardDeviations(scenario.std_move_distance, scenario.std_meas_position)
+        plants.setGenerationNoise(scenario.min_plant_ratio, scenario.std_plant_position, scenario.std_plant_size)
+        plants.generate_plants()
+
+        ground_truth = np.zeros(scenario.n_frames, GROUND_TRUTH_DTYPE)
+        packed_width = (scenario.width + 7) // 8
+        chunk = np.zeros((self.chunk_size, scenario.height, packed_width), np.uint8)
+
+        n_chunks = 0
+        for i in range(scenario.n_frames):
+            previous_position = plants.plant_positions[0] if len(plants.plant_positions) > 0 else 0
+            plants.move(scenario.move_distance)
+
+            visualizer.draw(plants, [], 0)
+            mask = visualizer.measure()[:, :, 1] == 255
+            chunk[i % self.chunk_size] = np.packbits(mask, axis=1)
+
+            move_distance = plants.plant_positions[0] - previous_position if len(plants.plant_positions) > 0 else 0
+            tracked_plant_height = plants.get_tracked_plant_height()
+            tracked_plant = (-1, -1)
+            if tracked_plant_height != -1:
+                tracked_plant = plants.get_row_coordinates([plants.nb_rows // 2], [tracked_plant_height])[0]
+            ground_truth[i] = (move_distance, tracked_plant_height, plants.measure(), plants.vanishing_point[0],
+                               plants.vanishing_point[1], plants.inter_row_distance, plants.inter_plant_distance,
+                               plants.row_bottoms[0], tracked_plant[0], tracked_plant[1])
+
+            # Writing the chunk when it is full or when it is the last frame
+            if (i + 1) % self.chunk_size == 0 or i == scenario.n_frames - 1:
+                n_frames_in_chunk = i % self.chunk_size + 1
+                np.save(os.path.join(path, "chunk_{:05d}.npy".format(n_chunks)), chunk[:n_frames_in_chunk])
+                n_chunks += 1
+
+        np.save(os.path.join(path, "ground_truth.npy"), ground_truth)
+
+        # The scenario file is written last: its presence marks a complete dataset.
+        with open(os.path.join(path, "scenario.json"), 'w') as f:
+            json.dump({'parameters': scenario.get_parameters(), 'chunk_size': self.chunk_size,
+                       'n_chunks': n_chunks}, f, indent=2, default=float)
+
+        return SyntheticDataset(path)
+
+
+class SyntheticDataset:
+    """
+    Read access to a dataset written by DatasetBuilder. The chunks are memory-mapped, a frame is only unpacked when
+    it is requested.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "scenario.json")) as f:
+            description = json.load(f)
+
+        self.scenario = Scenario.from_parameters(description['parameters'])
+        self.chunk_size = description['chunk_size']
+        self.chunks = [np.load(os.path.join(path, "chunk_{:05d}.npy".format(i)), mmap_mode='r')
+                       for i in range(description['n_chunks'])]
+        self.ground_truth = np.load(os.path.join(path, "ground_truth.npy"))
+
+    def __len__(self):
+        return len(self.ground_truth)
+
+    def get_mask(self, i):
+        """
+        Returns the plant mask of frame i as a (height, width) boolean array.
+        """
+        packed = self.chunks[i // self.chunk_size][i % self.chunk_size]
+        return np.unpackbits(packed, axis=1, count=self.scenario.width).astype(bool)
+
+    def get_frame(self, i):
+        """
+        Returns frame i as the measurement image the visualizer would have produced: plants in green on black.
+        """
+        frame = np.zeros((self.scenario.height, self.scenario.width, 3), np.uint8)
+        frame[self.get_mask(i), 1] = 255
+        return frame
+
+    def iter_frames(self):
+        """
+        Iterates over (frame, ground truth) pairs.
+        """
+        for i in range(len(self)):
+            yield self.get_frame(i), self.ground_truth[i]
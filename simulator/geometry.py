@@ -0,0 +1,197 @@
+import numpy as np
+
+# Stateless geometry of the particles, vectorized over (N, 6) arrays of states (offset, position, inter-plant,
+# inter-row, skew, convergence). Same results as the methods of Particle, without building one object per particle.
+# The rows of a particle are indexed relatively to the row of its particular plant: row k is the k-th row to its
+# right, or to its left when k < 0.
+
+# Parallel rows have no vanishing point, their point at the height -PARALLEL_ROWS_DISTANCE stands for it: the
+# inter-plant distance is then the same along the rows, up to a relative error of height / PARALLEL_ROWS_DISTANCE.
+PARALLEL_ROWS_DISTANCE = 1e6
+
+# Default maximal number of rows of a particle, it bounds the cost of the particles with a tiny inter-row distance.
+DEFAULT_MAX_ROWS = 64
+
+
+def get_bottom_plant_counts(states, width, height, max_rows=DEFAULT_MAX_ROWS):
+    """
+    Returns the (N,) numbers of rows to the left and to the right of the particular plant of each particle, computed
+    analytically. As in Particle.get_bottom_plants, the neighbours are added while they are inside the image: there is
+    none when the particular plant is outside of it vertically, and none on a side when the first neighbour of that
+    side is outside of the image.
+
+    :param states: (N, 6) array of states.
+    :param width: Width of the image.
+    :param height: Height of the image.
+    :param max_rows: Maximal number of rows of a particle (particular plant included), the rows nearest to the
+    particular plant are kept. None for no limit.
+    """
+    states = np.asarray(states, dtype=np.float64).reshape(-1, 6)
+    offset, position, inter_row = states[:, 0], states[:, 1], states[:, 3]
+
+    # No neighbour at all when the rows don't move away from the particular plant
+    valid = (position >= 0) & (position < height) & (inter_row > 0)
+    inter_row = np.where(valid, inter_row, 1)
+
+    # Left neighbours offset - k ir for k = 1 .. floor(offset / ir), right neighbours offset + k ir while < width
+    first_left = offset - inter_row
+    nb_left_plants = np.where(valid & (first_left >= 0) & (first_left < width), np.floor(offset / inter_row), 0)
+    first_right = offset + inter_row
+    nb_right_plants = np.where(valid & (first_right >= 0) & (first_right < width),
+                               np.ceil((width - offset) / inter_row) - 1, 0)
+
+    if max_rows is not None:
+        # Rows kept in pairs around the particular plant, the remaining row going to the left
+        budget = max(max_rows - 1, 0)
+        both = np.minimum(np.minimum(nb_left_plants, nb_right_plants), budget // 2)
+        left = both + np.minimum(nb_left_plants - both, budget - 2 * both)
+        nb_right_plants = both + np.minimum(nb_right_plants - both, budget - both - left)
+        nb_left_plants = left
+
+    return nb_left_plants.astype(np.int64), nb_right_plants.astype(np.int64)
+
+
+def get_row_indexes(nb_left_plants, nb_right_plants):
+    """
+    Returns the (N, R) relative indexes of the rows of each particle, in the order of Particle.get_bottom_plants (the
+    left rows from the nearest to the farthest, then the row of the particular plant and the right rows), and the
+    (N, R) boolean mask of the rows that exist. R is the largest number of rows of a particle, the indexes of the
+    missing rows are meaningless.
+
+    :param nb_left_plants: (N,) numbers of rows to the left of the particular plant.
+    :param nb_right_plants: (N,) numbers of rows to the right of the particular plant.
+    """
+    nb_left_plants = np.asarray(nb_left_plants).reshape(-1)
+    nb_rows = nb_left_plants + np.asarray(nb_right_plants).reshape(-1) + 1
+
+    columns = np.arange(np.max(nb_rows) if len(nb_rows) > 0 else 0)[np.newaxis, :]
+    nb_left_plants = nb_left_plants[:, np.newaxis]
+    row_indexes = np.where(columns < nb_left_plants, -(columns + 1), columns - nb_left_plants)
+
+    return row_indexes, columns < nb_rows[:, np.newaxis]
+
+
+def get_bottom_plants(states, row_indexes):
+    """
+    Returns the (N, R, 2) coordinates of the bottom plants of the given rows (see get_row_indexes): they are on the
+    horizontal line of the particular plant, an inter-row distance apart.
+    """
+    states = np.asarray(states).reshape(-1, 6)
+    x = states[:, 0, np.newaxis] + row_indexes * states[:, 3, np.newaxis]
+    y = np.broadcast_to(states[:, 1, np.newaxis], x.shape)
+
+    return np.stack((x, y), axis=-1)
+
+
+def get_particular_top_crossing_points(states):
+    """
+    Returns the (N, 2) crossing points between the row of the particular plant and the top of the image.
+    """
+    states = np.asarray(states).reshape(-1, 6)
+    x = states[:, 0] + np.tan(states[:, 4]) * states[:, 1]
+
+    return np.column_stack((x, np.zeros_like(x)))
+
+
+def get_top_crossing_points(states, row_indexes):
+    """
+    Returns the (N, R, 2) crossing points between the given rows and the top of the image. As in
+    Particle.get_all_top_crossing_points, the inter-row distance at the top of the image is truncated to an integer,
+    and so are the crossing points of the rows to the right of the particular plant.
+    """
+    states = np.asarray(states).reshape(-1, 6)
+    ir_at_top = np.trunc(states[:, 5] * states[:, 3])
+
+    x = get_particular_top_crossing_points(states)[:, 0, np.newaxis] + row_indexes * ir_at_top[:, np.newaxis]
+    x = np.where(row_indexes > 0, np.trunc(x), x)
+
+    return np.stack((x, np.zeros_like(x)), axis=-1)
+
+
+def get_vanishing_points(states):
+    """
+    Closed-form vanishing points of the particles. Row k goes from (offset + k ir, position) at the bottom to
+    (offset + tan(skew) position + k ir_top, 0) at the top, where ir_top is the inter-row at the top of the image, so
+    the horizontal distance between two rows is proportional to ir + (ir_top - ir) (position - y) / position. Every
+    row crosses the row of the particular plant where it is 0, at the height y = -position ir_top / (ir - ir_top).
+
+    The rows of a particle are parallel when ir_top = ir (convergence close to 1), their vanishing point is then
+    replaced by the point of the row of the particular plant at the height -PARALLEL_ROWS_DISTANCE. Particles whose
+    rows are not defined (non-positive inter-row or position, non-finite parameters) get the same fallback.
+
+    :param states: (N, 6) array of states.
+    :return: (N, 2) vanishing points and (N,) boolean mask of the particles that got the fallback.
+    """
+    states = np.asarray(states, dtype=np.float64).reshape(-1, 6)
+    offset, position, inter_row, skew = states[:, 0], states[:, 1], states[:, 3], states[:, 4]
+    ir_at_top = np.trunc(states[:, 5] * inter_row)
+
+    degenerate = ~np.all(np.isfinite(states), axis=1) | (inter_row <= 0) | (position <= 0) \
+        | (np.abs(inter_row - ir_at_top) <= 1e-9 * np.maximum(inter_row, 1))
+
+    # Height of the vanishing point, the row of the particular plant at height y is at x = offset + tan(skew)
+    # (position - y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        y = np.where(degenerate, -PARALLEL_ROWS_DISTANCE, -position * ir_at_top / (inter_row - ir_at_top))
+
+    vanishing_points = np.column_stack((offset + np.tan(skew) * (position - y), y))
+
+    return vanishing_points, degenerate
+
+
+def get_inter_plant_distances(states, ys, vanishing_points, height):
+    """
+    Returns the inter-plant distances at the heights ys, of shape (N,) or (N, K), given the (N, 2) vanishing points of
+    the particles. See Particle.get_inter_plant_distance.
+    """
+    states = np.asarray(states).reshape(-1, 6)
+    ys = np.asarray(ys)
+    expand = (slice(None),) + (np.newaxis,) * (ys.ndim - 1)
+    vanishing_point_y = vanishing_points[:, 1][expand]
+
+    return states[:, 2][expand] * (vanishing_point_y - ys) / (vanishing_point_y - height)
+
+
+def get_row_plants(bottom_plants, vanishing_points, bottom_ips, width, height, min_ip=4, max_plants=64,
+                   coordinate_dtype=np.int64):
+    """
+    Enumerates the plants of many rows, possibly of different particles, at once, with the same steps as
+    Particle.iter_row_plants: the next plant is a fraction t = ip / d of the way from the current plant to the
+    vanishing point, and the coordinates are truncated at each step. Every row takes its steps at the same time, the
+    rows that are done are dropped.
+
+    :param bottom_plants: (R, 2) coordinates of the bottom plant of each row.
+    :param vanishing_points: (R, 2) vanishing point of the particle of each row.
+    :param bottom_ips: (R,) inter-plant distance at the bottom of the image of the particle of each row.
+    :param width: Width of the image, the plants outside of it are not returned.
+    :param height: Height of the image.
+    :param min_ip: Minimal inter-plant distance, see Particle.iter_row_plants.
+    :param max_plants: Maximal number of plants per row, the nearest ones are kept.
+    :return: (R, max_plants, 2) coordinates of the plants of each row (bottom plant excluded) and the (R,) numbers of
+    plants of each row.
+    """
+    current = np.asarray(bottom_plants, dtype=np.float64).reshape(-1, 2)
+    vanishing_points = np.asarray(vanishing_points, dtype=np.float64).reshape(-1, 2)
+    bottom_ips = np.asarray(bottom_ips, dtype=np.float64).reshape(-1)
+
+    plants = np.zeros((len(current), max_plants, 2), coordinate_dtype)
+    counts = np.zeros(len(current), np.int32)
+    rows = np.arange(len(current))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        while len(rows) > 0:
+            vp = vanishing_points[rows]
+            d = np.linalg.norm(vp - current, axis=1)
+            ip = bottom_ips[rows] * (vp[:, 1] - current[:, 1]) / (vp[:, 1] - height)
+            t = ip / d
+
+            # The plants go up the rows, a row is done once it leaves the top of the image
+            walking = (t >= 0) & (t <= 1) & (ip >= min_ip) & (counts[rows] < max_plants) & (current[:, 1] >= 0)
+            rows, current, vp, t = rows[walking], current[walking], vp[walking], t[walking]
+
+            current = np.trunc((1 - t)[:, np.newaxis] * current + t[:, np.newaxis] * vp)
+            inside = (current[:, 0] >= 0) & (current[:, 0] < width) & (current[:, 1] >= 0) & (current[:, 1] < height)
+            plants[rows[inside], counts[rows[inside]]] = current[inside]
+            counts[rows[inside]] += 1
+
+    return plants, counts
@@ -0,0 +1,196 @@
+import numpy as np
+
+from .geometry import DEFAULT_MAX_ROWS, get_bottom_plant_counts, get_bottom_plants, get_inter_plant_distances, \
+    get_row_indexes, get_vanishing_points
+
+# Minimal inter-plant distance of the enumerated plants, the farther plants are closer to each other
+DEFAULT_MIN_IP = 4
+
+
+def get_lattice_rows(states, width, height, max_rows=DEFAULT_MAX_ROWS):
+    """
+    Returns the rows of the lattices of an (N, 6) array of states, computed for all the states at once: for each state
+    the (R, 2) bottom plants, the index of the row of the particular plant, the vanishing point (None when there are
+    less than two rows), the inter-plant distance at the bottom plants and the (R,) ratios q of the rows.
+    """
+    states = np.asarray(states, dtype=np.float64).reshape(-1, 6)
+    nb_left_plants, nb_right_plants = get_bottom_plant_counts(states, width, height, max_rows)
+    row_indexes, _ = get_row_indexes(nb_left_plants, nb_right_plants)
+    bottom_plants = get_bottom_plants(states, row_indexes)
+    nb_rows = nb_left_plants + nb_right_plants + 1
+
+    # Closed-form vanishing points, or the far points standing for them when the rows are parallel
+    vanishing_points, _ = get_vanishing_points(states)
+
+    # Inter-plant distance at the bottom plants and ratio of each row
+    bottom_ips = get_inter_plant_distances(states, states[:, 1], vanishing_points, height)
+    distances = np.linalg.norm(vanishing_points[:, np.newaxis, :] - bottom_plants, axis=2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = bottom_ips[:, np.newaxis] / distances
+    ratios = np.where((t >= 0) & (t <= 1), 1 - t, np.nan)
+
+    return [(bottom_plants[i, :nb_rows[i]], int(nb_left_plants[i]),
+             vanishing_points[i] if nb_rows[i] >= 2 else None, bottom_ips[i], ratios[i, :nb_rows[i]])
+            for i in range(len(states))]
+
+
+class PlantLattice:
+    """
+    Parametric form of the plants of a particle. In Particle.get_row_plants, each step towards the vanishing point
+    moves a fraction t = ip / d of the remaining distance, and t is constant along a row. Plant k of row r is
+    therefore VP + (B_r - VP) * q_r^k, where B_r is the bottom plant of the row and q_r = 1 - t_r.
+
+    The rows are derived from the state in closed form (see get_lattice_rows), and the coordinates of the plants are
+    only computed when materialize is called, for the plants inside the requested region.
+
+    The lattice is computed with float_dtype and the coordinates of the plants are returned as coordinate_dtype (see
+    core.precision).
+    """
+
+    def __init__(self, world, offset, position, inter_plant, inter_row, skew, convergence, min_ip=DEFAULT_MIN_IP,
+                 float_dtype=np.float64, coordinate_dtype=np.int64, max_rows=DEFAULT_MAX_ROWS, rows=None):
+        """
+        :param rows: Rows of the state returned by get_lattice_rows, computed if None.
+        """
+        self.world = world
+        self.min_ip = min_ip
+        self.float_dtype = float_dtype
+        self.coordinate_dtype = coordinate_dtype
+        self.max_rows = max_rows
+
+        state = [offset, position, inter_plant, inter_row, skew, convergence]
+        if rows is None:
+            self.set_state(state)
+        else:
+            self.set_rows(state, *rows)
+
+    @staticmethod
+    def from_state(world, state, min_ip=DEFAULT_MIN_IP, float_dtype=np.float64, coordinate_dtype=np.int64,
+                   max_rows=DEFAULT_MAX_ROWS):
+        return PlantLattice(world, state[0], state[1], state[2], state[3], state[4], state[5], min_ip, float_dtype,
+                            coordinate_dtype, max_rows)
+
+    @staticmethod
+    def from_states(world, states, min_ip=DEFAULT_MIN_IP, float_dtype=np.float64, coordinate_dtype=np.int64,
+                    max_rows=DEFAULT_MAX_ROWS):
+        """
+        Returns the lattices of an (N, 6) array of states, their rows being computed for all the states at once.
+        """
+        return [PlantLattice(world, state[0], state[1], state[2], state[3], state[4], state[5], min_ip, float_dtype,
+                             coordinate_dtype, max_rows, rows)
+                for state, rows in zip(states, get_lattice_rows(states, world.width, world.height, max_rows))]
+
+    @staticmethod
+    def set_states(lattices, states):
+        """
+        Sets the states of lattices of the same world and maximal number of rows, see set_state.
+        """
+        if len(lattices) == 0:
+            return
+
+        world = lattices[0].world
+        for lattice, state, rows in zip(lattices, states,
+                                        get_lattice_rows(states, world.width, world.height, lattices[0].max_rows)):
+            lattice.set_rows(state, *rows)
+
+    def set_state(self, state):
+        """
+        Derives the rows of the lattice from a state: the lattice is then the one from_state builds for it.
+        """
+        self.set_rows(state, *get_lattice_rows(state, self.world.width, self.world.height, self.max_rows)[0])
+
+    def set_rows(self, state, bottom_plants, particular_row, vanishing_point, bottom_ip, ratios):
+        """
+        Sets the state of the lattice and its rows computed by get_lattice_rows. The arrays are replaced, not
+        modified, so that the copies of a lattice (see copy.copy) stay valid.
+        """
+        self.state = np.array(state, dtype=np.float64).reshape(6)
+        self.bottom_plants = bottom_plants.astype(self.float_dtype)
+        self.particular_row = particular_row
+
+        # Rows can only be described when the vanishing point exists.
+        self.vanishing_point = None
+        self.ratios = np.zeros(0, self.float_dtype)
+        self.bottom_ip = 0
+        if vanishing_point is None:
+            return
+
+        self.vanishing_point = vanishing_point.astype(self.float_dtype)
+        self.bottom_ip = float(bottom_ip)
+        self.ratios = ratios.astype(self.float_dtype)
+
+    def translate(self, distance):
+        """
+        Moves the particular plant by distance along its row, in pixels (positive towards the bottom of the image), as
+        the motion model of the particle filters does without noise. The vanishing point and the bottom plants of a
+        state depend on its position, so the rows are derived again from the moved state (see set_state).
+        """
+        offset, position, inter_plant, inter_row, skew, convergence = self.state
+        self.set_state([offset - distance * np.sin(skew), position + distance * np.cos(skew), inter_plant, inter_row,
+                        skew, convergence])
+
+    def get_row_plant_range(self, row, y_min, y_max, min_ip):
+        """
+        Returns the first and last (excluded) indexes k of the plants of a row which are between y_min and y_max and
+        whose inter-plant distance is at least min_ip. Index 0 is the bottom plant.
+        """
+        q = self.ratios[row]
+        if self.vanishing_point is None or not 0 < q < 1:
+            return 0, 0
+
+        # Height of plant k above the vanishing point: (y_bottom - vp_y) * q^k
+        height_above_vp = self.bottom_plants[row][1] - self.vanishing_point[1]
+        if height_above_vp <= 0:
+            return 0, 0
+
+        log_q = np.log(q)
+        k_min = 0
+        if y_max - self.vanishing_point[1] < height_above_vp:
+            k_min = max(0, int(np.floor(np.log((y_max - self.vanishing_point[1]) / height_above_vp) / log_q)) + 1)
+
+        # Plant k exists while the inter-plant distance of plant k - 1 is larger than min_ip (see get_row_plants)
+        k_max = int(np.floor(np.log(min_ip / self.bottom_ip) / log_q)) + 2 \
+            if self.bottom_ip >= min_ip else 1
+        if y_min - self.vanishing_point[1] > 0:
+            k_max = min(k_max, int(np.floor(np.log((y_min - self.vanishing_point[1]) / height_above_vp) / log_q)) + 1)
+
+        return k_min, max(k_min, k_max)
+
+    def materialize(self, roi=None, min_scale=0, row_budget=None):
+        """
+        Returns the (K, 2) coordinate_dtype coordinates of the plants of the lattice that are inside the image.
+
+        :param roi: Region of interest (x_min, y_min, x_max, y_max), only the plants inside it are returned.
+        :param min_scale: Minimal apparent size of a plant relative to the bottom plants (ratio of their inter-plant
+        distances), the smaller far plants are not returned.
+        :param row_budget: Maximal number of plants returned per row, the nearest ones are kept.
+        """
+        if roi is None:
+            roi = (0, 0, self.world.width, self.world.height)
+        x_min, y_min, x_max, y_max = roi
+        min_ip = max(self.min_ip, min_scale * self.bottom_ip)
+
+        if self.vanishing_point is None:
+            return self.bottom_plants.astype(self.coordinate_dtype)
+
+        plants = []
+        for row in range(len(self.bottom_plants)):
+            k_min, k_max = self.get_row_plant_range(row, y_min, y_max, min_ip)
+            if row_budget is not None:
+                k_max = min(k_max, k_min + row_budget)
+            if k_max <= k_min:
+                continue
+
+            scales = np.power(self.ratios[row], np.arange(k_min, k_max, dtype=self.float_dtype))
+            plants.append(self.vanishing_point[np.newaxis, :]
+                          + (self.bottom_plants[row] - self.vanishing_point)[np.newaxis, :] * scales[:, np.newaxis])
+
+        if len(plants) == 0:
+            return np.zeros((0, 2), self.coordinate_dtype)
+
+        # The plants are culled before the cast, far plants could overflow a small coordinate dtype.
+        plants = np.trunc(np.concatenate(plants))
+        inside = (plants[:, 0] >= max(0, x_min)) & (plants[:, 0] < min(self.world.width, x_max)) \
+            & (plants[:, 1] >= max(0, y_min)) & (plants[:, 1] < min(self.world.height, y_max))
+
+        return plants[inside].astype(self.coordinate_dtype)
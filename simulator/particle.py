@@ -1,17 +1,30 @@
 import numpy as np
 
+from .geometry import DEFAULT_MAX_ROWS, PARALLEL_ROWS_DISTANCE, get_bottom_plant_counts
+
 
 class Particle:
-    def __init__(self, world, offset, position, inter_plant, inter_row, skew, convergence):
+    # Particles are built for every state at every frame, slots make them smaller and faster to create. The
+    # vectorized functions of simulator.geometry avoid building them at all.
+    __slots__ = ('offset', 'position', 'ir_at_bottom', 'ip_at_bottom', 'convergence', 'skew', 'world', 'max_rows')
+
+    def __init__(self, world, offset, position, inter_plant, inter_row, skew, convergence, validate=True,
+                 max_rows=DEFAULT_MAX_ROWS):
+        """
+        :param validate: Whether to warn when the particular plant is outside the image. The particle filters don't
+        validate the particles they build to score their states.
+        :param max_rows: Maximal number of rows of the particle, the rows nearest to the particular plant are kept.
+        """
         self.offset = offset
         self.position = position
         self.ir_at_bottom = inter_row
         self.ip_at_bottom = inter_plant
         self.convergence = convergence
         self.skew = skew
+        self.max_rows = max_rows
 
         self.world = world
-        if not (self.world.are_coordinates_valid(self.offset, self.position)):
+        if validate and not (self.world.are_coordinates_valid(self.offset, self.position)):
             print("Warning: particle's offset and/or position has "
                   "an invalid value : ({}, {}).".format(int(self.offset), int(self.position)))
 
@@ -22,33 +35,20 @@ class Particle:
         plants present to its right.
         The first nb_lefts_plants-1 coordinates of the returned list correspond to those of the left plants and the
         remaining correspond to the coordinates of the right plants
+        The numbers of neighbours are computed analytically (see simulator.geometry.get_bottom_plant_counts) and
+        limited by max_rows, so that a tiny inter-row distance doesn't make the particle slow.
         """
-        # List of coordinates to be returned
-        horizontal_neighbors = []
-
         # Number of left and right neighbors
-        nb_left_neighbours = 0
-        nb_right_neighbours = 0
+        nb_left_plants, nb_right_plants = get_bottom_plant_counts(
+            [self.offset, self.position, self.ip_at_bottom, self.ir_at_bottom, self.skew, self.convergence],
+            self.world.width, self.world.height, self.max_rows)
+        nb_left_neighbours = int(nb_left_plants[0])
+        nb_right_neighbours = int(nb_right_plants[0])
 
-        # Appending the left neighbors of the particular plant
-        leftOffset = self.offset - self.ir_at_bottom
-        while self.world.are_coordinates_valid(leftOffset, self.position):
-            center = np.asarray([leftOffset, self.position])
-            horizontal_neighbors.append(center)
-            nb_left_neighbours += 1
-            leftOffset -= self.ir_at_bottom
-
-        # Appending the particular plant
-        center = np.asarray([self.offset, self.position])
-        horizontal_neighbors.append(center)
-
-        # Appending right neighbors of the particular plant
-        rightOffset = self.offset + self.ir_at_bottom
-        while self.world.are_coordinates_valid(rightOffset, self.position):
-            center = np.asarray([rightOffset, self.position])
-            horizontal_neighbors.append(center)
-            nb_right_neighbours += 1
-            rightOffset += self.ir_at_bottom
+        # Left neighbors from the nearest to the farthest, the particular plant, then the right neighbors
+        steps = np.concatenate((-np.arange(1, nb_left_neighbours + 1), np.arange(nb_right_neighbours + 1)))
+        xs = self.offset + steps * self.ir_at_bottom
+        horizontal_neighbors = list(np.column_stack((xs, np.full(len(xs), self.position))))
 
         return horizontal_neighbors, nb_left_neighbours, nb_right_neighbours
 
@@ -111,46 +111,38 @@ class Particle:
         """
         Takes as input the coordinates of the plants located at the bottom of the image and their associated top
         crossing points.
-        Returns the vanishing point : the point where rows are converging in the image perspective.
+        Returns the vanishing point : the point where rows are converging in the image perspective. When every pair
+        of adjacent rows is parallel, the point of the first row at the height -PARALLEL_ROWS_DISTANCE is returned
+        instead (see simulator.geometry.get_vanishing_points for the vectorized closed form).
         """
-        # The index of the plants used to get the vanishing point.
-        i = 0
-
         # We loop until we find a valid vanishing point or until we have tried to find the vanishing point using every
         # adjacent rows.
-        while i < len(top_crossing_points) and i < len(bottom_plants):
-
-            # Points referring to a first row
-            bottom_plant1 = bottom_plants[i]
-            top_crossing_point1 = top_crossing_points[i]
-
-            # Points referring to a second row
-            bottom_plant2 = bottom_plants[i+1]
-            top_crossing_point2 = top_crossing_points[i+1]
-
-            # Finding the coefficient a1 and b1 of the first row line equation a1*x + b1 = y
-            a1 = (bottom_plant1[1] - top_crossing_point1[1]) / (bottom_plant1[0] - top_crossing_point1[0])
-            b1 = bottom_plant1[1] - a1 * bottom_plant1[0]
-
-            # Finding the coefficient a2 and b2 of the second row line equation a2*x + b2 = y
-            a2 = (bottom_plant2[1] - top_crossing_point2[1]) / (bottom_plant2[0] - top_crossing_point2[0])
-            b2 = bottom_plant2[1] - a2 * bottom_plant2[0]
-
-            # Finding the coordinates of the vanishing point
-            if a1 - a2 == 0:
-                vanishing_point_x = (b2 - b1)
-            else:
-                vanishing_point_x = (b2 - b1) / (a1 - a2)
-            vanishing_point_y = a1 * vanishing_point_x + b1
-
-            # Checking if the coordinates we got are not infinite.
-            if (not np.isinf(vanishing_point_x)) and (not np.isinf(vanishing_point_y)):
-                vanishing_point = np.asarray([vanishing_point_x, vanishing_point_y])
+        for i in range(min(len(bottom_plants), len(top_crossing_points)) - 1):
+            # Points and direction (from the bottom to the top of the image) of a first row
+            bottom_plant1 = np.asarray(bottom_plants[i], dtype=np.float64)
+            direction1 = np.asarray(top_crossing_points[i], dtype=np.float64) - bottom_plant1
+
+            # Points and direction of a second row
+            bottom_plant2 = np.asarray(bottom_plants[i + 1], dtype=np.float64)
+            direction2 = np.asarray(top_crossing_points[i + 1], dtype=np.float64) - bottom_plant2
+
+            # Intersection bottom_plant1 + u * direction1 of the two rows, there is none when they are parallel.
+            cross = direction1[0] * direction2[1] - direction1[1] * direction2[0]
+            if abs(cross) <= 1e-9 * np.linalg.norm(direction1) * np.linalg.norm(direction2):
+                continue
+
+            delta = bottom_plant2 - bottom_plant1
+            u = (delta[0] * direction2[1] - delta[1] * direction2[0]) / cross
+            vanishing_point = bottom_plant1 + u * direction1
+
+            # Checking if the coordinates we got are finite.
+            if np.all(np.isfinite(vanishing_point)):
                 return vanishing_point
 
-        # If we couldn't find the vanishing point.
-        print("Error: couldn't find the vanishing point.")
-        return False, (-1, -1)
+        # The rows are parallel: a point far up the row of the particular plant stands for the vanishing point.
+        print("Warning: couldn't find the vanishing point, the rows are parallel.")
+        return np.asarray([self.offset + np.tan(self.skew) * (self.position + PARALLEL_ROWS_DISTANCE),
+                           -PARALLEL_ROWS_DISTANCE], dtype=np.float64)
 
     def get_inter_plant_distance(self, y, vanishing_point):
         """
@@ -163,14 +155,30 @@ class Particle:
 
         return ip
 
-    def get_row_plants(self, bottom_plant, vanishing_point):
+    def get_row_plants(self, bottom_plant, vanishing_point, min_ip=4):
         """
         Returns the coordinates of all the plants located in a row and that are within the image. To do so,
         the algorithm starts at the bottom plant and adds a plant on the line using the inter-plant distance,
         then starts again using this plant as starting point. It ends when we are at the end of the image.
         """
-        # List of plants located in the row
-        row_plants = []
+        return list(self.iter_row_plants(bottom_plant, vanishing_point, min_ip))
+
+    def iter_row_plants(self, bottom_plant, vanishing_point, min_ip=4, min_scale=0, roi=None, budget=None):
+        """
+        Generator version of get_row_plants: yields the plants of a row from the nearest to the farthest, so that
+        the caller can stop early, and stops walking the row as soon as no other plant can be yielded.
+
+        :param min_ip: Minimal inter-plant distance, the far plants that are closer to each other are not enumerated.
+        :param min_scale: Minimal apparent size of a plant relative to the bottom plant (ratio of their inter-plant
+        distances), the smaller far plants are not enumerated.
+        :param roi: Region of interest (x_min, y_min, x_max, y_max), only the plants inside it are yielded.
+        :param budget: Maximal number of plants yielded.
+        """
+        if budget is not None and budget <= 0:
+            return
+
+        if roi is None:
+            roi = (0, 0, self.world.width, self.world.height)
 
         # Distance between the bottom plant of the row and the vanishing point
         d = np.sqrt(np.square(vanishing_point[0] - bottom_plant[0])
@@ -180,12 +188,13 @@ class Particle:
         ip = self.get_inter_plant_distance(bottom_plant[1], vanishing_point)
         t = ip / d
 
-        # Coordinates of the current plant (in other word while loop variable)
-        current_plant = bottom_plant
-
         # If the inter-plant becomes too small then it means we are very close to the top of the image, so we define the
         # minimal inter-plant distance at which we draw the plants.
-        min_ip = 4
+        min_ip = max(min_ip, min_scale * ip)
+
+        # Coordinates of the current plant (in other word while loop variable)
+        current_plant = bottom_plant
+        nb_plants = 0
 
         # If 0 < t or t > 1 then it means that the next plant we want to add is outside the image.
         while 0 <= t <= 1 and ip >= min_ip:
@@ -194,16 +203,21 @@ class Particle:
             next_plant_y = (1 - t) * current_plant[1] + t * vanishing_point[1]
             next_plant = np.asarray([int(next_plant_x), int(next_plant_y)])
 
-            # Appending the next plant
-            if self.world.are_coordinates_valid(next_plant[0], next_plant[1]):
-                row_plants.append(next_plant)
+            # The plants are going up, the next ones can't be in the region of interest anymore.
+            if next_plant[1] < roi[1]:
+                return
+
+            # Yielding the next plant
+            if self.world.are_coordinates_valid(next_plant[0], next_plant[1]) \
+                    and roi[0] <= next_plant[0] < roi[2] and next_plant[1] < roi[3]:
+                yield next_plant
+                nb_plants += 1
+                if budget is not None and nb_plants >= budget:
+                    return
 
             current_plant = next_plant
 
             # Computing the new value of t
-            # print("Current plant : {}".format(current_plant))
-            # print("Vanishing point : {}".format(vanishing_point))
-            # print("t : {}".format(t))
             d = np.sqrt(np.square(vanishing_point[0] - current_plant[0])
                         + np.square(vanishing_point[1] - current_plant[1]))
 
@@ -211,8 +225,6 @@ class Particle:
             ip = self.get_inter_plant_distance(current_plant[1], vanishing_point)
             t = ip / d
 
-        return row_plants
-
     def get_row_plants2(self, bottom_plant, vanishing_point):
         """
         Other way of finding all the plants of a row, but it doesn't work as it.
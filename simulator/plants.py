@@ -1,14 +1,17 @@
 import numpy as np
-import cv2 as cv
 
 
-# Weeds needs to be added
+# Weeds are added on the rendered frame, see FrameCorruption
 class Plants:
-    def __init__(self, world, vp_height, vp_width, ir, ip, o, nb_rows, nb_plant_types):
+    def __init__(self, world, vp_height, vp_width, ir, ip, o, nb_rows, nb_plant_types, random_state=None):
         # Initialize plants positions
         # World contains the width and height of the image
         self.world = world
 
+        # Random generator of the generation, the motion and the measurement (numpy.random.RandomState), the global one
+        # of NumPy if None
+        self.random = np.random if random_state is None else random_state
+
         # Parameters to generate image and to be tracked
         # As we directly give the coordinates of the vanishing point, we don't need the parameters skew or convergence.
         self.inter_row_distance = ir
@@ -30,10 +33,18 @@ class Plants:
         self.nb_plant_types = nb_plant_types
         self.max_number_plants_per_row = np.ceil(vp_distance / self.inter_plant_distance)
 
-        # List containing positions of all the plants
-        self.plant_positions = []
-        self.plants_rows = []
-        self.plant_types = []
+        # x coordinate of each row at the bottom of the image. Every row is the line going from this point to the
+        # vanishing point.
+        self.row_bottoms = np.arange(self.nb_rows) * self.inter_row_distance + self.offset
+
+        # Flat arrays describing all the plants: the vertical position of each plant along its row, the index of its
+        # row and its type.
+        self.plant_positions = np.zeros(0, np.float64)
+        self.plant_rows = np.zeros(0, np.int64)
+        self.plant_types = np.zeros(0, np.int64)
+
+        # Size factor of each plant, the drawn radius is this factor times the perspective radius.
+        self.plant_sizes = np.zeros(0, np.float64)
 
         # Initialize standard deviation noise for plants motion
         self.std_move_distance = 0
@@ -41,54 +52,100 @@ class Plants:
         # Initialize standard deviation noise for plants position measurement
         self.std_meas_position = 0
 
+        # Initialize generation noise: every candidate plant is present, on its exact position and with the same size
+        self.min_plant_ratio = 1.0
+        self.std_plant_position = 0
+        self.std_plant_size = 0
+
     def setStandardDeviations(self, std_move_distance, std_meas_position):
         self.std_move_distance = std_move_distance
         self.std_meas_position = std_meas_position
 
+    def setGenerationNoise(self, min_plant_ratio, std_plant_position, std_plant_size):
+        """
+        Sets the noise applied when generating the plants.
+
+        :param min_plant_ratio: Each row keeps between this ratio and 100% of the maximum number of plants per row,
+        the other plants are missing.
+        :param std_plant_position: Standard deviation of the Gaussian noise added to each plant position.
+        :param std_plant_size: Standard deviation of the Gaussian noise around 1 of each plant size factor.
+        """
+        self.min_plant_ratio = min_plant_ratio
+        self.std_plant_position = std_plant_position
+        self.std_plant_size = std_plant_size
+
+    def get_row_coordinates(self, rows, positions):
+        """
+        Returns the (K, 2) integer image coordinates of the plants located at the given vertical positions of the
+        given rows. The x coordinate is obtained analytically from the line joining the bottom of the row to the
+        vanishing point.
+        """
+        rows = np.asarray(rows)
+        positions = np.asarray(positions, dtype=np.float64)
+
+        # Fraction of the way from the bottom of the image to the vanishing point
+        t = (self.world.height - positions) / (self.world.height - self.vp_height)
+
+        x0 = self.row_bottoms[rows]
+        x = x0 + t * (self.vanishing_point[0] - x0)
+
+        return np.stack((np.rint(x), np.rint(positions)), axis=-1).astype(np.int64)
+
     def generate_plants(self):
-        for i in range(self.nb_rows):
-            # Empty image
-            img = np.zeros((self.world.height, self.world.width), np.uint8)
-
-            # Get position of lines crossing in the vanishing point
-            cv.line(img, (i * self.inter_row_distance + self.offset, self.world.height), self.vanishing_point,
-                    255, 1)
-            coordinates = np.where(img != 0)
-            row_coordinates = np.array(list(zip(coordinates[1], coordinates[0])))
-            self.plants_rows.append(row_coordinates)
-
-            # Generate initial positions of the plants for a row
-            # number of plants in the row : between 70% and 100% of the maximum number of plants per row
-            nb_plants = np.random.randint(np.floor(0.70 * self.max_number_plants_per_row),
-                                          self.max_number_plants_per_row)
-            nb_plants = int(self.max_number_plants_per_row)
-            # random positions for each plant
-            random_selection = np.random.choice(np.arange(self.vp_height, self.world.height, self.inter_plant_distance),
-                                                nb_plants, replace=False)
-            # add of a little noise
-            for j in range(len(random_selection)):
-                selection = random_selection[j]
-                # Gaussian centered around the original coordinates
-                random_selection[j] = np.random.normal(selection, 11, 1)
-                random_selection[j] = selection
-
-            self.plant_positions.append(random_selection)
-
-            # Mapping a type for each plant
-            plant_markers = np.random.choice(self.nb_plant_types, nb_plants)
-            self.plant_types.append(plant_markers)
-
-        # Find highest plant across all rows
-        # self.highest_plant = np.min(sum([list(sublist) for sublist in self.initial_plant_positions], []))
+        # Candidate positions of the plants, the same for every row
+        candidate_positions = np.arange(self.vp_height, self.world.height, self.inter_plant_distance)
+
+        # Generate initial positions of the plants for every row
+        # number of plants in each row : between min_plant_ratio and 100% of the maximum number of plants per row
+        max_nb_plants = min(int(self.max_number_plants_per_row), len(candidate_positions))
+        min_nb_plants = min(int(np.floor(self.min_plant_ratio * max_nb_plants)), max_nb_plants)
+        nb_plants = self.random.randint(min_nb_plants, max_nb_plants + 1, self.nb_rows)
+
+        # random positions for each plant, drawn without replacement independently in each row: the candidates are
+        # shuffled in each row and the first nb_plants of each row are kept.
+        order = np.argsort(self.random.random((self.nb_rows, len(candidate_positions))), axis=1)
+        kept = np.arange(len(candidate_positions))[np.newaxis, :] < nb_plants[:, np.newaxis]
+
+        self.plant_positions = candidate_positions[order][kept].astype(np.float64)
+        self.plant_rows = np.repeat(np.arange(self.nb_rows), nb_plants)
+
+        # add of a little noise, Gaussian centered around the original positions
+        if self.std_plant_position > 0:
+            self.plant_positions += self.random.normal(0, self.std_plant_position, len(self.plant_positions))
+
+        # Size of each plant
+        self.plant_sizes = np.ones(len(self.plant_positions), np.float64)
+        if self.std_plant_size > 0:
+            self.plant_sizes = np.clip(self.random.normal(1, self.std_plant_size, len(self.plant_positions)), 0.2, None)
+
+        # Mapping a type for each plant
+        self.plant_types = self.random.choice(self.nb_plant_types, len(self.plant_positions))
 
     def move(self, desired_move_distance):
         # Compute relative motion (true motion is desired motion with some noise)
-        move_distance = np.random.normal(loc=desired_move_distance, scale=self.std_move_distance, size=1)[0]
+        move_distance = self.random.normal(loc=desired_move_distance, scale=self.std_move_distance, size=1)[0]
 
         # Move every plants
-        for row_idx in range(self.nb_rows):
-            for i in range(len(self.plant_positions[row_idx])):
-                self.plant_positions[row_idx][i] += move_distance
+        self.plant_positions += move_distance
+
+    def get_visible_mask(self):
+        """
+        Returns a boolean mask of the plants that are between the top and the bottom of the image.
+        """
+        return (self.plant_positions >= 0) & (self.plant_positions <= self.world.height - 1)
+
+    def get_tracked_plant_height(self):
+        """
+        Returns the true height of the tracked plant, -1 if there is no visible plant in the middle row.
+        """
+        # Visible plants of the middle row
+        middle_row = np.floor(self.nb_rows / 2)
+        visible_plants_positions = self.plant_positions[self.get_visible_mask() & (self.plant_rows == middle_row)]
+
+        if len(visible_plants_positions) == 0:
+            return -1
+
+        return np.max(visible_plants_positions)
 
     def measure(self):
         """
@@ -96,27 +153,35 @@ class Plants:
         The tracked plant being the plant of the middle row that is the closest to the bottom of the image
         """
 
-        tracked_plant_height = -1
-
-        for row_idx in range(self.nb_rows):
-            # If we are in the middle row
-            if row_idx == np.floor(self.nb_rows / 2):
-                current_plants_positions = np.asarray(self.plant_positions[row_idx])
-                last_point_of_row = self.plants_rows[row_idx][-1][1]
-                visible_plants_positions = current_plants_positions[
-                    (current_plants_positions >= 0) & (current_plants_positions <= last_point_of_row)]
-
-                try:
-                    tracked_plant_height = np.max(visible_plants_positions)
-                except:
-                    print("The last plant to track has gone")
+        tracked_plant_height = self.get_tracked_plant_height()
+        if tracked_plant_height == -1:
+            print("The last plant to track has gone")
 
         # Adding noise for the measurement
-        tracked_plant_height_with_noise = np.random.normal(loc=tracked_plant_height,
+        tracked_plant_height_with_noise = self.random.normal(loc=tracked_plant_height,
                                                            scale=self.std_meas_position, size=1)[0]
 
         return tracked_plant_height_with_noise
 
+    def getAllPlantsToDraw(self, return_sizes=False):
+        """
+        Returns the coordinates, the types and the row indexes of every plant that is within the image.
+        Used by the visualizer.
+
+        :param return_sizes: Whether to also return the size factor of each plant.
+        :returns (array (K, 2) of coordinates, array (K,) of types, array (K,) of row indexes[, array (K,) of sizes]):
+        """
+        visible = self.get_visible_mask()
+        coordinates = self.get_row_coordinates(self.plant_rows[visible], self.plant_positions[visible])
+
+        inside = (coordinates[:, 0] >= 0) & (coordinates[:, 0] < self.world.width)
+
+        if return_sizes:
+            return coordinates[inside], self.plant_types[visible][inside], self.plant_rows[visible][inside], \
+                self.plant_sizes[visible][inside]
+
+        return coordinates[inside], self.plant_types[visible][inside], self.plant_rows[visible][inside]
+
     def getPlantsToDraw(self, row_idx):
         """
         Returns a list containing the positions and a list containing the type of the plants to draw given a row index.
@@ -130,13 +195,6 @@ class Plants:
             print("Error the row index is incorrect")
             return -1
 
-        current_plants_positions = np.asarray(self.plant_positions[row_idx])
-        last_point_of_row = self.plants_rows[row_idx][-1][1]
-        visible_plants_positions = current_plants_positions[
-            (current_plants_positions >= 0) & (current_plants_positions <= last_point_of_row)]
-
-        plant_positions = self.plants_rows[row_idx][visible_plants_positions]
-        plant_types = self.plant_types[row_idx][
-            (current_plants_positions >= 0) & (current_plants_positions <= last_point_of_row)]
+        coordinates, types, rows = self.getAllPlantsToDraw()
 
-        return plant_positions, plant_types
+        return coordinates[rows == row_idx], types[rows == row_idx]
@@ -1,40 +1,98 @@
 import numpy as np
-import cv2 as cv
 
-from .particle import Particle
+from .geometry import get_bottom_plant_counts, get_bottom_plants, get_row_indexes, get_row_plants, \
+    get_vanishing_points
+
+
+def get_disk_sprite(radius):
+    """
+    Returns the (dy, dx) offsets of the pixels of a filled disk of the given radius, centered on (0, 0).
+    """
+    r = np.arange(-radius, radius + 1)
+    dy, dx = np.meshgrid(r, r, indexing='ij')
+    inside = dy * dy + dx * dx <= radius * radius
+
+    return dy[inside], dx[inside]
 
 
 # Visualizer draws plants and particles
 class Visualizer:
-    def __init__(self, world):
+    def __init__(self, world, corruption=None):
         self.world = world
         self.img = np.zeros((world.height, world.width, 3), np.uint8)
 
+        # Optional FrameCorruption applied to the plants image before the particles are drawn.
+        self.corruption = corruption
+
+        # Disk sprites are computed once per radius and then reused for every frame.
+        self.disk_sprites = {}
+
+    def get_disk_sprite(self, radius):
+        if radius not in self.disk_sprites:
+            self.disk_sprites[radius] = get_disk_sprite(radius)
+        return self.disk_sprites[radius]
+
+    def get_disks_pixels(self, centers, radii):
+        """
+        Returns the (y, x) coordinates of all the pixels covered by the disks of the given centers (K, 2) and radii
+        (K,), clipped to the image. Disks sharing a radius are stamped together using their precomputed sprite.
+        """
+        centers = np.asarray(centers, dtype=np.int64).reshape(-1, 2)
+        radii = np.asarray(radii, dtype=np.int64).reshape(-1)
+
+        ys = []
+        xs = []
+        for radius in np.unique(radii):
+            dy, dx = self.get_disk_sprite(int(radius))
+            selected = centers[radii == radius]
+
+            # Every pixel of every disk of this radius, shape (K, sprite size).
+            y = (selected[:, 1, np.newaxis] + dy[np.newaxis, :]).ravel()
+            x = (selected[:, 0, np.newaxis] + dx[np.newaxis, :]).ravel()
+
+            valid = (x >= 0) & (x < self.world.width) & (y >= 0) & (y < self.world.height)
+            ys.append(y[valid])
+            xs.append(x[valid])
+
+        if len(ys) == 0:
+            return np.zeros(0, np.int64), np.zeros(0, np.int64)
+
+        return np.concatenate(ys), np.concatenate(xs)
+
+    def draw_disks(self, centers, radii, color):
+        """
+        Draws filled disks of the given centers and radii with a single indexed assignment.
+        """
+        ys, xs = self.get_disks_pixels(centers, radii)
+        self.img[ys, xs] = color
+
     def draw_plants(self, plants):
         # Green color for plants
         color = (0, 255, 0)
 
-        # For each row
-        for row_idx in range(plants.nb_rows):
-            plant_positions, plant_types = plants.getPlantsToDraw(row_idx)
-            # Draw
-            for i, center in enumerate(plant_positions):
-                if self.world.are_coordinates_valid(center[0], center[1]):
-                    perspective_coef = center[1] / self.world.height
-                    cv.circle(self.img, center, int(20 * perspective_coef), color, -1)
-                    # if plant_types[i] == 0:
-                    #     cv.circle(self.img, center, int(20 * perspective_coef), color, -1)
-                    # elif plant_types[i] == 1:
-                    #     cv.drawMarker(self.img, center, color, markerType=cv.MARKER_CROSS,
-                    #                   markerSize=int(50 * perspective_coef), thickness=5)
-                    # elif plant_types[i] == 2:
-                    #     cv.drawMarker(self.img, center, color, markerType=cv.MARKER_TILTED_CROSS,
-                    #                   markerSize=int(50 * perspective_coef), thickness=5)
-                    # else:
-                    #     cv.drawMarker(self.img, center, color, markerType=cv.MARKER_STAR,
-                    #                   markerSize=int(50 * perspective_coef), thickness=5)
+        # Gathering the visible plants of every row
+        centers, plant_types, plant_rows, plant_sizes = plants.getAllPlantsToDraw(return_sizes=True)
+
+        # The plants are bigger when they are close to the bottom of the image.
+        perspective_coef = centers[:, 1] / self.world.height
+        self.draw_disks(centers, (20 * perspective_coef * plant_sizes).astype(np.int64), color)
+        # Plant types used to be drawn with different markers:
+        # if plant_types[i] == 0:
+        #     cv.circle(self.img, center, int(20 * perspective_coef), color, -1)
+        # elif plant_types[i] == 1:
+        #     cv.drawMarker(self.img, center, color, markerType=cv.MARKER_CROSS,
+        #                   markerSize=int(50 * perspective_coef), thickness=5)
+        # elif plant_types[i] == 2:
+        #     cv.drawMarker(self.img, center, color, markerType=cv.MARKER_TILTED_CROSS,
+        #                   markerSize=int(50 * perspective_coef), thickness=5)
+        # else:
+        #     cv.drawMarker(self.img, center, color, markerType=cv.MARKER_STAR,
+        #                   markerSize=int(50 * perspective_coef), thickness=5)
 
     def draw_particles(self, particles, n):
+        # OpenCV is only imported when it is used, the rest of the simulator only needs NumPy.
+        import cv2 as cv
+
         for i in range(n):
             # Coordinates of the particle0
             center = np.asarray([int(self.world.width / 2), int(particles[i][1][0])])
@@ -54,35 +112,94 @@ class Visualizer:
 
             # We consider now binary images
             color = (255, 255, 255)
+
             cv.drawMarker(self.img, center, color, markerType=cv.MARKER_DIAMOND,
                           markerSize=int((7 * thickness) * perspective_coef), thickness=thickness)
 
-    def draw_complete_particle(self, particle):
+    def draw_complete_particle(self, particle, color=(255, 0, 0), radius=6):
 
         # Getting the coordinates of every plant to draw
         plants = particle.get_all_plants_2()
-        
+
         if plants == -1:
             print("Visualizer: Can not draw the particle0")
             return
-        
-        # Drawing every plant
-        for center in plants:
-            # Drawing parameters
-            color = (255, 0, 0)
-            radius = 6
-        
-            try:
-                cv.circle(self.img, (int(center[0]), int(center[1])), radius, color, -1)
-            except:
-                print("Problematic center : {}".format(center))
-
-        # Drawing parameters
-        # color = (255, 0, 0)
-        # radius = 6
-        #
-        # center = np.asarray([particle.offset, particle.position])
-        # cv.circle(self.img, (int(center[0]), int(center[1])), radius, color, -1)
+
+        if len(plants) == 0:
+            return
+
+        # Drawing every plant at once
+        centers = np.asarray(plants).astype(np.int64)
+        self.draw_disks(centers, np.full(len(centers), radius), color)
+
+    def get_particles_plants(self, states, max_plants=64):
+        """
+        Returns the plants of many particles at once, the same plants as Particle.get_all_plants_2 (bottom plants, then
+        the plants of every row when the particle has at least two rows), and the index of the particle of each plant.
+
+        :param states: (N, 6) array of states.
+        :param max_plants: Number of plants per row enumerated at first, doubled while a row reaches it.
+        :return: (K, 2) int64 coordinates of the plants and (K,) indexes of their particles.
+        """
+        states = np.asarray(states, dtype=np.float64).reshape(-1, 6)
+        nb_left_plants, nb_right_plants = get_bottom_plant_counts(states, self.world.width, self.world.height)
+        row_indexes, rows = get_row_indexes(nb_left_plants, nb_right_plants)
+        bottom_plants = get_bottom_plants(states, row_indexes)[rows]
+        bottom_particles = np.nonzero(rows)[0]
+
+        # The rows are only walked when the vanishing point can be computed, from two rows at least
+        vanishing_points, _ = get_vanishing_points(states)
+        walked = (nb_left_plants + nb_right_plants)[bottom_particles] > 0
+        row_particles = bottom_particles[walked]
+        while True:
+            row_plants, counts = get_row_plants(bottom_plants[walked], vanishing_points[row_particles],
+                                                states[row_particles, 2], self.world.width, self.world.height,
+                                                max_plants=max_plants)
+            if len(counts) == 0 or np.max(counts) < max_plants:
+                break
+            max_plants *= 2
+
+        plants = row_plants[np.arange(max_plants)[np.newaxis, :] < counts[:, np.newaxis]]
+        plant_particles = np.repeat(row_particles, counts)
+
+        return np.concatenate((bottom_plants.astype(np.int64), plants)), \
+            np.concatenate((bottom_particles, plant_particles))
+
+    def draw_particles_density(self, states, weights, radius=6, alpha=0.6):
+        """
+        Draws a weight-heat overlay of the plants of all the particles: each expected plant adds the weight of its
+        particle to the pixels of its disk, the result is normalized, colored and blended over the image.
+
+        :param states: (N, 6) array of states, see ParticleFilter.get_states.
+        :param weights: (N,) array of weights.
+        :param radius: Radius of the disk stamped for each expected plant.
+        :param alpha: Opacity of the overlay.
+        """
+        centers, particle_indexes = self.get_particles_plants(states)
+        if len(centers) == 0:
+            return
+        weights = np.asarray(weights, dtype=np.float64)[particle_indexes]
+
+        # Splatting the weights in the image, all the plants share the same sprite.
+        dy, dx = self.get_disk_sprite(radius)
+        y = (centers[:, 1, np.newaxis] + dy[np.newaxis, :]).ravel()
+        x = (centers[:, 0, np.newaxis] + dx[np.newaxis, :]).ravel()
+        w = np.repeat(weights, len(dy))
+        valid = (x >= 0) & (x < self.world.width) & (y >= 0) & (y < self.world.height)
+
+        heat = np.bincount(y[valid] * self.world.width + x[valid], weights=w[valid],
+                           minlength=self.world.height * self.world.width)
+        heat = heat.reshape(self.world.height, self.world.width)
+
+        max_heat = heat.max()
+        if max_heat <= 0:
+            return
+
+        # Coloring and blending only the pixels where there is some heat
+        import cv2 as cv
+        heat_img = cv.applyColorMap((255 * heat / max_heat).astype(np.uint8), cv.COLORMAP_JET)
+        mask = heat > 0
+        self.img[mask] = ((1 - alpha) * self.img[mask] + alpha * heat_img[mask]).astype(np.uint8)
 
     def draw(self, plants, particles, n_particles):
         # Empty image
@@ -91,6 +208,10 @@ class Visualizer:
         # Draw plants and particles
         self.draw_plants(plants)
 
+        # Weeds and noise of the simulated measurement
+        if self.corruption is not None:
+            self.corruption.apply(self.img)
+
         # # Draw lines to help debugging
         # cv.line(self.img, (0, 200), (499, 200), (255, 255, 255))
         # cv.line(self.img, (0, 400), (499, 400), (255, 255, 255))
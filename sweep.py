@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+import argparse
+import concurrent.futures
+import contextlib
+import csv
+import itertools
+import json
+import os
+import time
+
+import numpy as np
+
+from simulator.dataset import DatasetBuilder, Scenario, SyntheticDataset
+from simulator.geometry import get_vanishing_points
+
+from core.configuration import Configuration, create_particle_filter, initialize_particles, \
+    read_configuration_file
+
+
+def get_grid_configurations(parameters):
+    """
+    Returns every combination of the values of the swept parameters.
+
+    :param parameters: Dictionary of the swept settings (dotted names, such as 'filter.number_of_particles'), each
+    one with the list of its values.
+    """
+    names = sorted(parameters)
+    return [dict(zip(names, values)) for values in itertools.product(*[parameters[name] for name in names])]
+
+
+def get_random_configurations(parameters, n_samples, seed=0):
+    """
+    Returns n_samples random combinations of the swept parameters.
+
+    :param parameters: Dictionary of the swept settings (dotted names). A list of values is sampled uniformly, a dictionary
+    {"min": a, "max": b} is sampled uniformly in [a, b] (log-uniformly with "log": true, rounded with
+    "integer": true).
+    :param n_samples: Number of configurations.
+    :param seed: Seed of the sampling, the same seed gives the same configurations.
+    """
+    rng = np.random.default_rng(seed)
+    configurations = []
+    for _ in range(n_samples):
+        configuration = {}
+        for name in sorted(parameters):
+            values = parameters[name]
+            if isinstance(values, dict):
+                if values.get('log', False):
+                    value = float(np.exp(rng.uniform(np.log(values['min']), np.log(values['max']))))
+                else:
+                    value = float(rng.uniform(values['min'], values['max']))
+                configuration[name] = int(round(value)) if values.get('integer', False) else value
+            else:
+                configuration[name] = values[rng.integers(len(values))]
+        configurations.append(configuration)
+
+    return configurations
+
+
+def get_errors(state, ground_truth, width, height, nb_rows):
+    """
+    Errors of an estimated state against the ground truth of a frame: distance between the vanishing points, distance
+    from the estimated particular plant to the nearest true row (at its height), and error of the inter-row distance
+    at that height.
+    """
+    vanishing_point, _ = get_vanishing_points(state)
+    true_vanishing_point = np.asarray([ground_truth['vp_width'], ground_truth['vp_height']])
+    vanishing_point_error = np.linalg.norm(vanishing_point[0] - true_vanishing_point)
+
+    # True rows at the height of the particular plant, see Plants.get_row_coordinates
+    t = (height - state[1]) / (height - true_vanishing_point[1])
+    row_bottoms = np.arange(nb_rows) * ground_truth['inter_row'] + ground_truth['offset']
+    row_xs = row_bottoms + t * (true_vanishing_point[0] - row_bottoms)
+    row_error = np.min(np.abs(row_xs - state[0]))
+    inter_row_error = abs(state[3] - (1 - t) * ground_truth['inter_row'])
+
+    return vanishing_point_error, row_error, inter_row_error
+
+
+def run_configuration(configuration, dataset_path, seed, convergence_threshold=20):
+    """
+    Runs a filter configuration over a dataset, headless, and returns its accuracy, convergence time and latency.
+    Runs in the worker processes of the sweep.
+
+    :param configuration: Dictionary of the sections of the configuration (see core.configuration).
+    :param dataset_path: Path of a dataset written by DatasetBuilder.
+    :param seed: Seed of the filter, the same seed gives the same run.
+    :param convergence_threshold: Vanishing point error (in pixels) under which the filter is converged.
+    """
+    dataset = SyntheticDataset(dataset_path)
+    scenario = dataset.scenario
+    configuration = Configuration.from_parameters(configuration)
+    configuration.world.width = scenario.width
+    configuration.world.height = scenario.height
+    configuration.world.move_distance = scenario.move_distance
+    plant_size = configuration.measurement.plant_size
+    area_size = configuration.measurement.area_size
+
+    np.random.seed(seed)
+    errors = []
+    latencies = []
+
+    # The filters report every step on the standard output.
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        particle_filter = create_particle_filter(configuration)
+        for i, (frame, ground_truth) in enumerate(dataset.iter_frames()):
+            if i == 0:
+                initialize_particles(particle_filter, configuration, frame)
+
+            start = time.perf_counter()
+            particle_filter.update(scenario.move_distance, frame, plant_size, area_size)
+            latencies.append(time.perf_counter() - start)
+
+            errors.append(get_errors(np.asarray(particle_filter.get_average_state()), ground_truth, scenario.width,
+                                     scenario.height, scenario.nb_rows))
+
+    errors = np.asarray(errors)
+    latencies = np.asarray(latencies)
+
+    # Converged from the first frame after which the vanishing point error stays under the threshold
+    above = np.nonzero(errors[:, 0] >= convergence_threshold)[0]
+    convergence_frame = 0 if len(above) == 0 else above[-1] + 1
+
+    # Accuracy on the second half of the frames
+    steady = errors[len(errors) // 2:]
+
+    return {
+        'vanishing_point_error': float(np.mean(steady[:, 0])),
+        'row_error': float(np.mean(steady[:, 1])),
+        'inter_row_error': float(np.mean(steady[:, 2])),
+        'convergence_frame': int(convergence_frame),
+        'converged': bool(convergence_frame < len(errors)),
+        'latency_ms': 1000 * float(np.mean(latencies)),
+        'latency_p95_ms': 1000 * float(np.percentile(latencies, 95)),
+    }
+
+
+class SweepRunner:
+    """
+    Runs every configuration of a sweep over every scene in a process pool and aggregates the results of each
+    configuration over the scenes.
+
+    The scenes are datasets: the simulated scenarios are rendered once by DatasetBuilder (and reused from its cache
+    by later sweeps), and recorded datasets are given by their path. Each run is seeded from the seed of the sweep and
+    the indexes of its configuration and scene, so that a sweep is reproducible and two configurations are compared on
+    the same frames with the same random draws.
+    """
+
+    def __init__(self, configurations, scenarios=(), dataset_paths=(), cache_dir="datasets", seed=0,
+                 max_workers=None, convergence_threshold=20, base_configuration=None):
+        """
+        :param configurations: List of dictionaries of the swept settings, by dotted name. They are validated when the
+        sweep is created.
+        :param scenarios: Simulated Scenarios.
+        :param dataset_paths: Paths of already written datasets.
+        :param cache_dir: Directory of the rendered scenarios.
+        :param seed: Seed of the sweep.
+        :param max_workers: Number of processes, the number of CPUs by default.
+        :param convergence_threshold: Vanishing point error (in pixels) under which a filter is converged.
+        :param base_configuration: Configuration of the settings that are not swept, the default one if None. Its
+        world size is replaced by the one of each scene.
+        """
+        if base_configuration is None:
+            base_configuration = Configuration()
+        self.configurations = configurations
+        self.complete_configurations = [base_configuration.with_overrides(parameters).get_parameters()
+                                        for parameters in configurations]
+        self.scenarios = list(scenarios)
+        self.dataset_paths = list(dataset_paths)
+        self.cache_dir = cache_dir
+        self.seed = seed
+        self.max_workers = max_workers
+        self.convergence_threshold = convergence_threshold
+
+    @staticmethod
+    def from_spec(spec):
+        """
+        Creates a sweep from a specification dictionary (see the example in the __main__ block):
+        mode ("grid" or "random"), parameters, n_samples (random mode), scenarios (lists of Scenario parameters),
+        datasets (paths), cache_dir, seed, max_workers, convergence_threshold and base (path of the configuration
+        of the settings that are not swept).
+        """
+        seed = spec.get('seed', 0)
+        if spec.get('mode', 'grid') == 'random':
+            configurations = get_random_configurations(spec['parameters'], spec['n_samples'], seed)
+        else:
+            configurations = get_grid_configurations(spec['parameters'])
+
+        scenarios = [Scenario.from_parameters(parameters) for parameters in spec.get('scenarios', [])]
+
+        base_configuration = None
+        if spec.get('base') is not None:
+            base_configuration = Configuration.from_parameters(read_configuration_file(spec['base']))
+
+        return SweepRunner(configurations, scenarios, spec.get('datasets', []), spec.get('cache_dir', "datasets"),
+                           seed, spec.get('max_workers'), spec.get('convergence_threshold', 20), base_configuration)
+
+    def get_dataset_paths(self):
+        """
+        Renders the scenarios that are not in the cache yet and returns the paths of every scene.
+        """
+        builder = DatasetBuilder(self.cache_dir)
+        return [builder.build(scenario).path for scenario in self.scenarios] + self.dataset_paths
+
+    def run(self):
+        """
+        Runs the sweep and returns one row per configuration: its swept parameters and its results averaged over the
+        scenes (the convergence rate being the fraction of scenes where the filter converged).
+        """
+        dataset_paths = self.get_dataset_paths()
+        if len(dataset_paths) == 0:
+            print("Sweep: no scene to run the configurations on.")
+            return []
+
+        with concurrent.futures.ProcessPoolExecutor(self.max_workers) as executor:
+            futures = {}
+            for c, configuration in enumerate(self.complete_configurations):
+                for s, dataset_path in enumerate(dataset_paths):
+                    seed = self.seed * 1000003 + c * len(dataset_paths) + s
+                    future = executor.submit(run_configuration, configuration, dataset_path, seed,
+                                             self.convergence_threshold)
+                    futures[future] = c
+
+            results = [[] for _ in self.configurations]
+            for future in concurrent.futures.as_completed(futures):
+                results[futures[future]].append(future.result())
+
+        rows = []
+        for parameters, configuration_results in zip(self.configurations, results):
+            row = dict(parameters)
+            for key in configuration_results[0]:
+                row[key] = float(np.mean([result[key] for result in configuration_results]))
+            row['convergence_rate'] = row.pop('converged')
+            rows.append(row)
+
+        return rows
+
+
+def print_table(rows):
+    """
+    Prints the rows of a sweep as an aligned table.
+    """
+    if len(rows) == 0:
+        return
+
+    columns = list(rows[0])
+    cells = [[column for column in columns]]
+    for row in rows:
+        cells.append(["{:.3g}".format(row[column]) if isinstance(row[column], float) else str(row[column])
+                      for column in columns])
+
+    widths = [max(len(line[i]) for line in cells) for i in range(len(columns))]
+    for line in cells:
+        print("  ".join(cell.rjust(width) for cell, width in zip(line, widths)))
+
+
+def write_csv(rows, path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    # Example of specification, used when no file is given:
+    # python sweep.py spec.json --output results.csv
+    example_spec = {
+        'mode': 'grid',
+        'parameters': {
+            'filter.number_of_particles': [20, 40],
+            'measurement.area_size': [4, 8],
+        },
+        'scenarios': [{'n_frames': 20, 'seed': 0}, {'n_frames': 20, 'seed': 1, 'std_meas_position': 3}],
+        'seed': 0,
+    }
+
+    parser = argparse.ArgumentParser(description="Parameter sweep of the particle filters.")
+    parser.add_argument('spec', nargs='?', help="JSON specification of the sweep")
+    parser.add_argument('--output', help="CSV file of the results")
+    arguments = parser.parse_args()
+
+    spec = example_spec
+    if arguments.spec is not None:
+        with open(arguments.spec) as f:
+            spec = json.load(f)
+
+    rows = SweepRunner.from_spec(spec).run()
+    print_table(rows)
+    if arguments.output is not None and len(rows) > 0:
+        write_csv(rows, arguments.output)
@@ -0,0 +1,214 @@
+import asyncio
+import contextlib
+import io
+import time
+
+import pytest
+
+from core.streaming import AsyncParticleFilter
+
+
+class FailingFilter:
+    """
+    Particle filter whose update fails from the given frame on.
+    """
+
+    def __init__(self, nb_updates):
+        self.nb_updates = nb_updates
+
+    def update(self, motion_move_distance, measurement, plant_size, area_size):
+        if self.nb_updates == 0:
+            raise ValueError("update failed")
+        self.nb_updates -= 1
+
+    def get_average_state(self):
+        return [0.0] * 6
+
+    def get_max_weight(self):
+        return 1.0
+
+
+class SlowFilter:
+    """
+    Particle filter whose update takes delay seconds, it records the move distances it was updated with.
+    """
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.move_distances = []
+
+    def update(self, motion_move_distance, measurement, plant_size, area_size):
+        time.sleep(self.delay)
+        self.move_distances.append(motion_move_distance)
+
+    def get_average_state(self):
+        return [float(len(self.move_distances))] + [0.0] * 5
+
+    def get_max_weight(self):
+        return 1.0
+
+
+async def wait_for_update_start(stream):
+    # The worker takes the waiting frame when its update starts
+    while stream.get_queue_depth()[0] > 0:
+        await asyncio.sleep(0.001)
+
+
+async def read_estimates(stream):
+    return [estimate async for estimate in stream]
+
+
+def run(coroutine):
+    # The worker reports the failed update on the standard output
+    with contextlib.redirect_stdout(io.StringIO()):
+        return asyncio.run(asyncio.wait_for(coroutine, 5))
+
+
+@pytest.mark.parametrize('coalesce', [True, False])
+def test_failed_update_is_raised_by_submit(coalesce):
+    async def main():
+        stream = AsyncParticleFilter(FailingFilter(0), 6, 14, coalesce=coalesce)
+        await stream.start()
+        await stream.submit(0, 1)
+        await asyncio.wait([stream.worker])
+        with pytest.raises(ValueError):
+            await stream.submit(1, 1)
+        await stream.close()
+
+    run(main())
+
+
+def test_failed_update_wakes_up_waiting_submit():
+    async def main():
+        stream = AsyncParticleFilter(FailingFilter(0), 6, 14, coalesce=False)
+        await stream.start()
+        # The third frame waits for the second one, which is never filtered
+        with pytest.raises(ValueError):
+            for frame in range(3):
+                await stream.submit(frame, 1)
+        await stream.close()
+
+    run(main())
+
+
+def test_failed_update_is_raised_by_iterator():
+    async def main():
+        stream = AsyncParticleFilter(FailingFilter(2), 6, 14, coalesce=False)
+        await stream.start()
+        frame_ids = []
+        with pytest.raises(ValueError):
+            for frame in range(2):
+                await stream.submit(frame, 1)
+            # The third frame fails, it may be submitted before or after the failure
+            with contextlib.suppress(ValueError):
+                await stream.submit(2, 1)
+            async for estimate in stream:
+                frame_ids.append(estimate.frame_id)
+        await stream.close()
+
+        # The estimates computed before the failure are read first
+        assert frame_ids == [0, 1]
+
+    run(main())
+
+
+def test_lagging_filter_coalesces_frames():
+    async def main():
+        particle_filter = SlowFilter(0.1)
+        stream = AsyncParticleFilter(particle_filter, 6, 14)
+        await stream.start()
+        await stream.submit(0, 1)
+        await wait_for_update_start(stream)
+
+        # Frames 1 and 2 are replaced by frame 3 while frame 0 is filtered
+        for frame in range(1, 4):
+            await stream.submit(frame, 1)
+        assert stream.get_queue_depth() == (1, 0)
+        await stream.close()
+        estimates = await read_estimates(stream)
+
+        assert [estimate.frame_id for estimate in estimates] == [0, 3]
+        assert [estimate.nb_coalesced for estimate in estimates] == [0, 2]
+        assert particle_filter.move_distances == [1, 3]
+        metrics = stream.get_metrics()
+        assert (metrics['submitted'], metrics['updated'], metrics['coalesced']) == (4, 2, 2)
+
+    run(main())
+
+
+def test_submit_waits_without_coalescing():
+    async def main():
+        particle_filter = SlowFilter(0.1)
+        stream = AsyncParticleFilter(particle_filter, 6, 14, coalesce=False)
+        await stream.start()
+        await stream.submit(0, 1)
+        await wait_for_update_start(stream)
+        await stream.submit(1, 1)
+
+        # Frame 1 waits for its update, frame 2 waits until frame 1 is taken
+        submission = asyncio.get_running_loop().create_task(stream.submit(2, 2))
+        await asyncio.sleep(0.02)
+        assert not submission.done()
+        assert stream.get_queue_depth() == (1, 0)
+
+        await submission
+        await stream.close()
+        estimates = await read_estimates(stream)
+
+        assert [estimate.frame_id for estimate in estimates] == [0, 1, 2]
+        assert [estimate.nb_coalesced for estimate in estimates] == [0, 0, 0]
+        assert particle_filter.move_distances == [1, 1, 2]
+        assert stream.get_metrics()['coalesced'] == 0
+
+    run(main())
+
+
+def test_metrics():
+    async def main():
+        stream = AsyncParticleFilter(SlowFilter(0.01), 6, 14, coalesce=False)
+        await stream.start()
+        for frame in range(5):
+            await stream.submit(frame, 1)
+        await stream.close()
+        assert stream.get_queue_depth() == (0, 5)
+
+        metrics = stream.get_metrics()
+        assert (metrics['submitted'], metrics['updated'], metrics['dropped_estimates']) == (5, 5, 0)
+        assert (metrics['pending_frames'], metrics['pending_estimates']) == (0, 5)
+        assert 10 <= metrics['compute_mean_ms'] <= metrics['compute_max_ms']
+        assert metrics['compute_mean_ms'] <= metrics['latency_mean_ms'] <= metrics['latency_max_ms']
+
+        await read_estimates(stream)
+        assert stream.get_queue_depth() == (0, 0)
+
+    run(main())
+
+
+def test_submit_after_close_raises():
+    async def main():
+        stream = AsyncParticleFilter(SlowFilter(0), 6, 14)
+        await stream.start()
+        await stream.close()
+        with pytest.raises(RuntimeError):
+            await stream.submit(0, 1)
+
+    run(main())
+
+
+def test_close_wakes_up_waiting_submit():
+    async def main():
+        stream = AsyncParticleFilter(SlowFilter(0.1), 6, 14, coalesce=False)
+        await stream.start()
+        await stream.submit(0, 1)
+        await wait_for_update_start(stream)
+        await stream.submit(1, 1)
+        submission = asyncio.get_running_loop().create_task(stream.submit(2, 1))
+        await asyncio.sleep(0)
+
+        # Frame 1 is still filtered, frame 2 is refused
+        await stream.close()
+        with pytest.raises(RuntimeError):
+            await submission
+        assert [estimate.frame_id for estimate in await read_estimates(stream)] == [0, 1]
+
+    run(main())
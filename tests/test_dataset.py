@@ -0,0 +1,27 @@
+import contextlib
+import io
+
+import numpy as np
+
+from simulator.dataset import DatasetBuilder, Scenario
+
+
+def test_build_keeps_global_random_state(tmp_path):
+    np.random.seed(0)
+    expected = np.random.random(3)
+
+    np.random.seed(0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        DatasetBuilder(str(tmp_path)).build(Scenario(n_frames=3, std_move_distance=1))
+
+    np.testing.assert_array_equal(np.random.random(3), expected)
+
+
+def test_ground_truth_tracks_rendered_plant(tmp_path):
+    with contextlib.redirect_stdout(io.StringIO()):
+        dataset = DatasetBuilder(str(tmp_path)).build(Scenario(n_frames=10, seed=1, std_move_distance=1))
+
+    for i in range(len(dataset)):
+        ground_truth = dataset.ground_truth[i]
+        assert ground_truth['tracked_plant_y'] == np.rint(ground_truth['tracked_plant_height'])
+        assert dataset.get_mask(i)[int(ground_truth['tracked_plant_y']), int(ground_truth['tracked_plant_x'])]
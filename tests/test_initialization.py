@@ -0,0 +1,46 @@
+import contextlib
+import io
+
+import numpy as np
+import pytest
+
+from core.configuration import FILTER_TYPES, Configuration, create_particle_filter, create_world, initialize_particles
+from simulator import Plants, Visualizer
+
+MOVE_DISTANCE = 11
+
+
+@pytest.fixture(scope='module')
+def frames():
+    np.random.seed(0)
+    world = create_world(Configuration())
+    plants = Plants(world, -100, 310, 160, 110, o=0, nb_rows=4, nb_plant_types=4)
+    plants.generate_plants()
+    visualizer = Visualizer(world)
+
+    frames = []
+    for _ in range(2):
+        plants.move(MOVE_DISTANCE)
+        visualizer.draw(plants, [], 0)
+        frames.append(visualizer.measure())
+
+    return world, frames
+
+
+@pytest.mark.parametrize('filter_type', FILTER_TYPES)
+def test_update_keeps_measurement_initialization(frames, filter_type):
+    world, measurements = frames
+    configuration = Configuration().with_overrides({'filter.type': filter_type,
+                                                    'filter.initialization': 'measurement',
+                                                    'filter.number_of_particles': 200})
+    np.random.seed(1)
+    particle_filter = create_particle_filter(configuration, world)
+
+    # The filters report every step on the standard output
+    with contextlib.redirect_stdout(io.StringIO()):
+        initialize_particles(particle_filter, configuration, measurements[0])
+        seeded_offset = particle_filter.get_average_state()[0]
+        particle_filter.update(MOVE_DISTANCE, measurements[1], configuration.measurement.plant_size,
+                               configuration.measurement.area_size)
+
+    assert abs(particle_filter.get_average_state()[0] - seeded_offset) < 20
@@ -0,0 +1,96 @@
+import contextlib
+import io
+
+import numpy as np
+import pytest
+
+from core.kernels import NUMBA_AVAILABLE, KernelBackends, score_bottom_windows, score_windows, search_sorted
+from core.measurement.measurement_models import compute_integral_image, get_plant_mask
+from core.particle_filters import ParticleFilterSIR
+from core.resampling.resampler import ResamplingAlgorithms
+from simulator import Plants, Visualizer, World
+
+BACKENDS = [KernelBackends.NUMPY,
+            pytest.param(KernelBackends.NUMBA,
+                         marks=pytest.mark.skipif(not NUMBA_AVAILABLE, reason="Numba is not installed"))]
+
+
+@pytest.fixture(scope='module')
+def scene():
+    """
+    Measurement of the simulator, its integral image and the filter and states of 300 uniform particles.
+    """
+    np.random.seed(0)
+    world = World(500, 700, 10)
+    plants = Plants(world, -100, 310, 160, 110, o=0, nb_rows=4, nb_plant_types=4)
+    plants.generate_plants()
+    visualizer = Visualizer(world)
+    visualizer.draw(plants, [], 0)
+    measurement = visualizer.measure()
+
+    limits = [world.width - 110, world.width + 110, world.height - 80, world.height, 90, 130, 151, 170,
+              -np.pi / 12, np.pi / 12, 0.1, 0.4]
+    particle_filter = ParticleFilterSIR(world, 300, limits, [0] * 6, [0.9, 0.01], ResamplingAlgorithms.STRATIFIED)
+    with contextlib.redirect_stdout(io.StringIO()):
+        particle_filter.initialize_particles_uniform()
+    states, _ = particle_filter.get_states()
+
+    return world, measurement, compute_integral_image(get_plant_mask(measurement)), particle_filter, states
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_score_windows_matches_compute_likelihood(scene, backend):
+    world, measurement, integral, particle_filter, states = scene
+    plants, plant_offsets = particle_filter.get_samples_bottom_plants(states)
+
+    likelihoods = score_windows(integral, np.floor(plants).astype(np.int64), plant_offsets, 6, 14, 0.9, 0.01,
+                                backend)
+
+    # The reference visits every pixel of every window, it is only run on a few particles
+    nb_reference = 10
+    with contextlib.redirect_stdout(io.StringIO()):
+        reference = np.asarray([particle_filter.compute_likelihood(state, measurement, 6, 14)
+                                for state in states[:nb_reference]])
+    np.testing.assert_allclose(likelihoods[:nb_reference], reference, rtol=1e-12)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_score_windows_writes_to_out(scene, backend):
+    world, measurement, integral, particle_filter, states = scene
+    plants, plant_offsets = particle_filter.get_samples_bottom_plants(states)
+    plants = np.floor(plants).astype(np.int64)
+
+    out = np.full(len(states), -1.0)
+    likelihoods = score_windows(integral, plants, plant_offsets, 6, 14, 0.9, 0.01, backend, out)
+
+    assert likelihoods is out
+    np.testing.assert_array_equal(out, score_windows(integral, plants, plant_offsets, 6, 14, 0.9, 0.01, backend))
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('max_rows', [64, 3, None])
+def test_score_bottom_windows_matches_score_windows(scene, backend, max_rows, monkeypatch):
+    world, measurement, integral, particle_filter, states = scene
+    monkeypatch.setattr(particle_filter, 'plant_max_rows', max_rows)
+    plants, plant_offsets = particle_filter.get_samples_bottom_plants(states)
+    expected = score_windows(integral, np.floor(plants).astype(np.int64), plant_offsets, 6, 14, 0.9, 0.01,
+                             KernelBackends.NUMPY)
+
+    likelihoods = score_bottom_windows(integral, states, world.width, world.height, max_rows, 6, 14, 0.9, 0.01,
+                                       backend)
+
+    np.testing.assert_array_equal(likelihoods, expected)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('right', [False, True])
+def test_search_sorted_matches_numpy(backend, right):
+    random_generator = np.random.default_rng(0)
+    cumulative = np.cumsum(random_generator.uniform(0, 1, 1000))
+    values = random_generator.uniform(0, cumulative[-1], 1000)
+    # Values equal to elements, where left and right differ
+    values[:10] = cumulative[:10]
+
+    indexes = search_sorted(cumulative, values, np.zeros(len(values), np.intp), right, backend)
+
+    np.testing.assert_array_equal(indexes, np.searchsorted(cumulative, values, side='right' if right else 'left'))
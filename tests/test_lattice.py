@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from simulator import World
+from simulator.lattice import PlantLattice
+
+STATES = [[500, 650, 110, 160, 0.1, 0.3],
+          [250, 600, 90, 140, -0.2, 0.5],
+          [100, 690, 120, 170, 0.05, 0.9]]
+
+
+@pytest.mark.parametrize('state', STATES)
+@pytest.mark.parametrize('distance', [11, -30])
+def test_translated_lattice_matches_propagated_state(state, distance):
+    world = World(500, 700, 10)
+    lattice = PlantLattice.from_state(world, state)
+
+    lattice.translate(distance)
+
+    # Motion model of the particle filters without noise
+    offset, position, inter_plant, inter_row, skew, convergence = state
+    propagated_state = [offset - distance * np.sin(skew), position + distance * np.cos(skew), inter_plant, inter_row,
+                        skew, convergence]
+    expected = PlantLattice.from_state(world, propagated_state)
+    np.testing.assert_array_equal(lattice.vanishing_point, expected.vanishing_point)
+    np.testing.assert_array_equal(lattice.bottom_plants, expected.bottom_plants)
+    np.testing.assert_array_equal(lattice.materialize(), expected.materialize())
+
+
+def test_set_states_matches_from_state():
+    world = World(500, 700, 10)
+    states = np.random.default_rng(0).uniform([0, 0, 20, 30, -np.pi / 8, 0.05], [500, 700, 200, 200, np.pi / 8, 1.0],
+                                              (100, 6))
+    lattices = PlantLattice.from_states(world, states[::-1])
+
+    PlantLattice.set_states(lattices, states)
+
+    for lattice, state in zip(lattices, states):
+        np.testing.assert_array_equal(lattice.materialize(), PlantLattice.from_state(world, state).materialize())
@@ -0,0 +1,91 @@
+import contextlib
+import io
+
+import numpy as np
+import pytest
+
+from core.configuration import Configuration, create_particle_filter, create_world, initialize_particles
+from core.diagnostics import MemoryProfiler, profile_updates
+from core.recording.particle_recorder import ParticleRecorder
+from simulator import Plants, Visualizer
+
+NB_FRAMES = 50
+WARMUP = 10
+MOVE_DISTANCE = 11
+
+
+# Allocation budget of a steady-state frame, the same for every number of particles: the plant mask and the integral
+# image are reused from one frame to the next, and the NumPy kernels score the particles by chunks.
+BUDGET = 512 * 1024
+
+
+@pytest.fixture(scope='module')
+def frames():
+    np.random.seed(0)
+    world = create_world(Configuration())
+    plants = Plants(world, -100, 310, 160, 110, o=0, nb_rows=4, nb_plant_types=4)
+    plants.generate_plants()
+    visualizer = Visualizer(world)
+
+    frames = []
+    for _ in range(NB_FRAMES):
+        plants.move(MOVE_DISTANCE)
+        visualizer.draw(plants, [], 0)
+        frames.append(visualizer.measure())
+
+    return world, frames
+
+
+def create_vectorized_filter(world, number_of_particles):
+    configuration = Configuration().with_overrides({'filter.type': 'ParticleFilterSIR',
+                                                    'filter.number_of_particles': number_of_particles,
+                                                    'performance.backend': 'vectorized'})
+    return configuration, create_particle_filter(configuration, world)
+
+
+@pytest.mark.parametrize('number_of_particles', [1000, 4000])
+def test_steady_state_allocations_within_budget(frames, number_of_particles):
+    world, measurements = frames
+    configuration, particle_filter = create_vectorized_filter(world, number_of_particles)
+
+    # The filters report every step on the standard output
+    with contextlib.redirect_stdout(io.StringIO()):
+        initialize_particles(particle_filter, configuration)
+        profiler = profile_updates(particle_filter, measurements, MOVE_DISTANCE, configuration.measurement.plant_size,
+                                   configuration.measurement.area_size)
+
+    within_budget, net_bytes, transient_bytes = profiler.check_budget(BUDGET, WARMUP)
+    assert within_budget, "{} particles: net {:.0f} B/frame, transient up to {} B/frame, budget {} B".format(
+        number_of_particles, net_bytes, transient_bytes, BUDGET)
+
+
+@pytest.mark.parametrize('number_of_particles', [1000, 4000])
+def test_main_loop_allocations_within_budget(frames, tmp_path, number_of_particles):
+    """
+    What the loop of main.py does with the particles after each update, without the drawing (whose temporaries are
+    as large as the image): the states and weights recorded and the estimates read. The updates are left out of the
+    profiled frames, they would free the particles read at the previous frame.
+    """
+    world, measurements = frames
+    configuration, particle_filter = create_vectorized_filter(world, number_of_particles)
+    recorder = ParticleRecorder(str(tmp_path / "recording"), initial_capacity=NB_FRAMES * number_of_particles)
+
+    # The filters report every step on the standard output
+    with contextlib.redirect_stdout(io.StringIO()):
+        initialize_particles(particle_filter, configuration)
+        with MemoryProfiler() as profiler:
+            for i, measurement in enumerate(measurements):
+                particle_filter.update(MOVE_DISTANCE, measurement, configuration.measurement.plant_size,
+                                       configuration.measurement.area_size)
+
+                profiler.start_frame()
+                particle_filter.get_max_weight()
+                states, weights = particle_filter.get_states()
+                recorder.record_arrays(states, weights, timestamp=i)
+                particle_filter.get_average_state()
+                profiler.end_frame()
+    recorder.close()
+
+    within_budget, net_bytes, transient_bytes = profiler.check_budget(BUDGET, WARMUP)
+    assert within_budget, "{} particles: net {:.0f} B/frame, transient up to {} B/frame, budget {} B".format(
+        number_of_particles, net_bytes, transient_bytes, BUDGET)
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from core.streaming import SharedFrameRing
+
+SHAPE = (4, 3, 3)
+
+
+@pytest.fixture
+def ring():
+    ring = SharedFrameRing.create(None, 4, SHAPE)
+    yield ring
+    ring.close()
+
+
+def write_frames(ring, frame_ids):
+    for frame_id in frame_ids:
+        assert ring.write(np.full(SHAPE, frame_id, np.uint8), 1, frame_id=frame_id)
+
+
+def test_read_latest_skips_older_frames(ring):
+    write_frames(ring, range(3))
+
+    frame = ring.read_latest(timeout=0)
+
+    assert frame.frame_id == 2
+    assert frame.move_distance == 3
+    assert ring.get_size() == 1
+    del frame
+    ring.release()
+    assert ring.get_size() == 0
+
+
+def test_read_latest_keeps_held_frames(ring):
+    write_frames(ring, range(2))
+    held = ring.read(timeout=0)
+    write_frames(ring, range(2, 4))
+
+    # The frames after the held one can't be released before it, they are read in order
+    frame = ring.read_latest(timeout=0)
+    assert frame.frame_id == 1
+    assert frame.move_distance == 1
+    assert ring.get_size() == 4
+
+    # The slot of the held frame is not written while it is read
+    assert not ring.write(np.full(SHAPE, 4, np.uint8), 1, frame_id=4)
+    assert held.frame_id == 0
+    assert np.all(held.measurement == 0)
+    assert np.all(frame.measurement == 1)
+
+    del held, frame
+    ring.release()
+    ring.release()
+    assert ring.get_size() == 2
+
+    # Nothing is held anymore, the older frames are skipped again
+    frame = ring.read_latest(timeout=0)
+    assert frame.frame_id == 3
+    assert frame.move_distance == 2
+    del frame
+    ring.release()
+    assert ring.get_size() == 0
@@ -0,0 +1,27 @@
+import contextlib
+import io
+
+import numpy as np
+
+from simulator import Visualizer, World
+from simulator.geometry import get_bottom_plant_counts
+from simulator.particle import Particle
+
+
+def test_particles_plants_match_particle():
+    world = World(500, 700, 10)
+    random_generator = np.random.default_rng(0)
+    states = random_generator.uniform([0, 0, 20, 30, -np.pi / 8, 0.05], [500, 700, 200, 200, np.pi / 8, 1.0],
+                                      (300, 6))
+    # Particle.get_vanishing_point intersects a right row, whose top crossing point is truncated, when there is no
+    # left row: the closed form of simulator.geometry is only the same with a left row
+    nb_left_plants, _ = get_bottom_plant_counts(states, world.width, world.height)
+    states = states[nb_left_plants > 0]
+
+    plants, particle_indexes = Visualizer(world).get_particles_plants(states, max_plants=4)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i, state in enumerate(states):
+            expected = np.asarray(Particle(world, *state, validate=False).get_all_plants_2(), dtype=np.float64)
+            expected = np.sort(expected.reshape(-1, 2).astype(np.int64).view('i8,i8'), axis=0)
+            np.testing.assert_array_equal(np.sort(plants[particle_indexes == i].view('i8,i8'), axis=0), expected)